@@ -1,110 +1,210 @@
 from collections import Counter
-from typing import List
+from datetime import datetime, timedelta, timezone
+import logging
+from typing import Dict, Iterable, List
 
-from loguru import logger
 from pydantic import BaseModel
-from sqlalchemy import delete, desc, func, insert, select
+from sqlalchemy import desc, func, insert, literal, select, text, union_all
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.sql.expression import update
 
-from app.api.models import CurrencyRate
-from app.api.schemas import BestRateResponse
+from app.api.models import CurrencyRate, best_currency_rates
+from app.api.schemas import (
+    AdminCurrencySchema,
+    BestRateResponse,
+    CurrencyRateSchema,
+    RawCurrencyRate,
+    SyncResult,
+    as_raw_rate
+)
 from app.config import settings
 from app.dao.base import BaseDAO
-from app.logger import log
+
+
+log = logging.getLogger(__name__)
 
 
 class CurrencyRateDAO(BaseDAO):
     model = CurrencyRate
 
+    # колонки, которые нужны ответам API: выбираются напрямую, без ORM-объектов
+    public_columns = tuple(getattr(CurrencyRate, name) for name in CurrencyRateSchema.model_fields)
+    admin_columns = tuple(getattr(CurrencyRate, name) for name in AdminCurrencySchema.model_fields)
+
+
+    @classmethod
+    def _fresh_filter(cls, max_age: int | None) -> list:
+        """Условие свежести курсов: обновлены не раньше max_age минут назад (банки без времени исключаются)."""
+        if max_age is None:
+            return []
+        return [cls.model.quoted_at >= datetime.now(timezone.utc) - timedelta(minutes=max_age)]
+
+    @classmethod
+    def _use_best_rates_view(cls, session: AsyncSession, max_age: int | None = None) -> bool:
+        """
+        Лучшие курсы читаются из материализованного представления best_currency_rates:
+        только в PostgreSQL и без фильтра свежести (он зависит от текущего времени).
+        """
+        return settings.BEST_RATES_VIEW and max_age is None and session.get_bind().dialect.name == "postgresql"
+
+    @classmethod
+    async def refresh_best_rates_view(cls, session: AsyncSession) -> None:
+        """Пересчитывает best_currency_rates после синхронизации, не блокируя чтения (CONCURRENTLY)."""
+        if cls._use_best_rates_view(session):
+            await session.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY best_currency_rates"))
+
     
     @classmethod
-    async def bulk_update_currency(cls, records: List[BaseModel], session: AsyncSession) -> int:
-        """Синхронизация валютных курсов (insert + update + delete) в бд"""
+    async def start_currency_sync(cls, session: AsyncSession) -> tuple[Dict[str, RawCurrencyRate], SyncResult]:
+        """Начало синхронизации: текущие данные банков из БД (bank_en -> кортеж колонок ответа API)."""
+        result = await session.execute(select(*cls.public_columns))
+        db_rows = {row.bank_en: RawCurrencyRate._make(row) for row in result}
+        log.debug("db_bank_ens = %s", set(db_rows))
+        return db_rows, SyncResult(known_banks=set(db_rows))
+
+    @classmethod
+    async def upsert_currency_batch(
+            cls,
+            session: AsyncSession,
+            records: Iterable[RawCurrencyRate],
+            db_rows: Dict[str, RawCurrencyRate],
+            sync_result: SyncResult,
+    ) -> None:
+        """
+        Добавляет новые и обновляет изменившиеся банки из пакета записей, неизменившиеся не трогает.
+        db_rows и sync_result обновляются, поэтому пакеты одной синхронизации можно записывать по мере парсинга.
+        """
+        new_rows = {}
+        changed_rows = {}
+        duplicates = []
+        for record in records:
+            bank_en = record.bank_en
+
+            if not bank_en:
+                log.warning("Пропуск записи: отсутствует bank_en. Данные: %s", record)
+                continue
+
+            if bank_en in sync_result.seen_banks:
+                duplicates.append(bank_en)
+            sync_result.seen_banks.add(bank_en)
+
+            # INSERT (добавляем новые)
+            if bank_en in new_rows or bank_en not in db_rows:
+                new_rows[bank_en] = record
+                continue
+
+            # UPDATE (обновляем существующие, только если данные изменились): сравнение кортежей без словарей
+            if record != db_rows[bank_en]:
+                changed_rows[bank_en] = record
+
+        if duplicates:
+            log.warning("Дублирующиеся банки: %s", Counter(duplicates))
+
+        if changed_rows:
+            # все изменившиеся банки пакета - одним executemany по bank_en
+            await cls.update_many(session, [record._asdict() for record in changed_rows.values()], key="bank_en")
+            db_rows.update(changed_rows)
+            sync_result.changed_banks.update(changed_rows)
+
+        if new_rows:
+            await session.execute(insert(cls.model), [record._asdict() for record in new_rows.values()])
+            log.info("Добавлено банков: %s", len(new_rows))
+            db_rows.update(new_rows)
+            sync_result.changed_banks.update(new_rows)
+
+    @classmethod
+    async def finish_currency_sync(
+            cls,
+            session: AsyncSession,
+            db_rows: Dict[str, dict],
+            sync_result: SyncResult,
+            delete_missing: bool = True,
+    ) -> SyncResult:
+        """
+        Сверка в конце синхронизации: удаляет банки, которых не было ни в одном пакете
+        (если delete_missing), и подсчитывает итоги.
+        """
+        # DELETE (удаляем лишние в БД)
+        to_delete = set(db_rows) - sync_result.seen_banks if delete_missing else set()
+        if to_delete:
+            sync_result.deleted = await cls.delete_many(session, to_delete, key="bank_en")
+            log.info("Удалено банков: %s", sync_result.deleted)
+            sync_result.changed_banks.update(to_delete)
+            for bank_en in to_delete:
+                del db_rows[bank_en]
+
+        known, seen = sync_result.known_banks, sync_result.seen_banks
+        sync_result.added = len(seen - known)
+        sync_result.updated = len(sync_result.changed_banks & known & seen)
+        sync_result.unchanged = len(seen & known) - sync_result.updated
+
+        log.info(
+            "Синхронизация завершена: Итоговое количество банков = %s, "
+            "добавлено %s, обновлено %s, без изменений %s, удалено %s",
+            sync_result.total, sync_result.added, sync_result.updated, sync_result.unchanged, sync_result.deleted,
+        )
+        return sync_result
+
+    @classmethod
+    async def bulk_update_currency(
+            cls,
+            records: Iterable[RawCurrencyRate | BaseModel],
+            session: AsyncSession,
+            delete_missing: bool = True,
+    ) -> SyncResult:
+        """
+        Синхронизация валютных курсов (insert + update + delete) в бд.
+        Обновляются только банки, данные которых изменились. delete_missing=False - частичная
+        синхронизация (часть страниц myfin), банки, которых нет в records, не удаляются.
+        """
         try:
-            # проверка на дублирующиеся банки
-            bank_en_counts = Counter(record.model_dump().get("bank_en") for record in records)
-            duplicates = {k: v for k, v in bank_en_counts.items() if v > 1}
-            if duplicates:
-                log.warning(f"Дублирующиеся банки: {duplicates}")
-
-            # 1. Подготовка данных
-            parsed_records = []
-            parsed_bank_ens = set()
-
-            for record in records:
-                record_dict = record.model_dump(exclude_unset=True)
-                bank_en = record_dict.get("bank_en")
-                
-                if not bank_en:
-                    log.warning(f"Пропуск записи: отсутствует bank_en. Данные: {record_dict}")
-                    continue
-
-                parsed_records.append(record_dict)
-                parsed_bank_ens.add(bank_en)
-
-            # 2. Получаем банки из БД
-            result = await session.execute(select(cls.model.bank_en))
-            log.debug(f"result = {result}")
-            # db_bank_ens_first = result.scalars().all()
-            # log.debug(f"db_bank_ens = {db_bank_ens_first}")
-            db_bank_ens = set(result.scalars().all())
-            log.debug(f"db_bank_ens = {db_bank_ens}")
-
-            # 3. Определяем разницу
-            to_add = parsed_bank_ens - db_bank_ens
-            to_delete = db_bank_ens - parsed_bank_ens
-            to_update = parsed_bank_ens & db_bank_ens
-
-            counted_banks = 0 # количество банков без дублирований
-
-            # 4. DELETE (удаляем лишние в БД)
-            if to_delete:
-                delete_stmt = delete(cls.model).where(cls.model.bank_en.in_(to_delete))
-                result = await session.execute(delete_stmt)
-                log.info(f"Удалено банков: {result.rowcount}")
-
-            # 5. INSERT (добавляем новые)
-            new_records = [r for r in parsed_records if r["bank_en"] in to_add]
-
-            if new_records:
-                await session.execute(insert(cls.model), new_records)
-                log.info(f"Добавлено банков: {len(new_records)}")
-                counted_banks += len(new_records)
-
-            # 6. UPDATE (обновляем существующие)
-            updated_banks = set()
-            for record_dict in parsed_records:
-                bank_en = record_dict["bank_en"]
-
-                if bank_en not in to_update:
-                    continue
-
-                update_data = {k: v for k, v in record_dict.items() if k != "bank_en"}
-
-                if not update_data:
-                    continue
-
-                stmt = update(cls.model).where(cls.model.bank_en == bank_en).values(**update_data)
-                result = await session.execute(stmt)
-                if result.rowcount > 0 and bank_en not in updated_banks:
-                    counted_banks += 1
-                    updated_banks.add(bank_en)
-
-            # 7. COMMIT
+            db_rows, sync_result = await cls.start_currency_sync(session)
+            await cls.upsert_currency_batch(session, map(as_raw_rate, records), db_rows, sync_result)
+            await cls.finish_currency_sync(session, db_rows, sync_result, delete_missing)
+
+            # COMMIT
             await session.commit()
+            return sync_result
+
+        except SQLAlchemyError as e:
+            await session.rollback()
+            log.error("Ошибка синхронизации валют: %s", e)
+            raise
 
-            log.info(
-                f"Синхронизация завершена: "
-                f"Итоговое количество банков = {counted_banks}. "
-            )
 
-            return counted_banks
+    @classmethod
+    async def find_all_rows(cls, session: AsyncSession, admin: bool = False) -> List[dict]:
+        """Возвращает курсы всех банков словарями только с колонками ответа, без загрузки ORM-объектов."""
+        columns = cls.admin_columns if admin else cls.public_columns
+        try:
+            result = await session.execute(select(*columns))
+            return [row._asdict() for row in result]
+        except SQLAlchemyError as e:
+            log.error("Ошибка при получении курсов всех банков: %s", e)
+            raise
+
 
+    @classmethod
+    async def find_row_by_bank_en(cls, session: AsyncSession, bank_en: str) -> dict | None:
+        """Возвращает курсы банка словарем только с колонками ответа."""
+        try:
+            result = await session.execute(select(*cls.public_columns).where(cls.model.bank_en == bank_en))
+            row = result.one_or_none()
+            return row._asdict() if row else None
         except SQLAlchemyError as e:
-            await session.rollback()
-            log.error(f"Ошибка синхронизации валют: {e}")
+            log.error("Ошибка при поиске банка %s: %s", bank_en, e)
+            raise
+
+
+    @classmethod
+    async def find_by_bank_ens(cls, session: AsyncSession, bank_ens: List[str]) -> List[dict]:
+        """Находит банки по списку английских названий одним запросом (только колонки ответа)."""
+        try:
+            query = select(*cls.public_columns).where(cls.model.bank_en.in_(bank_ens))
+            result = await session.execute(query)
+            return [row._asdict() for row in result]
+        except SQLAlchemyError as e:
+            log.error("Ошибка поиска банков по списку названий: %s", e)
             raise
 
 
@@ -113,44 +213,130 @@ class CurrencyRateDAO(BaseDAO):
             cls,
             currency_type: str,
             operation: str,
-            session: AsyncSession
+            session: AsyncSession,
+            max_age: int | None = None,
     ) -> BestRateResponse | None:
-        """Находит лучший курс для указанной валюты и операции"""
+        """Находит лучший курс для указанной валюты и операции среди банков, обновивших курсы за max_age минут"""
         try:
-            field = settings.CURRENCY_FIELDS[currency_type][operation]
-            order_by = desc(field) if operation == 'sell' else field
-
-            query = select(cls.model).order_by(order_by)
-            result = await session.execute(query)
-            rates = result.scalars().all()
+            if cls._use_best_rates_view(session, max_age):
+                view = best_currency_rates
+                query = select(view.c.rate, view.c.banks).where(
+                    view.c.currency == currency_type, view.c.operation == operation
+                )
+                row = (await session.execute(query)).first()
+                return BestRateResponse(rate=row.rate, banks=row.banks) if row and row.banks else None
+
+            field = getattr(cls.model, settings.CURRENCY_FIELDS[currency_type][operation])
+            fresh = cls._fresh_filter(max_age)
+
+            # лучший курс - MIN/MAX по индексу курса, затем только банки с этим курсом (без сортировки таблицы)
+            best = select(func.max(field) if operation == 'sell' else func.min(field)).where(*fresh)
+            query = select(field, cls.model.bank_name).where(*fresh, field == best.scalar_subquery())
+            result = await session.execute(query.order_by(cls.model.id))
+            rates = result.all()
 
             if not rates:
                 return None
 
-            best_value = getattr(rates[0], field)
-            best_banks = [
-                bank.bank_name for bank in rates
-                if getattr(bank, field) == best_value
-            ]
+            best_value = rates[0][0]
+            best_banks = [bank_name for rate, bank_name in rates]
 
             return BestRateResponse(rate=best_value, banks=best_banks)
         except SQLAlchemyError as e:
-            log.error(f"Ошибка поиска лучшего курса: {e}")
+            log.error("Ошибка поиска лучшего курса: %s", e)
             raise
 
 
     @classmethod
-    async def find_best_purchase_rate(cls, currency_type: str, session: AsyncSession) -> BestRateResponse | None:
+    async def find_best_purchase_rate(
+            cls,
+            currency_type: str,
+            session: AsyncSession,
+            max_age: int | None = None,
+    ) -> BestRateResponse | None:
         """Находит лучший курс покупки для указанной валюты"""
-        return await cls._find_best_rate(currency_type, 'buy', session)
+        return await cls._find_best_rate(currency_type, 'buy', session, max_age)
 
 
     @classmethod
-    async def find_best_sale_rate(cls, currency_type: str, session: AsyncSession) -> BestRateResponse | None:
+    async def find_best_sale_rate(
+            cls,
+            currency_type: str,
+            session: AsyncSession,
+            max_age: int | None = None,
+    ) -> BestRateResponse | None:
         """Находит лучший курс продажи для указанной валюты"""
-        return await cls._find_best_rate(currency_type, 'sell', session)
+        return await cls._find_best_rate(currency_type, 'sell', session, max_age)
     
 
+    @classmethod
+    async def _find_best_rates(
+            cls,
+            session: AsyncSession,
+            operation: str,
+            currencies: List[str],
+            count: int,
+            max_age: int | None = None,
+    ) -> tuple[int, dict[str, List[dict]]]:
+        """
+        Получает топ-count банков по каждой из валют и общее количество банков одним запросом:
+        UNION ALL из ORDER BY/LIMIT по каждой валюте, количество - скалярным подзапросом.
+        С max_age и топ, и количество считаются только по банкам со свежими курсами.
+        """
+        if count <= settings.BEST_RATES_VIEW_TOP_N and cls._use_best_rates_view(session, max_age):
+            return await cls._find_best_rates_in_view(session, operation, currencies, count)
+
+        fresh = cls._fresh_filter(max_age)
+        total = select(func.count(cls.model.id)).where(*fresh).scalar_subquery().label("total")
+        keys = [column.key for column in cls.public_columns]
+
+        branches = []
+        for currency_type in currencies:
+            field = getattr(cls.model, settings.CURRENCY_FIELDS[currency_type][operation])
+            order_by = desc(field) if operation == 'sell' else field
+            top = (
+                select(*cls.public_columns, cls.model.id)
+                .where(*fresh)
+                .order_by(order_by, cls.model.id)
+                .limit(count)
+                .subquery()
+            )
+            branches.append(select(literal(currency_type).label("currency"), total, top))
+
+        rows = (await session.execute(union_all(*branches))).mappings().all()
+
+        result = {currency_type: [] for currency_type in currencies}
+        for row in rows:
+            result[row["currency"]].append(row)
+        for currency_type, top in result.items():
+            # порядок строк внутри UNION ALL не гарантирован, восстанавливаем его по курсу
+            field = settings.CURRENCY_FIELDS[currency_type][operation]
+            sign = -1 if operation == 'sell' else 1
+            top.sort(key=lambda row: (sign * row[field], row["id"]))
+            result[currency_type] = [{key: row[key] for key in keys} for row in top]
+        return (rows[0]["total"] if rows else 0), result
+
+    @classmethod
+    async def _find_best_rates_in_view(
+            cls,
+            session: AsyncSession,
+            operation: str,
+            currencies: List[str],
+            count: int,
+    ) -> tuple[int, dict[str, List[dict]]]:
+        """Топ-count банков и их общее количество из best_currency_rates: по строке на валюту по ключу."""
+        view = best_currency_rates
+        query = select(view.c.currency, view.c.total, view.c.top).where(
+            view.c.operation == operation, view.c.currency.in_(currencies)
+        )
+        rows = (await session.execute(query)).all()
+
+        result = {currency_type: [] for currency_type in currencies}
+        for row in rows:
+            result[row.currency] = (row.top or [])[:count]
+        return (rows[0].total if rows else 0), result
+
+
     @classmethod
     async def find_best_purchase_rates(
             cls,
@@ -158,21 +344,14 @@ class CurrencyRateDAO(BaseDAO):
             usd: bool = False,
             eur: bool = False,
             count: int = 10,
-    ) -> dict[str, List]:
-        """Получает лучшие курсы покупки для USD и/или EUR."""
-        result = {}
+            max_age: int | None = None,
+    ) -> tuple[int, dict[str, List[dict]]]:
+        """Получает общее количество банков и лучшие курсы покупки для USD и/или EUR."""
+        currencies = [currency_type for currency_type, flag in (('usd', usd), ('eur', eur)) if flag]
         try:
-            if usd:
-                query = select(cls.model).order_by(cls.model.usd_buy).limit(count)
-                res = await session.execute(query)
-                result['usd'] = res.scalars().all()
-            if eur:
-                query = select(cls.model).order_by(cls.model.eur_buy).limit(count)
-                res = await session.execute(query)
-                result['eur'] = res.scalars().all()
-            return result
+            return await cls._find_best_rates(session, 'buy', currencies, count, max_age)
         except SQLAlchemyError as e:
-            logger.error(f"Ошибка при получении лучших курсов покупки: {e}")
+            log.error("Ошибка при получении лучших курсов покупки: %s", e)
             raise
 
 
@@ -182,22 +361,15 @@ class CurrencyRateDAO(BaseDAO):
             session: AsyncSession,
             usd: bool = False,
             eur: bool = False,
-            count: int = 10
-    ) -> dict[str, List]:
-        """Получает лучшие курсы продажи для USD и/или EUR."""
-        result = {}
+            count: int = 10,
+            max_age: int | None = None,
+    ) -> tuple[int, dict[str, List[dict]]]:
+        """Получает общее количество банков и лучшие курсы продажи для USD и/или EUR."""
+        currencies = [currency_type for currency_type, flag in (('usd', usd), ('eur', eur)) if flag]
         try:
-            if usd:
-                query = select(cls.model).order_by(desc(cls.model.usd_sell)).limit(count)
-                res = await session.execute(query)
-                result['usd'] = res.scalars().all()
-            if eur:
-                query = select(cls.model).order_by(desc(cls.model.eur_sell)).limit(count)
-                res = await session.execute(query)
-                result['eur'] = res.scalars().all()
-            return result
+            return await cls._find_best_rates(session, 'sell', currencies, count, max_age)
         except SQLAlchemyError as e:
-            logger.error(f"Ошибка при получении лучших курсов продажи: {e}")
+            log.error("Ошибка при получении лучших курсов продажи: %s", e)
             raise
 
     
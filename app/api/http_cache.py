@@ -0,0 +1,154 @@
+import inspect
+from functools import lru_cache
+from typing import Callable
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.snapshot import EncodedBody, rate_snapshot
+from app.auth.dependencies import has_valid_access_token
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Проверяет заголовок If-None-Match (слабое сравнение, список значений или '*')."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(value.strip().removeprefix("W/") == opaque for value in if_none_match.split(","))
+
+
+# порядок предпочтения кодировок при одинаковом q
+_ENCODING_PREFERENCE = ("br", "gzip", "identity")
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str:
+    """Выбирает кодировку ответа по заголовку Accept-Encoding с учетом q-значений."""
+    if not accept_encoding:
+        return "identity"
+
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, *params = (item.strip() for item in part.split(";"))
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[coding.lower()] = q
+
+    def weight(coding: str) -> float:
+        if coding in weights:
+            return weights[coding]
+        if "*" in weights:
+            return weights["*"]
+        # identity допустима, если явно не запрещена
+        return 1.0 if coding == "identity" else 0.0
+
+    # при равных q выигрывает кодировка, стоящая раньше в порядке предпочтения
+    best = max(_ENCODING_PREFERENCE, key=weight)
+    return best if weight(best) > 0 else "identity"
+
+
+# эндпоинты, которые отвечают из снимка курсов (см. snapshot_cached): эндпоинт -> ETag зависит от версии снимка
+_snapshot_endpoints: dict[Callable, bool] = {}
+
+
+def snapshot_cached(endpoint: Callable | None = None, *, versioned: bool = False):
+    """
+    Регистрирует эндпоинт для HTTPCacheMiddleware: его ответ определяется снимком курсов,
+    а доступ - только валидным access_token (без проверки роли). Ставится под декоратором маршрута.
+    versioned=True - ответ содержит данные конкретной публикации (номер версии, время, изменения
+    с прошлой синхронизации), поэтому ETag меняется с каждой публикацией, а не только с курсами.
+    """
+    def register(endpoint: Callable) -> Callable:
+        _snapshot_endpoints[endpoint] = versioned
+        return endpoint
+
+    return register(endpoint) if endpoint else register
+
+
+@lru_cache(maxsize=None)
+def _accepts_max_age(endpoint: Callable) -> bool:
+    """Эндпоинт фильтрует курсы по свежести (параметр max_age)."""
+    return "max_age" in inspect.signature(endpoint).parameters
+
+
+def encoded_response(request: Request, body: EncodedBody) -> Response:
+    """Ответ с заранее сжатым телом в кодировке, которую принимает клиент."""
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body.variants[encoding], headers=headers, media_type="application/json")
+
+
+class HTTPCacheMiddleware:
+    """
+    HTTP-кеширование ответов с курсами из снимка по версии снимка данных.
+    Касается только эндпоинтов, зарегистрированных через snapshot_cached; остальные
+    (чтения из БД, эндпоинты с проверкой роли) проходят без ETag и 304.
+    Добавляет ETag и Cache-Control (до следующей синхронизации) к успешным GET-ответам,
+    а на If-None-Match с актуальной версией отвечает 304 до зависимостей эндпоинта,
+    то есть без обращения к БД и сериализации.
+    Запросы с max_age к эндпоинтам курсов, которые его принимают, не кешируются: результат зависит
+    от текущего времени, а не только от версии снимка, поэтому они всегда доходят до эндпоинта
+    и получают Cache-Control: no-cache.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    @staticmethod
+    def _endpoint(scope: Scope) -> Callable | None:
+        """Эндпоинт маршрута, в который попадает запрос."""
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "endpoint", None)
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        endpoint = self._endpoint(scope)
+        if endpoint is not None and "max_age" in request.query_params and _accepts_max_age(endpoint):
+            await self.app(scope, receive, self._with_headers(scope, send, {"Cache-Control": "no-cache"}))
+            return
+
+        snapshot = rate_snapshot.current
+        if snapshot is None or not snapshot.records or endpoint not in _snapshot_endpoints:
+            await self.app(scope, receive, send)
+            return
+
+        etag = f'W/"{snapshot.data_hash}-{snapshot.version}"' if _snapshot_endpoints[endpoint] else snapshot.etag
+        cache_headers = {
+            "ETag": etag,
+            "Cache-Control": f"private, max-age={rate_snapshot.max_age()}",
+        }
+
+        # 304 отдаем только с валидным токеном: проверка подписи JWT не требует БД
+        if etag_matches(request.headers.get("if-none-match"), etag) and has_valid_access_token(request):
+            await Response(status_code=304, headers=cache_headers)(scope, receive, send)
+            return
+
+        await self.app(scope, receive, self._with_headers(scope, send, cache_headers))
+
+    @staticmethod
+    def _with_headers(scope: Scope, send: Send, headers: dict[str, str]) -> Send:
+        """send, который добавляет заголовки к успешному ответу."""
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        return send_with_headers
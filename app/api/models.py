@@ -1,5 +1,9 @@
-from sqlalchemy.orm import Mapped
-from app.dao.database import Base, float_col, str_uniq
+from datetime import datetime
+
+from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from app.dao.database import Base, TZDateTime, float_col, str_uniq
 
 
 class CurrencyRate(Base):
@@ -22,6 +26,33 @@ class CurrencyRate(Base):
 
     # Время последнего обновления
     update_time: Mapped[str]
+
+    # Время последнего обновления, разобранное парсером (None, если строку разобрать не удалось)
+    quoted_at: Mapped[datetime | None] = mapped_column(TZDateTime, index=True)
     
     def __repr__(self):
-        return f"{self.__class__.__name__}(id={self.id}, bank={self.bank_name})"
\ No newline at end of file
+        return f"{self.__class__.__name__}(id={self.id}, bank={self.bank_name})"
+
+
+# Индексы под сортировки лучших курсов: ORDER BY курс (по убыванию для продажи), id LIMIT k.
+# В PostgreSQL bank_name и bank_en включены в индекс, и лучший курс читается только из индекса.
+_include = {"postgresql_include": ["bank_name", "bank_en"]}
+Index("ix_currencyrates_usd_buy", CurrencyRate.usd_buy, CurrencyRate.id, **_include)
+Index("ix_currencyrates_usd_sell", CurrencyRate.usd_sell.desc(), CurrencyRate.id, **_include)
+Index("ix_currencyrates_eur_buy", CurrencyRate.eur_buy, CurrencyRate.id, **_include)
+Index("ix_currencyrates_eur_sell", CurrencyRate.eur_sell.desc(), CurrencyRate.id, **_include)
+
+
+# Материализованное представление PostgreSQL с лучшими курсами: строка на валюту и операцию
+# с лучшим курсом, банками с этим курсом и топом банков. Создается миграцией и обновляется после
+# каждой синхронизации, поэтому описано вне Base.metadata (create_all и autogenerate его не трогают).
+best_currency_rates = Table(
+    "best_currency_rates",
+    MetaData(),
+    Column("currency", String, primary_key=True),
+    Column("operation", String, primary_key=True),
+    Column("rate", Float),
+    Column("banks", ARRAY(String)),
+    Column("top", JSONB),
+    Column("total", Integer),
+)
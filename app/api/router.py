@@ -1,15 +1,23 @@
-from typing import List
+from typing import List, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import ORJSONResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.dao import CurrencyRateDAO
+from app.api.http_cache import encoded_response, snapshot_cached
 from app.api.schemas import (
     AdminCurrencySchema, 
     BankNameSchema,
+    BankNamesSchema,
+    BankSearchResult,
+    BanksCurrencyResponse,
     BestRateResponse, 
-    CurrencyRateSchema
+    CurrencyRateSchema,
+    MarketStatsResponse,
+    RatesCountResponse
 )
+from app.api.snapshot import rate_snapshot
 from app.api.utils import validate_currency_type
 from app.auth.dependencies import get_current_admin_user, get_current_user
 from app.auth.models import User
@@ -20,46 +28,122 @@ from app.dao.session_maker import SessionDep
 router = APIRouter(prefix='/api', tags=['Api'])
 
 
-@router.get("/all_currency/", summary="Получить информацию о валютных курсах всех банков")
+# Ответы с курсами собираются из словарей с нужными колонками и сериализуются напрямую через orjson,
+# без создания ORM-объектов и повторной валидации; response_model используется только для документации.
+@router.get(
+    "/all_currency/",
+    summary="Получить информацию о валютных курсах всех банков",
+    response_model=List[CurrencyRateSchema]
+)
+@snapshot_cached
 async def get_all_currency(
+        request: Request,
         user_data: User = Depends(get_current_user),
         session: AsyncSession = SessionDep
-) -> List[CurrencyRateSchema]:
+) -> Response:
     """Возвращает актуальные курсы валют всех банков."""
-    return await CurrencyRateDAO.find_all(session=session, filters=None)
+    # после синхронизации отдаем готовое сжатое тело из снимка, до неё - читаем из БД
+    snapshot = rate_snapshot.current
+    if snapshot and snapshot.records:
+        return encoded_response(request, snapshot.all_currency_body)
+    return ORJSONResponse(await CurrencyRateDAO.find_all_rows(session=session))
 
 
-@router.get("/currency_by_bank/{bank_en}", summary="Получить информацию о валютных курсах конкретного банка")
+@router.get(
+    "/currency_by_bank/{bank_en}",
+    summary="Получить информацию о валютных курсах конкретного банка",
+    response_model=CurrencyRateSchema
+)
 async def get_currency_by_bank(
         bank_en: str = Path(description="Название банка на английском языке"),
         user_data: User = Depends(get_current_user),
         session: AsyncSession = SessionDep
-) -> CurrencyRateSchema | None:
+) -> ORJSONResponse:
     """Возвращает курсы валют конкретного банка по его английскому названию."""
-    currencies = await CurrencyRateDAO.find_one_or_none(session=session, filters=BankNameSchema(bank_en=bank_en.lower()))
+    filters = BankNameSchema(bank_en=bank_en.lower())
+    currencies = await CurrencyRateDAO.find_row_by_bank_en(session=session, bank_en=filters.bank_en)
     if not currencies:
         raise HTTPException(status_code=404, detail=settings.ERROR_MESSAGES["bank_not_found"])
-    return currencies
+    return ORJSONResponse(currencies)
+
+
+async def _find_currencies_by_banks(bank_ens: List[str], session: AsyncSession) -> BanksCurrencyResponse:
+    """Находит курсы сразу для нескольких банков: по снимку, а без него - одним IN-запросом."""
+    # убираем дубли, сохраняя порядок запроса
+    bank_ens = list(dict.fromkeys(bank_en.lower() for bank_en in bank_ens))
+    if len(bank_ens) > settings.MAX_BATCH_BANKS:
+        raise HTTPException(status_code=400, detail=settings.ERROR_MESSAGES["too_many_banks"])
+
+    snapshot = rate_snapshot.current
+    if snapshot and snapshot.records:
+        found = snapshot.by_bank_en
+    else:
+        rows = await CurrencyRateDAO.find_by_bank_ens(session=session, bank_ens=bank_ens)
+        found = {row["bank_en"]: row for row in rows}
+
+    return BanksCurrencyResponse(
+        banks=[CurrencyRateSchema.model_validate(found[bank_en]) for bank_en in bank_ens if bank_en in found],
+        missing=[bank_en for bank_en in bank_ens if bank_en not in found],
+    )
+
+
+@router.get("/currency_by_banks", summary="Получить информацию о валютных курсах нескольких банков")
+@snapshot_cached
+async def get_currency_by_banks(
+        bank_en: List[str] = Query(description="Названия банков на английском языке"),
+        user_data: User = Depends(get_current_user),
+        session: AsyncSession = SessionDep
+) -> BanksCurrencyResponse:
+    """Возвращает курсы валют нескольких банков и список ненайденных банков."""
+    return await _find_currencies_by_banks(bank_en, session)
+
+
+@router.post("/currency_by_banks", summary="Получить информацию о валютных курсах нескольких банков")
+async def post_currency_by_banks(
+        banks: BankNamesSchema,
+        user_data: User = Depends(get_current_user),
+        session: AsyncSession = SessionDep
+) -> BanksCurrencyResponse:
+    """Возвращает курсы валют для списка банков из тела запроса и список ненайденных банков."""
+    return await _find_currencies_by_banks(banks.bank_en, session)
+
+
+@router.get("/banks/search", summary="Найти банки по части или неточному названию")
+@snapshot_cached
+async def search_banks(
+        q: str = Query(min_length=2, description="Часть названия банка на русском или английском языке"),
+        limit: int = Query(10, ge=1, le=100, description="Максимальное количество результатов"),
+        user_data: User = Depends(get_current_user),
+) -> List[BankSearchResult]:
+    """Возвращает найденные банки, отсортированные по релевантности, вместе с текущими курсами."""
+    return rate_snapshot.search_banks(query=q, limit=limit)
 
 
-@router.get("/all_currency_admin/", summary="Получить информацию о валютных курсах всех банков через роль админа")
+@router.get(
+    "/all_currency_admin/",
+    summary="Получить информацию о валютных курсах всех банков через роль админа",
+    response_model=List[AdminCurrencySchema]
+)
 async def get_all_currency_admin(
         user_data: User = Depends(get_current_admin_user),
         session: AsyncSession = SessionDep
-) -> List[AdminCurrencySchema]:
+) -> ORJSONResponse:
     """Возвращает расширенную информацию о курсах валют (только для админов)."""
-    return await CurrencyRateDAO.find_all(session=session, filters=None)
+    return ORJSONResponse(await CurrencyRateDAO.find_all_rows(session=session, admin=True))
 
 
 @router.get("/best_purchase_rate/{currency_type}", summary="Получить информацию о самом выгодном валютном курсе для покупки")
 async def get_best_purchase_rate(
         currency_type: str = Path(description="Название валюты на английском языке"),
+        max_age: int | None = Query(None, ge=1, description="Учитывать только курсы, обновленные за последние max_age минут"),
         user_data: User = Depends(get_current_user),
         session: AsyncSession = SessionDep
 ) -> BestRateResponse:
     """Возвращает информацию о банке с лучшим курсом покупки для выбранной валюты."""
     currency_type = validate_currency_type(currency_type)
-    result = await CurrencyRateDAO.find_best_purchase_rate(session=session, currency_type=currency_type.lower())
+    result = await CurrencyRateDAO.find_best_purchase_rate(
+        session=session, currency_type=currency_type.lower(), max_age=max_age
+    )
     if not result or not result.banks:
         raise HTTPException(status_code=404, detail=settings.ERROR_MESSAGES["not_found"])
     return result
@@ -68,31 +152,47 @@ async def get_best_purchase_rate(
 @router.get("/best_sale_rate/{currency_type}", summary="Получить информацию о самом выгодном валютном курсе для продажи")
 async def get_best_sale_rate(
         currency_type: str = Path(description="Название валюты на английском языке"),
+        max_age: int | None = Query(None, ge=1, description="Учитывать только курсы, обновленные за последние max_age минут"),
         user_data: User = Depends(get_current_user),
         session: AsyncSession = SessionDep
 ) -> BestRateResponse:
     """Возвращает информацию о банке с лучшим курсом продажи для выбранной валюты."""
     currency_type = validate_currency_type(currency_type)
-    result = await CurrencyRateDAO.find_best_sale_rate(session=session, currency_type=currency_type.lower())
+    result = await CurrencyRateDAO.find_best_sale_rate(
+        session=session, currency_type=currency_type.lower(), max_age=max_age
+    )
     if not result or not result.banks:
         raise HTTPException(status_code=404, detail=settings.ERROR_MESSAGES["not_found"])
     return result
 
 
-@router.get("/best_purchase_rates/", summary="Получить информацию о самых выгодных валютных курсах для покупки")
+@router.get(
+    "/best_purchase_rates/",
+    summary="Получить информацию о самых выгодных валютных курсах для покупки",
+    response_model=dict[str, List[CurrencyRateSchema]]
+)
 async def get_best_purchase_rates(
         usd: bool = False,
         eur: bool = False,
         count: int = Query(10, description="Количество банков с валютными курсами"),
+        max_age: int | None = Query(None, ge=1, description="Учитывать только курсы, обновленные за последние max_age минут"),
         user_data: User = Depends(get_current_user),
         session: AsyncSession = SessionDep
-) -> dict[str, List[CurrencyRateSchema]]:
+) -> ORJSONResponse:
     """Возвращает топ валютных курсов покупки для USD и/или EUR."""
     if not usd and not eur:
         raise HTTPException(status_code=400, detail="Укажите хотя бы одну валюту: usd или eur")
         
+    # топ банков и общее количество банков приходят одним запросом
+    total, result = await CurrencyRateDAO.find_best_purchase_rates(
+        session=session, usd=usd, eur=eur, count=count, max_age=max_age
+    )
+
+    # ни одного банка (с max_age - ни одного со свежими курсами): нечего сравнивать с count
+    if not total:
+        raise HTTPException(status_code=404, detail=settings.ERROR_MESSAGES["not_found"])
+
     # проверка что указанное количество банков не превышает существующее
-    total = await CurrencyRateDAO.get_total_count(session=session)
     if count > total:
         raise HTTPException(
             status_code=400,
@@ -102,26 +202,38 @@ async def get_best_purchase_rates(
             )
         )
     
-    result = await CurrencyRateDAO.find_best_purchase_rates(session=session, usd=usd, eur=eur, count=count)
     if not result:
         raise HTTPException(status_code=404, detail=settings.ERROR_MESSAGES["not_found"])
-    return result
+    return ORJSONResponse(result)
 
 
-@router.get("/best_sale_rates/", summary="Получить информацию о самых выгодных валютных курсах для продажи")
+@router.get(
+    "/best_sale_rates/",
+    summary="Получить информацию о самых выгодных валютных курсах для продажи",
+    response_model=dict[str, List[CurrencyRateSchema]]
+)
 async def get_best_sale_rates(
         usd: bool = False,
         eur: bool = False,
         count: int = Query(10, description="Количество банков с валютными курсами"),
+        max_age: int | None = Query(None, ge=1, description="Учитывать только курсы, обновленные за последние max_age минут"),
         user_data: User = Depends(get_current_user),
         session: AsyncSession = SessionDep
-) -> dict[str, List[CurrencyRateSchema]]:
+) -> ORJSONResponse:
     """Возвращает топ валютных курсов продажи для USD и/или EUR."""
     if not usd and not eur:
         raise HTTPException(status_code=400, detail="Укажите хотя бы одну валюту: usd или eur")
     
+    # топ банков и общее количество банков приходят одним запросом
+    total, result = await CurrencyRateDAO.find_best_sale_rates(
+        session=session, usd=usd, eur=eur, count=count, max_age=max_age
+    )
+
+    # ни одного банка (с max_age - ни одного со свежими курсами): нечего сравнивать с count
+    if not total:
+        raise HTTPException(status_code=404, detail=settings.ERROR_MESSAGES["not_found"])
+
     # проверка что указанное количество банков не превышает существующее
-    total = await CurrencyRateDAO.get_total_count(session=session)
     if count > total:
         raise HTTPException(
             status_code=400,
@@ -131,7 +243,101 @@ async def get_best_sale_rates(
             )
         )
 
-    result = await CurrencyRateDAO.find_best_sale_rates(session=session, usd=usd, eur=eur, count=count)
     if not result:
         raise HTTPException(status_code=404, detail=settings.ERROR_MESSAGES["not_found"])
-    return result
\ No newline at end of file
+    return ORJSONResponse(result)
+
+
+@router.get("/stats/{currency_type}", summary="Получить статистику валютного рынка по всем банкам")
+# в ответе номер версии, время публикации и изменения с прошлой синхронизации
+@snapshot_cached(versioned=True)
+async def get_market_stats(
+        currency_type: str = Path(description="Название валюты на английском языке"),
+        within_pct: float = Query(
+            settings.STATS_WITHIN_PCT, ge=0, description="Допуск от лучшего курса в процентах"
+        ),
+        user_data: User = Depends(get_current_user),
+) -> MarketStatsResponse:
+    """Возвращает медиану, перцентили, разброс и спред курсов, посчитанные при последней синхронизации."""
+    currency_type = validate_currency_type(currency_type)
+    result = rate_snapshot.market_stats(currency_type=currency_type, within_pct=within_pct)
+    if not result:
+        raise HTTPException(status_code=404, detail=settings.ERROR_MESSAGES["not_found"])
+    return result
+
+
+
+def _get_current_snapshot():
+    """Возвращает текущий снимок курсов или 404, если синхронизация ещё не выполнялась."""
+    snapshot = rate_snapshot.current
+    if not snapshot or not snapshot.records:
+        raise HTTPException(status_code=404, detail=settings.ERROR_MESSAGES["not_found"])
+    return snapshot
+
+
+def _validate_range(min_rate: float | None, max_rate: float | None) -> None:
+    if min_rate is not None and max_rate is not None and min_rate > max_rate:
+        raise HTTPException(status_code=400, detail=settings.ERROR_MESSAGES["range"])
+
+
+@router.get("/near_best_rates/{currency_type}", summary="Получить банки с курсом в пределах допуска от лучшего")
+@snapshot_cached
+async def get_near_best_rates(
+        currency_type: str = Path(description="Название валюты на английском языке"),
+        operation: Literal["buy", "sell"] = Query(description="Операция: покупка (buy) или продажа (sell)"),
+        tolerance: float = Query(ge=0, description="Допустимое отклонение от лучшего курса в рублях"),
+        max_age: int | None = Query(None, ge=1, description="Учитывать только курсы, обновленные за последние max_age минут"),
+        user_data: User = Depends(get_current_user),
+) -> List[CurrencyRateSchema]:
+    """
+    Возвращает банки, чей курс отличается от лучшего не более чем на tolerance, начиная с лучшего.
+    С max_age и лучший курс, и банки выбираются только среди свежих курсов, как в best_*_rate.
+    """
+    currency_type = validate_currency_type(currency_type)
+    return _get_current_snapshot().near_best(currency_type, operation, tolerance, max_age)
+
+
+@router.get("/near_best_rates/{currency_type}/count", summary="Получить количество банков с курсом в пределах допуска от лучшего")
+@snapshot_cached
+async def get_near_best_rates_count(
+        currency_type: str = Path(description="Название валюты на английском языке"),
+        operation: Literal["buy", "sell"] = Query(description="Операция: покупка (buy) или продажа (sell)"),
+        tolerance: float = Query(ge=0, description="Допустимое отклонение от лучшего курса в рублях"),
+        max_age: int | None = Query(None, ge=1, description="Учитывать только курсы, обновленные за последние max_age минут"),
+        user_data: User = Depends(get_current_user),
+) -> RatesCountResponse:
+    """Возвращает количество банков, чей курс отличается от лучшего не более чем на tolerance."""
+    currency_type = validate_currency_type(currency_type)
+    count = _get_current_snapshot().count_near_best(currency_type, operation, tolerance, max_age)
+    return RatesCountResponse(count=count)
+
+
+@router.get("/rates_in_range/{currency_type}", summary="Получить банки с курсом в заданном диапазоне")
+@snapshot_cached
+async def get_rates_in_range(
+        currency_type: str = Path(description="Название валюты на английском языке"),
+        operation: Literal["buy", "sell"] = Query(description="Операция: покупка (buy) или продажа (sell)"),
+        min_rate: float | None = Query(None, description="Нижняя граница курса (включительно)"),
+        max_rate: float | None = Query(None, description="Верхняя граница курса (включительно)"),
+        user_data: User = Depends(get_current_user),
+) -> List[CurrencyRateSchema]:
+    """Возвращает банки с курсом в диапазоне [min_rate, max_rate] по возрастанию курса."""
+    currency_type = validate_currency_type(currency_type)
+    _validate_range(min_rate, max_rate)
+    return _get_current_snapshot().rates_in_range(currency_type, operation, min_rate, max_rate)
+
+
+@router.get("/rates_in_range/{currency_type}/count", summary="Получить количество банков с курсом в заданном диапазоне")
+@snapshot_cached
+async def get_rates_in_range_count(
+        currency_type: str = Path(description="Название валюты на английском языке"),
+        operation: Literal["buy", "sell"] = Query(description="Операция: покупка (buy) или продажа (sell)"),
+        min_rate: float | None = Query(None, description="Нижняя граница курса (включительно)"),
+        max_rate: float | None = Query(None, description="Верхняя граница курса (включительно)"),
+        user_data: User = Depends(get_current_user),
+) -> RatesCountResponse:
+    """Возвращает количество банков с курсом в диапазоне [min_rate, max_rate]."""
+    currency_type = validate_currency_type(currency_type)
+    _validate_range(min_rate, max_rate)
+    count = _get_current_snapshot().count_in_range(currency_type, operation, min_rate, max_rate)
+    return RatesCountResponse(count=count)
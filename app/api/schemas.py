@@ -1,5 +1,12 @@
 from datetime import datetime
-from pydantic import BaseModel, ConfigDict
+import logging
+from operator import attrgetter
+from typing import NamedTuple
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+
+
+log = logging.getLogger(__name__)
 
 
 class CurrencyRateSchema(BaseModel):
@@ -11,10 +18,48 @@ class CurrencyRateSchema(BaseModel):
     eur_buy: float
     eur_sell: float
     update_time: str
+    quoted_at: datetime | None = None
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class RawCurrencyRate(NamedTuple):
+    """
+    Курсы банка на пути парсер -> БД: кортеж без словаря атрибутов и без валидации при создании.
+    Порядок полей совпадает с CurrencyRateSchema и колонками CurrencyRateDAO.public_columns.
+    """
+    link: str
+    bank_en: str
+    bank_name: str
+    usd_buy: float
+    usd_sell: float
+    eur_buy: float
+    eur_sell: float
+    update_time: str
+    quoted_at: datetime | None = None
+
+
+raw_rates_adapter = TypeAdapter(list[RawCurrencyRate])
+_raw_rate_values = attrgetter(*RawCurrencyRate._fields)
+
+
+def as_raw_rate(record) -> RawCurrencyRate:
+    """Приводит запись (RawCurrencyRate, схему pydantic или ORM-объект) к RawCurrencyRate."""
+    if isinstance(record, RawCurrencyRate):
+        return record
+    return RawCurrencyRate._make(_raw_rate_values(record))
+
+
+def validate_raw_rates(records: list[RawCurrencyRate]) -> list[RawCurrencyRate]:
+    """Пакетная валидация записей парсера одним вызовом TypeAdapter; некорректные записи пропускаются."""
+    try:
+        return raw_rates_adapter.validate_python(records)
+    except ValidationError as e:
+        invalid = {error["loc"][0] for error in e.errors()}
+        log.warning("Пропущено некорректных записей: %s. Ошибки: %s", len(invalid), e.errors()[:3])
+        return raw_rates_adapter.validate_python([r for i, r in enumerate(records) if i not in invalid])
+
+
 class AdminCurrencySchema(CurrencyRateSchema):
     id: int
     created_at: datetime
@@ -25,10 +70,85 @@ class BankNameSchema(BaseModel):
     bank_en: str
 
 
+class BankNamesSchema(BaseModel):
+    bank_en: list[str] = Field(min_length=1, description="Названия банков на английском языке")
+
+
+class BanksCurrencyResponse(BaseModel):
+    banks: list[CurrencyRateSchema]
+    missing: list[str]
+
+
+class BankSearchResult(CurrencyRateSchema):
+    score: float
+
+
 class BestRateResponse(BaseModel):
     rate: float
     banks: list[str]
 
 
+class RatesCountResponse(BaseModel):
+    count: int
+
+
+class SyncResult(BaseModel):
+    """Итог синхронизации курсов с myfin: сколько банков добавлено, изменено, удалено."""
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    changed_banks: set[str] = Field(default_factory=set, exclude=True)
+    # банки в БД до синхронизации и банки, встреченные в записанных пакетах
+    known_banks: set[str] = Field(default_factory=set, exclude=True)
+    seen_banks: set[str] = Field(default_factory=set, exclude=True)
+    # банки на каждой синхронизированной странице myfin (заполняется при синхронизации)
+    page_banks: dict[int, set[str]] = Field(default_factory=dict, exclude=True)
+
+    @property
+    def total(self) -> int:
+        """Количество банков в результате синхронизации (без дублирований)."""
+        return self.added + self.updated + self.unchanged
+
+    @property
+    def change_ratio(self) -> float:
+        """Доля банков, данные которых изменились."""
+        return (self.added + self.updated + self.deleted) / max(self.total + self.deleted, 1)
+
+
 class Message(BaseModel):
-    text: str
\ No newline at end of file
+    text: str
+
+
+class RateSideStats(BaseModel):
+    best: float
+    worst: float
+    mean: float
+    median: float
+    p10: float
+    p90: float
+    stdev: float
+
+
+class SpreadStats(BaseModel):
+    best: float
+    worst: float
+    mean: float
+    median: float
+
+
+class MarketStatsSchema(BaseModel):
+    banks_count: int
+    buy: RateSideStats
+    sell: RateSideStats
+    spread: SpreadStats
+
+
+class MarketStatsResponse(MarketStatsSchema):
+    currency: str
+    version: int
+    computed_at: datetime
+    within_pct: float
+    buy_within_best: int
+    sell_within_best: int
+    delta: MarketStatsSchema | None = None
@@ -0,0 +1,121 @@
+import heapq
+import re
+from collections import Counter
+from typing import Iterable
+
+from app.api.schemas import CurrencyRateSchema
+
+
+_WORD_RE = re.compile(r"[0-9a-zа-я]+")
+
+# слова, встречающиеся почти в каждом названии: не индексируем, иначе они совпадают со всеми банками
+_STOP_WORDS = frozenset({"банк", "bank", "ао", "пао", "ооо", "кб", "акб", "ткб"})
+
+
+def _normalize(text: str) -> str:
+    """Приводит строку к нижнему регистру и заменяет ё на е."""
+    return text.lower().replace("ё", "е")
+
+
+def _words(text: str) -> list[str]:
+    """Разбивает строку на значимые слова из букв и цифр."""
+    return [word for word in _WORD_RE.findall(_normalize(text)) if word not in _STOP_WORDS]
+
+
+def _trigrams(words: Iterable[str]) -> set[str]:
+    """Триграммы слов с дополнением пробелами по краям, как в pg_trgm."""
+    result = set()
+    for word in words:
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class BankSearchIndex:
+    """
+    Инвертированный триграммный индекс по bank_name и bank_en для нечеткого и префиксного поиска банков.
+    Обновляется инкрементально: при синхронизации переиндексируются только добавленные,
+    удаленные и переименованные банки.
+    """
+
+    def __init__(self):
+        self._postings: dict[str, set[str]] = {}
+        self._doc_trigrams: dict[str, set[str]] = {}
+        self._doc_words: dict[str, tuple[str, ...]] = {}
+        self._doc_names: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_names)
+
+    def add(self, bank_en: str, bank_name: str) -> None:
+        """Добавляет банк в индекс (или переиндексирует при смене названия)."""
+        if bank_en in self._doc_names:
+            if self._doc_names[bank_en] == bank_name:
+                return
+            self.remove(bank_en)
+
+        words = tuple(dict.fromkeys(_words(bank_name) + _words(bank_en)))
+        trigrams = _trigrams(words)
+        for trigram in trigrams:
+            self._postings.setdefault(trigram, set()).add(bank_en)
+
+        self._doc_trigrams[bank_en] = trigrams
+        self._doc_words[bank_en] = words
+        self._doc_names[bank_en] = bank_name
+
+    def remove(self, bank_en: str) -> None:
+        """Удаляет банк из индекса."""
+        for trigram in self._doc_trigrams.pop(bank_en, ()):
+            postings = self._postings[trigram]
+            postings.discard(bank_en)
+            if not postings:
+                del self._postings[trigram]
+        self._doc_words.pop(bank_en, None)
+        self._doc_names.pop(bank_en, None)
+
+    def sync(self, records: Iterable[CurrencyRateSchema]) -> tuple[int, int]:
+        """
+        Приводит индекс в соответствие со списком банков.
+        Возвращает количество добавленных (или переименованных) и удаленных банков.
+        """
+        return self.sync_names({record.bank_en: record.bank_name for record in records})
+
+    def sync_names(self, names: dict[str, str]) -> tuple[int, int]:
+        """То же, что sync, по готовому словарю {bank_en: bank_name}."""
+        removed = self._doc_names.keys() - names.keys()
+        for bank_en in removed:
+            self.remove(bank_en)
+
+        changed = [bank_en for bank_en, bank_name in names.items() if self._doc_names.get(bank_en) != bank_name]
+        for bank_en in changed:
+            self.add(bank_en, names[bank_en])
+
+        return len(changed), len(removed)
+
+    def search(self, query: str, limit: int = 10, min_score: float = 0.3) -> list[tuple[str, float]]:
+        """
+        Ищет банки по части или искаженному названию.
+        Возвращает пары (bank_en, score), где score - доля совпавших триграмм запроса,
+        а банки, название которых начинается с запроса, получают дополнительный балл.
+        """
+        query_words = _words(query)
+        query_trigrams = _trigrams(query_words)
+        if not query_trigrams:
+            return []
+
+        matches = Counter()
+        for trigram in query_trigrams:
+            matches.update(self._postings.get(trigram, ()))
+
+        prefix = " ".join(query_words)
+        results = []
+        for bank_en, shared in matches.items():
+            score = shared / len(query_trigrams)
+            if score < min_score:
+                continue
+            words = self._doc_words[bank_en]
+            if any(word.startswith(prefix) for word in words) or " ".join(words).startswith(prefix):
+                score += 1
+            results.append((bank_en, round(score, 4)))
+
+        return heapq.nsmallest(limit, results, key=lambda item: (-item[1], self._doc_names[item[0]]))
@@ -0,0 +1,288 @@
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Callable, Iterator, Mapping, Sequence
+
+import orjson
+
+from app.api.schemas import CurrencyRateSchema, MarketStatsSchema
+from app.api.snapshot import EncodedBody, RateSnapshot
+from app.config import settings
+
+
+log = logging.getLogger(__name__)
+
+
+# Формат файла (little-endian):
+#   заголовок: magic, версия данных, время создания, число записей, размер записи, хеш данных,
+#              7 секций (смещение, длина): записи, строки, порядок записей, статистика, тела identity / gzip / br
+#   записи фиксированной длины: 4 курса (double), время котировки (unix time, NaN - неизвестно)
+#   + 4 пары (смещение, длина) строк в секции строк
+#   секция строк: UTF-8 без разделителей
+#   порядок записей: для каждого поля с курсом (FLOAT_FIELDS) номера записей по возрастанию курса,
+#                    затем номера записей по возрастанию bank_en (uint32)
+#   статистика: JSON {валюта: MarketStatsSchema}
+MAGIC = b"CRSNAP04"
+HEADER = struct.Struct("<8sQdII16s14Q")
+RECORD = struct.Struct("<5d8I")
+INDEX = struct.Struct("<I")
+# отдельные поля записи: курс или время котировки, ссылка (смещение, длина) на строку
+DOUBLE = struct.Struct("<d")
+STRING_REF = struct.Struct("<II")
+
+FLOAT_FIELDS = ("usd_buy", "usd_sell", "eur_buy", "eur_sell")
+STR_FIELDS = ("bank_name", "bank_en", "link", "update_time")
+ORDER_FIELDS = (*FLOAT_FIELDS, "bank_en")
+BODY_ENCODINGS = ("identity", "gzip", "br")
+# ссылки на строки идут в записи после курсов и времени котировки
+STRING_REFS_OFFSET = (len(FLOAT_FIELDS) + 1) * DOUBLE.size
+
+
+def encode_snapshot(snapshot: RateSnapshot, version: int) -> bytes:
+    """Сериализует снимок в компактный бинарный формат с записями фиксированной длины."""
+    strings = bytearray()
+    records = bytearray(RECORD.size * len(snapshot.records))
+
+    for i, record in enumerate(snapshot.records):
+        refs = []
+        for field in STR_FIELDS:
+            value = getattr(record, field).encode("utf-8")
+            refs.extend((len(strings), len(value)))
+            strings += value
+        quoted_at = record.quoted_at.timestamp() if record.quoted_at else math.nan
+        RECORD.pack_into(
+            records, i * RECORD.size, *(getattr(record, field) for field in FLOAT_FIELDS), quoted_at, *refs
+        )
+
+    position = {id(record): i for i, record in enumerate(snapshot.records)}
+    orders = [[position[id(record)] for record in snapshot.sorted_records[field]] for field in FLOAT_FIELDS]
+    orders.append(sorted(range(len(snapshot.records)), key=lambda i: snapshot.records[i].bank_en))
+    indexes = b"".join(struct.pack(f"<{len(order)}I", *order) for order in orders)
+    stats = orjson.dumps({currency_type: stats.model_dump() for currency_type, stats in snapshot.stats.items()})
+
+    sections = [bytes(records), bytes(strings), indexes, stats]
+    sections.extend(snapshot.all_currency_body.variants[encoding] for encoding in BODY_ENCODINGS)
+
+    offsets, position = [], HEADER.size
+    for section in sections:
+        offsets.extend((position, len(section)))
+        position += len(section)
+
+    header = HEADER.pack(
+        MAGIC,
+        version,
+        snapshot.created_at.timestamp(),
+        len(snapshot.records),
+        RECORD.size,
+        snapshot.data_hash.encode("ascii"),
+        *offsets,
+    )
+    return header + b"".join(sections)
+
+
+def _uint32_array(view: memoryview) -> Sequence[int]:
+    """Массив uint32 из секции файла: на little-endian платформах - без копирования."""
+    if sys.byteorder == "little":
+        return view.cast("I")
+    return [value for value, in INDEX.iter_unpack(view)]
+
+
+class _MappedSequence(Sequence):
+    """
+    Последовательность поверх записей отображенного файла в заданном порядке (номера записей uint32):
+    элемент читается из записи при обращении, срез возвращает кортеж только своих элементов.
+    """
+
+    def __init__(self, read: Callable[[int], Any], count: int, order: Sequence[int] | None = None):
+        self._read = read
+        self._count = count
+        self._order = order
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self[j] for j in range(*i.indices(self._count)))
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return self._read(self._order[i] if self._order is not None else i)
+
+
+class _MappedBanks(Mapping):
+    """Записи по bank_en: двоичный поиск по отсортированным названиям вместо словаря на все банки."""
+
+    def __init__(self, names: Sequence[str], records: Sequence[CurrencyRateSchema]):
+        self._names = names
+        self._records = records
+
+    def _find(self, bank_en: str) -> int | None:
+        i = bisect_left(self._names, bank_en)
+        return i if i < len(self._names) and self._names[i] == bank_en else None
+
+    def __contains__(self, bank_en) -> bool:
+        return self._find(bank_en) is not None
+
+    def __getitem__(self, bank_en: str) -> CurrencyRateSchema:
+        i = self._find(bank_en)
+        if i is None:
+            raise KeyError(bank_en)
+        return self._records[i]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+class MappedRateSnapshot(RateSnapshot):
+    """
+    Снимок курсов, читаемый прямо из буфера (отображенного в память файла).
+    Записи не разбираются при загрузке и не копируются в память процесса: записи, курсы, время котировки
+    и названия банков распаковываются из строк фиксированной длины при обращении, а порядок по курсам
+    и по bank_en - массивы uint32 из файла. Поиск по bank_en и диапазону курса - двоичный поиск по ним.
+    Сжатые тела ответа - срезы буфера и отдаются клиентам без копирования.
+    Буфер должен жить вместе со снимком (срезы держат отображение открытым).
+    """
+
+    def __init__(self, buffer):
+        magic, version, created_at, count, record_size, data_hash, *offsets = HEADER.unpack_from(buffer)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError("Неизвестный формат файла снимка курсов")
+
+        view = memoryview(buffer)
+        sections = [view[offset:offset + length] for offset, length in zip(offsets[::2], offsets[1::2])]
+        self._records_view, self._strings_view, indexes_view, stats_view = sections[:4]
+
+        size = count * INDEX.size
+        orders = {
+            field: _uint32_array(indexes_view[i * size:(i + 1) * size]) for i, field in enumerate(ORDER_FIELDS)
+        }
+
+        self.version = version
+        self.created_at = datetime.fromtimestamp(created_at, tz=timezone.utc)
+        self.data_hash = data_hash.decode("ascii")
+        self.etag = f'W/"{self.data_hash}"'
+        self.all_currency_body = EncodedBody(b"", variants=dict(zip(BODY_ENCODINGS, sections[4:])))
+
+        self.records = _MappedSequence(self._record, count)
+        self.by_bank_en = _MappedBanks(
+            _MappedSequence(partial(self._string, "bank_en"), count, orders["bank_en"]),
+            _MappedSequence(self._record, count, orders["bank_en"]),
+        )
+        self._orders = orders
+        self.sorted_values = {
+            field: _MappedSequence(partial(self._float, FLOAT_FIELDS.index(field)), count, orders[field])
+            for field in FLOAT_FIELDS
+        }
+        self.sorted_records = {field: _MappedSequence(self._record, count, orders[field]) for field in FLOAT_FIELDS}
+        # статистика посчитана при записи файла
+        self.stats = {
+            currency_type: MarketStatsSchema.model_validate(value)
+            for currency_type, value in orjson.loads(stats_view).items()
+        }
+
+    def _float(self, column: int, position: int) -> float:
+        """Курс (или время котировки) записи position без распаковки остальных полей."""
+        return DOUBLE.unpack_from(self._records_view, position * RECORD.size + column * DOUBLE.size)[0]
+
+    def _string(self, field: str, position: int) -> str:
+        """Строковое поле записи position."""
+        offset, length = STRING_REF.unpack_from(
+            self._records_view, position * RECORD.size + STRING_REFS_OFFSET + STR_FIELDS.index(field) * STRING_REF.size
+        )
+        return str(self._strings_view[offset:offset + length], "utf-8")
+
+    def _record(self, position: int) -> CurrencyRateSchema:
+        values = RECORD.unpack_from(self._records_view, position * RECORD.size)
+        rates, quoted_at, refs = values[:4], values[4], values[5:]
+        data = dict(zip(FLOAT_FIELDS, rates))
+        data["quoted_at"] = None if math.isnan(quoted_at) else datetime.fromtimestamp(quoted_at, tz=timezone.utc)
+        for field, offset, length in zip(STR_FIELDS, refs[::2], refs[1::2]):
+            data[field] = str(self._strings_view[offset:offset + length], "utf-8")
+        # данные записаны этим же приложением после валидации, повторная проверка не нужна
+        return CurrencyRateSchema.model_construct(**data)
+
+    def bank_names(self) -> dict[str, str]:
+        return {
+            self._string("bank_en", position): self._string("bank_name", position)
+            for position in range(len(self.records))
+        }
+
+    def _sorted_quoted_at(self, field: str) -> Sequence[float]:
+        return _MappedSequence(partial(self._float, len(FLOAT_FIELDS)), len(self.records), self._orders[field])
+
+
+def decode_snapshot(buffer) -> RateSnapshot:
+    """Снимок из буфера с файлом снимка (см. MappedRateSnapshot)."""
+    return MappedRateSnapshot(buffer)
+
+
+class SharedSnapshotFile:
+    """
+    Снимок курсов в общем файле для всех процессов-воркеров.
+    Пишет один процесс (выполняющий синхронизацию): файл целиком подменяется через os.replace,
+    поэтому читатели всегда видят согласованную версию. Остальные процессы отображают файл
+    в память и читают заголовок; снимок загружается только при смене версии.
+    Отображение загруженной версии остается открытым, пока жив снимок: записи читаются,
+    а сжатые тела ответа отдаются прямо из него (подмена файла не затрагивает уже отображенную версию).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read_version(self) -> int:
+        """Версия данных в файле (0, если файла нет или он поврежден)."""
+        try:
+            with open(self.path, "rb") as file:
+                magic, version, *_ = HEADER.unpack(file.read(HEADER.size))
+            return version if magic == MAGIC else 0
+        except (FileNotFoundError, struct.error):
+            return 0
+
+    def write(self, snapshot: RateSnapshot) -> int:
+        """Записывает снимок в файл со следующей версией и возвращает эту версию."""
+        version = self.read_version() + 1
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(tmp_path, "wb") as file:
+            file.write(encode_snapshot(snapshot, version))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        log.info("Снимок курсов версии %s записан в %s", version, self.path)
+        return version
+
+    def load(self, known_version: int = 0) -> RateSnapshot | None:
+        """Загружает снимок из файла, если его версия новее known_version."""
+        try:
+            with open(self.path, "rb") as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError) as e:
+            log.debug("Снимок курсов из %s не загружен: %s", self.path, e)
+            return None
+        try:
+            magic, version, *_ = HEADER.unpack_from(mapped)
+            if magic != MAGIC or version <= known_version:
+                mapped.close()
+                return None
+            # отображение закроется вместе со снимком, когда освободятся его срезы
+            return decode_snapshot(mapped)
+        except (ValueError, struct.error) as e:
+            log.debug("Снимок курсов из %s не загружен: %s", self.path, e)
+            return None
+
+
+# Общий файл снимка, если он включен в настройках
+shared_snapshot_file = (
+    SharedSnapshotFile(os.path.join(settings.BASE_DIR, settings.SNAPSHOT_PATH)) if settings.SNAPSHOT_PATH else None
+)
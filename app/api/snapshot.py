@@ -0,0 +1,375 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import math
+import statistics
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from operator import attrgetter, itemgetter
+from typing import Iterable, Mapping, Sequence
+
+import brotli
+import orjson
+
+from app.api.schemas import (
+    BankSearchResult,
+    CurrencyRateSchema,
+    MarketStatsResponse,
+    MarketStatsSchema,
+    RateSideStats,
+    SpreadStats
+)
+from app.api.search import BankSearchIndex
+from app.config import settings
+
+
+log = logging.getLogger(__name__)
+
+
+# погрешность сравнения курсов, чтобы 74.3 + 0.2 попадало в диапазон до 74.5
+_EPSILON = 1e-9
+
+
+def _percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Перцентиль по отсортированному массиву с линейной интерполяцией (как numpy.percentile)."""
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _side_stats(sorted_values: Sequence[float], operation: str) -> RateSideStats:
+    """Статистика по одной стороне курса (покупка или продажа)."""
+    # для покупки лучший курс минимальный, для продажи - максимальный
+    best, worst = (sorted_values[-1], sorted_values[0]) if operation == 'sell' else (sorted_values[0], sorted_values[-1])
+    return RateSideStats(
+        best=best,
+        worst=worst,
+        mean=statistics.fmean(sorted_values),
+        median=_percentile(sorted_values, 50),
+        p10=_percentile(sorted_values, 10),
+        p90=_percentile(sorted_values, 90),
+        stdev=statistics.pstdev(sorted_values),
+    )
+
+
+def _diff(current: dict, previous: dict) -> dict:
+    """Поэлементная разница двух словарей статистики (рекурсивно)."""
+    return {
+        key: _diff(value, previous[key]) if isinstance(value, dict) else value - previous[key]
+        for key, value in current.items()
+    }
+
+
+class EncodedBody:
+    """JSON-тело ответа, заранее сериализованное и сжатое в gzip и brotli."""
+
+    def __init__(self, content: bytes, variants: dict[str, bytes | memoryview] | None = None):
+        # готовые варианты (срезы отображенного в память файла) передаются,
+        # когда снимок загружается из общего файла
+        self.variants: dict[str, bytes | memoryview] = variants or {
+            "identity": content,
+            "gzip": gzip.compress(content, compresslevel=9, mtime=0),
+            "br": brotli.compress(content, quality=11, mode=brotli.MODE_TEXT),
+        }
+
+
+class RateSnapshot:
+    """
+    Неизменяемый снимок курсов валют, публикуемый после каждой синхронизации.
+    Все производные структуры (отсортированные массивы, статистика) строятся один раз при создании.
+    Снимок из общего файла (MappedRateSnapshot) подставляет вместо них последовательности,
+    читающие записи из отображенного файла при обращении: методы ниже работают с ними без изменений.
+    """
+
+    def __init__(
+            self,
+            records: Iterable[CurrencyRateSchema],
+            version: int = 0,
+            created_at: datetime | None = None,
+            data_hash: str | None = None,
+            all_currency_body: EncodedBody | None = None,
+    ):
+        self.records: Sequence[CurrencyRateSchema] = tuple(records)
+        self.version = version
+        self.created_at = created_at or datetime.now(timezone.utc)
+        self.by_bank_en: Mapping[str, CurrencyRateSchema] = {record.bank_en: record for record in self.records}
+        # версия данных - хеш содержимого, одинаковый во всех процессах с одинаковыми курсами
+        self.data_hash = data_hash or self._data_hash()
+        self.etag = f'W/"{self.data_hash}"'
+        # тело ответа /api/all_currency/, сериализуется и сжимается один раз за синхронизацию
+        self.all_currency_body = all_currency_body or EncodedBody(
+            orjson.dumps([record.model_dump() for record in self.records])
+        )
+
+        # отсортированные по возрастанию значения каждого поля с курсом и соответствующие им записи
+        self.sorted_values: dict[str, Sequence[float]] = {}
+        self.sorted_records: dict[str, Sequence[CurrencyRateSchema]] = {}
+        for fields in settings.CURRENCY_FIELDS.values():
+            for field in fields.values():
+                ordered = sorted(self.records, key=attrgetter(field))
+                self.sorted_records[field] = tuple(ordered)
+                self.sorted_values[field] = [getattr(record, field) for record in ordered]
+        self.stats: dict[str, MarketStatsSchema] = {
+            currency_type: self._market_stats(currency_type)
+            for currency_type in settings.CURRENCY_FIELDS
+        } if self.records else {}
+
+    def _data_hash(self) -> str:
+        """Хеш курсов всех банков, не зависящий от порядка записей."""
+        payload = sorted((record.model_dump() for record in self.records), key=itemgetter("bank_en"))
+        return hashlib.blake2b(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS), digest_size=8).hexdigest()
+
+    def _market_stats(self, currency_type: str) -> MarketStatsSchema:
+        """Считает статистику рынка по валюте среди всех банков."""
+        fields = settings.CURRENCY_FIELDS[currency_type]
+        spreads = sorted(
+            getattr(record, fields['sell']) - getattr(record, fields['buy'])
+            for record in self.records
+        )
+        return MarketStatsSchema(
+            banks_count=len(self.records),
+            buy=_side_stats(self.sorted_values[fields['buy']], 'buy'),
+            sell=_side_stats(self.sorted_values[fields['sell']], 'sell'),
+            spread=SpreadStats(
+                best=spreads[0],
+                worst=spreads[-1],
+                mean=statistics.fmean(spreads),
+                median=_percentile(spreads, 50),
+            ),
+        )
+
+    def bank_names(self) -> dict[str, str]:
+        """Названия банков по bank_en (для поискового индекса)."""
+        return {record.bank_en: record.bank_name for record in self.records}
+
+    def _sorted_quoted_at(self, field: str) -> Sequence[float]:
+        """Время котировки (unix time, NaN - неизвестно) записей в порядке возрастания курса field."""
+        return [
+            record.quoted_at.timestamp() if record.quoted_at else math.nan
+            for record in self.sorted_records[field]
+        ]
+
+    def _bounds(self, field: str, min_rate: float | None, max_rate: float | None) -> tuple[int, int]:
+        """Границы среза отсортированного массива с курсами в диапазоне [min_rate, max_rate] за O(log n)."""
+        values = self.sorted_values[field]
+        lo = bisect_left(values, min_rate - _EPSILON) if min_rate is not None else 0
+        hi = bisect_right(values, max_rate + _EPSILON) if max_rate is not None else len(values)
+        return lo, max(lo, hi)
+
+    def _near_best_bounds(self, currency_type: str, operation: str, tolerance: float) -> tuple[int, int]:
+        """Границы среза с курсами, отличающимися от лучшего не более чем на tolerance."""
+        field = settings.CURRENCY_FIELDS[currency_type][operation]
+        values = self.sorted_values[field]
+        if not values:
+            return 0, 0
+        if operation == 'sell':
+            return self._bounds(field, values[-1] - tolerance, None)
+        return self._bounds(field, None, values[0] + tolerance)
+
+    def rates_in_range(
+            self,
+            currency_type: str,
+            operation: str,
+            min_rate: float | None = None,
+            max_rate: float | None = None,
+    ) -> tuple[CurrencyRateSchema, ...]:
+        """Банки с курсом в диапазоне [min_rate, max_rate], отсортированные по возрастанию курса."""
+        field = settings.CURRENCY_FIELDS[currency_type][operation]
+        lo, hi = self._bounds(field, min_rate, max_rate)
+        return self.sorted_records[field][lo:hi]
+
+    def count_in_range(
+            self,
+            currency_type: str,
+            operation: str,
+            min_rate: float | None = None,
+            max_rate: float | None = None,
+    ) -> int:
+        """Количество банков с курсом в диапазоне [min_rate, max_rate]."""
+        lo, hi = self._bounds(settings.CURRENCY_FIELDS[currency_type][operation], min_rate, max_rate)
+        return hi - lo
+
+    def _fresh_near_best(
+            self,
+            currency_type: str,
+            operation: str,
+            tolerance: float,
+            max_age: int,
+    ) -> tuple[CurrencyRateSchema, ...]:
+        """
+        Банки со свежими курсами (обновлены за max_age минут, без времени котировки - исключаются)
+        в пределах tolerance от лучшего среди них, по возрастанию курса. Просмотр всех записей - O(n).
+        """
+        field = settings.CURRENCY_FIELDS[currency_type][operation]
+        cutoff = (datetime.now(timezone.utc) - timedelta(minutes=max_age)).timestamp()
+        # NaN (время котировки неизвестно) не проходит сравнение
+        positions = [i for i, quoted_at in enumerate(self._sorted_quoted_at(field)) if quoted_at >= cutoff]
+        if not positions:
+            return ()
+        values = [self.sorted_values[field][i] for i in positions]
+        if operation == 'sell':
+            positions = positions[bisect_left(values, values[-1] - tolerance - _EPSILON):]
+        else:
+            positions = positions[:bisect_right(values, values[0] + tolerance + _EPSILON)]
+        records = self.sorted_records[field]
+        return tuple(records[i] for i in positions)
+
+    def near_best(
+            self,
+            currency_type: str,
+            operation: str,
+            tolerance: float,
+            max_age: int | None = None,
+    ) -> tuple[CurrencyRateSchema, ...]:
+        """Банки с курсом в пределах tolerance от лучшего, начиная с лучшего (с max_age - среди свежих курсов)."""
+        if max_age is not None:
+            records = self._fresh_near_best(currency_type, operation, tolerance, max_age)
+        else:
+            field = settings.CURRENCY_FIELDS[currency_type][operation]
+            lo, hi = self._near_best_bounds(currency_type, operation, tolerance)
+            records = self.sorted_records[field][lo:hi]
+        return records[::-1] if operation == 'sell' else records
+
+    def count_near_best(self, currency_type: str, operation: str, tolerance: float, max_age: int | None = None) -> int:
+        """Количество банков с курсом в пределах tolerance от лучшего (с max_age - среди свежих курсов)."""
+        if max_age is not None:
+            return len(self._fresh_near_best(currency_type, operation, tolerance, max_age))
+        lo, hi = self._near_best_bounds(currency_type, operation, tolerance)
+        return hi - lo
+
+    def count_within_best(self, currency_type: str, operation: str, pct: float) -> int:
+        """Количество банков, чей курс отличается от лучшего не более чем на pct процентов."""
+        values = self.sorted_values[settings.CURRENCY_FIELDS[currency_type][operation]]
+        if not values:
+            return 0
+        best = values[-1] if operation == 'sell' else values[0]
+        return self.count_near_best(currency_type, operation, abs(best) * pct / 100)
+
+
+class RateSnapshotStore:
+    """Хранилище актуального снимка курсов и статистики предыдущей синхронизации."""
+
+    def __init__(self):
+        self.current: RateSnapshot | None = None
+        self.deltas: dict[str, MarketStatsSchema] = {}
+        self.search_index = BankSearchIndex()
+        # время следующей плановой синхронизации, выставляется планировщиком
+        self.next_sync_at: datetime | None = None
+        # последняя версия общего файла снимка, записанная или прочитанная этим процессом
+        self.shared_version = 0
+        # время последней известной процессу синхронизации с myfin (None - данные загружены с диска или из базы)
+        self.synced_at: datetime | None = None
+
+    def max_age(self) -> int:
+        """Сколько секунд текущий снимок останется актуальным (до следующей синхронизации)."""
+        if not self.next_sync_at:
+            return 0
+        return max(0, int((self.next_sync_at - datetime.now(timezone.utc)).total_seconds()))
+
+    def freshness(self) -> str:
+        """
+        Состояние данных для readiness: empty - курсов нет, stale - снимок загружен при старте
+        или последняя синхронизация была давно, fresh - данные недавней синхронизации.
+        """
+        if not self.current or not self.current.records:
+            return "empty"
+        if not self.synced_at:
+            return "stale"
+        age = datetime.now(timezone.utc) - self.synced_at
+        return "fresh" if age.total_seconds() <= settings.SNAPSHOT_STALE_AFTER_MINUTES * 60 else "stale"
+
+    def publish(self, records: Iterable[CurrencyRateSchema]) -> RateSnapshot:
+        """Строит и публикует новый снимок курсов."""
+        return self.publish_snapshot(RateSnapshot(records))
+
+    async def publish_in_thread(
+            self,
+            records: Iterable[CurrencyRateSchema],
+            shared=None,
+            synced: bool = True,
+    ) -> RateSnapshot:
+        """
+        Строит снимок в отдельном потоке (сортировки, статистика, сжатие тел занимают сотни мс),
+        чтобы не блокировать event loop, и публикует его.
+        Если передан общий файл снимка (SharedSnapshotFile), снимок записывается и в него для других процессов.
+        synced=False - данные не из только что выполненной синхронизации (например, загружены из базы при старте).
+        """
+        snapshot = await asyncio.to_thread(RateSnapshot, list(records))
+        version = None
+        if shared:
+            version = self.shared_version = await asyncio.to_thread(shared.write, snapshot)
+        if synced:
+            self.synced_at = snapshot.created_at
+        return self.publish_snapshot(snapshot, version)
+
+    async def refresh_from(self, shared) -> RateSnapshot | None:
+        """Загружает из общего файла снимок, опубликованный другим процессом, если он новее текущего."""
+        snapshot = await asyncio.to_thread(shared.load, self.shared_version)
+        if snapshot is None:
+            return None
+        self.shared_version = snapshot.version
+        self.synced_at = snapshot.created_at
+        if self.current and self.current.data_hash == snapshot.data_hash:
+            # те же данные уже загружены из базы
+            return None
+        return self.publish_snapshot(snapshot, snapshot.version)
+
+    def publish_snapshot(self, snapshot: RateSnapshot, version: int | None = None) -> RateSnapshot:
+        """Публикует готовый снимок и считает изменения статистики относительно предыдущего."""
+        previous = self.current
+        snapshot.version = version or (previous.version + 1 if previous else 1)
+
+        deltas = {}
+        if previous:
+            for currency_type, stats in snapshot.stats.items():
+                if currency_type in previous.stats:
+                    deltas[currency_type] = MarketStatsSchema(**_diff(
+                        stats.model_dump(), previous.stats[currency_type].model_dump()
+                    ))
+
+        added, removed = self.search_index.sync_names(snapshot.bank_names())
+        log.debug("Поисковый индекс банков: добавлено %s, удалено %s", added, removed)
+
+        self.current, self.deltas = snapshot, deltas
+        log.info("Опубликован снимок курсов: версия %s, банков %s", snapshot.version, len(snapshot.records))
+        return snapshot
+
+    def clear(self) -> None:
+        self.current = None
+        self.deltas = {}
+        self.search_index = BankSearchIndex()
+        self.next_sync_at = None
+        self.shared_version = 0
+        self.synced_at = None
+
+    def search_banks(self, query: str, limit: int) -> list[BankSearchResult]:
+        """Нечеткий поиск банков по названию с текущими курсами."""
+        snapshot = self.current
+        if not snapshot:
+            return []
+        return [
+            BankSearchResult(**snapshot.by_bank_en[bank_en].model_dump(), score=score)
+            for bank_en, score in self.search_index.search(query, limit, settings.SEARCH_MIN_SCORE)
+        ]
+
+    def market_stats(self, currency_type: str, within_pct: float) -> MarketStatsResponse | None:
+        """Статистика рынка по валюте из текущего снимка вместе с изменениями с прошлой синхронизации."""
+        snapshot = self.current
+        if not snapshot or currency_type not in snapshot.stats:
+            return None
+        return MarketStatsResponse(
+            **snapshot.stats[currency_type].model_dump(),
+            currency=currency_type,
+            version=snapshot.version,
+            computed_at=snapshot.created_at,
+            within_pct=within_pct,
+            buy_within_best=snapshot.count_within_best(currency_type, 'buy', within_pct),
+            sell_within_best=snapshot.count_within_best(currency_type, 'sell', within_pct),
+            delta=self.deltas.get(currency_type),
+        )
+
+
+# Снимок курсов валют, общий для всего приложения
+rate_snapshot = RateSnapshotStore()
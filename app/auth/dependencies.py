@@ -33,6 +33,18 @@ def get_refresh_token(request: Request) -> str:
     return token
 
 
+def has_valid_access_token(request: Request) -> bool:
+    """Проверяем подпись и срок действия access_token из кук без обращения к БД."""
+    token = request.cookies.get("user_access_token")
+    if not token:
+        return False
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return False
+    return payload.get("type") == "access" and bool(payload.get("sub"))
+
+
 async def check_refresh_token(
         token: str = Depends(get_refresh_token),
         session: AsyncSession = SessionDep
@@ -61,15 +73,12 @@ async def get_current_user(token: str = Depends(get_access_token), session: Asyn
 
     # получаем expire - время действия токена в секундах
     expire = payload.get("exp")
-    print(f"{expire=}")
 
     # получаем expire_time - время завершения действия токена 
     expire_time = datetime.fromtimestamp(int(expire), tz=timezone.utc)
-    print(f"{expire_time=}")
 
     # получаем текущее время
     time_now = datetime.now(timezone.utc)
-    print(f"{time_now=}")
     if not expire or expire_time < time_now:                 
         raise TokenExpiredException                                           
     
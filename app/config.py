@@ -1,6 +1,6 @@
 import os
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from app.logger import log
+from app.logger import configure_logging, log
 
 
 class Settings(BaseSettings):
@@ -18,12 +18,86 @@ class Settings(BaseSettings):
         "currency_type": "Некорректный тип валюты. Используйте 'usd' или 'eur'.",
         "range": "Неверно задан диапазон.",
         "not_found": "Не найдены курсы валют.",
-        "bank_not_found": "Банк не найден."
+        "bank_not_found": "Банк не найден.",
+        "too_many_banks": "Слишком много банков в одном запросе."
     }
     CURRENCY_FIELDS: dict = {
         'usd': {'buy': 'usd_buy', 'sell': 'usd_sell'},
         'eur': {'buy': 'eur_buy', 'sell': 'eur_sell'}
     }
+    # начальный интервал синхронизации курсов с myfin в минутах
+    SYNC_INTERVAL_MINUTES: int = 10
+    # границы адаптивного интервала (при равных значениях интервал фиксированный)
+    SYNC_INTERVAL_MIN_MINUTES: float = 2
+    SYNC_INTERVAL_MAX_MINUTES: float = 30
+    # к какой доле изменившихся банков за синхронизацию подстраивается интервал
+    SYNC_TARGET_CHANGE_RATIO: float = 0.2
+    # потоковая синхронизация: размер пакета записи в БД, сколько страниц может ждать парсера,
+    # сколько страниц загружается одновременно
+    SYNC_BATCH_SIZE: int = 100
+    SYNC_QUEUE_SIZE: int = 2
+    SYNC_FETCH_CONCURRENCY: int = 4
+    # проверять типы записей парсера (одним вызовом TypeAdapter на пакет) перед записью в БД
+    SYNC_VALIDATE_RECORDS: bool = True
+    # отдельный интервал для каждой страницы myfin: страницы с частыми изменениями опрашиваются чаще
+    SYNC_HOT_PAGES: bool = False
+    # общий для всех воркеров файл снимка курсов (None - каждый процесс хранит только свой снимок)
+    SNAPSHOT_PATH: str | None = "data/rates.snapshot"
+    # как часто воркеры проверяют новую версию снимка в общем файле, в секундах
+    SNAPSHOT_POLL_SECONDS: float = 2.0
+    # через сколько минут после последней синхронизации readiness сообщает, что данные устарели
+    SNAPSHOT_STALE_AFTER_MINUTES: int = 30
+    # False - курсы синхронизирует отдельный воркер (python -m app.parser sync), веб-процессы только читают
+    SYNC_IN_WEB: bool = True
+    # канал LISTEN/NOTIFY PostgreSQL для событий о завершении синхронизации
+    SYNC_EVENTS_CHANNEL: str = "rates_synced"
+    # синхронизацию выполняет один процесс-лидер: advisory lock в PostgreSQL, иначе блокировка файла
+    LEADER_LOCK_KEY: int = 720_145_001
+    LEADER_LOCK_PATH: str = "data/scheduler.lock"
+    # как часто лидер продлевает аренду, а остальные процессы пытаются стать лидером, в секундах
+    LEADER_RENEW_SECONDS: float = 5.0
+    # пул соединений с PostgreSQL: постоянные соединения, дополнительные при пиковой нагрузке,
+    # сколько секунд ждать свободное соединение, через сколько секунд переоткрывать соединение
+    # и проверять ли соединение перед выдачей (переподключение после рестарта БД без ошибок у клиентов)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 5.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # кеш подготовленных выражений asyncpg на соединение (0 - отключить, нужно для PgBouncer в режиме transaction)
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500
+    # профиль SQLite (SQLITE_PATH): журнал WAL, fsync только на контрольных точках, отображение файла
+    # в память (байты), кеш страниц (отрицательное значение - в КиБ), ожидание блокировки (мс)
+    # и единая очередь транзакций записи
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE: int = -64 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_SINGLE_WRITER: bool = True
+    # реплики для чтения (SQLAlchemy URL): на них идут сессии без коммита (SessionDep)
+    DB_REPLICA_URLS: list[str] = []
+    # сколько секунд после записи чтения в том же запросе (задаче) идут на основную БД, а не на реплику
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0
+    # строк в одном запросе пакетных методов BaseDAO (upsert_many, update_many, delete_many, copy_in)
+    DB_BULK_CHUNK_SIZE: int = 1000
+    # лучшие курсы из материализованного представления best_currency_rates (только PostgreSQL)
+    BEST_RATES_VIEW: bool = True
+    # сколько лучших банков хранит представление (как в миграции); при большем count - запрос к таблице
+    BEST_RATES_VIEW_TOP_N: int = 50
+    # допуск (в процентах) от лучшего курса для статистики рынка
+    STATS_WITHIN_PCT: float = 0.5
+    # максимальное количество банков в одном пакетном запросе
+    MAX_BATCH_BANKS: int = 500
+    # минимальная доля совпавших триграмм запроса при поиске банков
+    SEARCH_MIN_SCORE: float = 0.3
+    # уровень логов приложения и уровни отдельных модулей, например {"app.dao": "DEBUG", "sqlalchemy.engine": "INFO"}
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: dict[str, str] = {}
+    # из частых событий (на каждый запрос или банк) выводится одно из LOG_SAMPLE_EVERY
+    LOG_SAMPLE_EVERY: int = 100
+    # размер очереди записей для фонового вывода (при переполнении записи отбрасываются)
+    LOG_QUEUE_SIZE: int = 10000
     BASE_DIR: str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
     # SQLITE_PATH: str = "data/db.sqlite3" # раскомментировать, если используем sqlite3
     SQLITE_PATH: str | None = None 
@@ -39,4 +113,5 @@ class Settings(BaseSettings):
 
 settings = Settings()
 database_url = settings.DB_URL
-log.info(settings.DB_URL)
+configure_logging(settings.LOG_LEVEL, settings.LOG_LEVELS, settings.LOG_SAMPLE_EVERY, settings.LOG_QUEUE_SIZE)
+log.info("База данных: %s", database_url.split("@")[-1])
@@ -1,20 +1,52 @@
-from typing import Generic, List, Type, TypeVar
+import logging
+from typing import Any, Callable, Generic, Iterable, Iterator, List, Mapping, Sequence, Type, TypeVar
 
-from loguru import logger
+from asyncpg import InterfaceError, PostgresError
 from pydantic import BaseModel
+from sqlalchemy import bindparam, column, func, insert, values
 from sqlalchemy import delete as sqlalchemy_delete
-from sqlalchemy import func
 from sqlalchemy import update as sqlalchemy_update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Executable
 from sqlalchemy.future import select
 
+from app.config import settings
+from app.logger import SAMPLED
 from .database import Base
 
 
+log = logging.getLogger(__name__)
+
 # Объявляем типовой параметр T с ограничением, что это наследник Base
 T = TypeVar("T", bound=Base)
 
+# предел параметров одного запроса (SQLite - 32766, asyncpg - 32767)
+MAX_BIND_PARAMS = 32000
+
+# готовые запросы BaseDAO: (модель, вид запроса, колонки) -> запрос с bindparam вместо значений.
+# Запрос строится один раз, а ключ кеша компиляции SQLAlchemy запоминается в самом объекте запроса
+_statements: dict[tuple, Executable] = {}
+
+# INSERT ... ON CONFLICT для диалектов, которые его поддерживают
+UPSERT_INSERTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+
+
+def _chunks(items: Sequence, size: int) -> Iterator[Sequence]:
+    """Делит последовательность на части не больше size."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _group_by_columns(values_list: List[dict]) -> dict[tuple, List[dict]]:
+    """Группирует строки по набору колонок: пакетный запрос строится на один набор колонок."""
+    groups: dict[tuple, List[dict]] = {}
+    for values_dict in values_list:
+        groups.setdefault(tuple(values_dict), []).append(values_dict)
+    return groups
+
 
 class BaseDAO(Generic[T]):
     model: Type[T]
@@ -26,21 +58,59 @@ class BaseDAO(Generic[T]):
             raise ValueError(f"В классе {cls.__name__} должна быть указана модель")
 
 
+    @staticmethod
+    def _as_dicts(rows: Iterable[BaseModel | Mapping[str, Any]]) -> List[dict]:
+        """Строки для пакетных методов: pydantic-модели (только заданные поля) или словари колонок."""
+        return [row.model_dump(exclude_unset=True) if isinstance(row, BaseModel) else dict(row) for row in rows]
+
+    @classmethod
+    def _chunk_size(cls, columns: int) -> int:
+        """Размер пакета: не больше DB_BULK_CHUNK_SIZE строк и не больше MAX_BIND_PARAMS параметров."""
+        return max(1, min(settings.DB_BULK_CHUNK_SIZE, MAX_BIND_PARAMS // max(columns, 1)))
+
+    @classmethod
+    def _statement(cls, kind: str, keys: tuple, build: Callable[[], Executable]) -> Executable:
+        """Запрос из кеша по (модели, виду запроса, колонкам); строится при первом обращении."""
+        cache_key = (cls.model, kind, keys)
+        statement = _statements.get(cache_key)
+        if statement is None:
+            statement = _statements[cache_key] = build()
+        return statement
+
+    @staticmethod
+    def _filter_keys(filter_dict: dict) -> tuple[tuple[tuple[str, bool], ...], dict]:
+        """
+        Колонки фильтра для ключа кеша и значения параметров f_<колонка>.
+        None сравнивается через IS NULL, как в filter_by, и в параметры не попадает.
+        """
+        keys = tuple((name, value is None) for name, value in filter_dict.items())
+        params = {f"f_{name}": value for name, value in filter_dict.items() if value is not None}
+        return keys, params
+
+    @classmethod
+    def _where(cls, keys: tuple[tuple[str, bool], ...]) -> list:
+        """Условия фильтра для кешируемого запроса: значения приходят параметрами при выполнении."""
+        return [
+            getattr(cls.model, name).is_(None) if is_null else getattr(cls.model, name) == bindparam(f"f_{name}")
+            for name, is_null in keys
+        ]
+
+
     @classmethod
     async def find_one_or_none_by_id(cls, session: AsyncSession, data_id: int):
         """Найти одну запись по ID."""
-        logger.info(f"Поиск {cls.model.__name__} с ID: {data_id}")
+        log.debug("Поиск %s с ID: %s", cls.model.__name__, data_id, extra=SAMPLED)
         try:
-            query = select(cls.model).filter_by(id=data_id)
-            result = await session.execute(query)
+            query = cls._statement("by_id", (), lambda: select(cls.model).where(cls.model.id == bindparam("data_id")))
+            result = await session.execute(query, {"data_id": data_id})
             record = result.scalar_one_or_none()
             if record:
-                logger.info(f"Запись с ID {data_id} найдена.")
+                log.debug("Запись с ID %s найдена.", data_id, extra=SAMPLED)
             else:
-                logger.info(f"Запись с ID {data_id} не найдена.")
+                log.debug("Запись с ID %s не найдена.", data_id, extra=SAMPLED)
             return record
         except SQLAlchemyError as e:
-            logger.error(f"Ошибка при поиске записи с ID {data_id}: {e}")
+            log.error("Ошибка при поиске записи с ID %s: %s", data_id, e)
             raise
 
 
@@ -48,18 +118,19 @@ class BaseDAO(Generic[T]):
     async def find_one_or_none(cls, session: AsyncSession, filters: BaseModel):
         """Найти одну запись по фильтрам."""
         filter_dict = filters.model_dump(exclude_unset=True)
-        logger.info(f"Поиск одной записи {cls.model.__name__} по фильтрам: {filter_dict}")
+        log.debug("Поиск одной записи %s по фильтрам: %s", cls.model.__name__, filter_dict, extra=SAMPLED)
         try:
-            query = select(cls.model).filter_by(**filter_dict)
-            result = await session.execute(query)
+            keys, params = cls._filter_keys(filter_dict)
+            query = cls._statement("select", keys, lambda: select(cls.model).where(*cls._where(keys)))
+            result = await session.execute(query, params)
             record = result.scalar_one_or_none()
             if record:
-                logger.info(f"Найдена запись по фильтрам: {filter_dict}")
+                log.debug("Найдена запись по фильтрам: %s", filter_dict, extra=SAMPLED)
             else:
-                logger.info(f"Не найдена запись по фильтрам: {filter_dict}")
+                log.debug("Не найдена запись по фильтрам: %s", filter_dict, extra=SAMPLED)
             return record
         except SQLAlchemyError as e:
-            logger.error(f"Ошибка при поиске записи по фильтрам {filter_dict}: {e}")
+            log.error("Ошибка при поиске записи по фильтрам %s: %s", filter_dict, e)
             raise
 
 
@@ -70,15 +141,16 @@ class BaseDAO(Generic[T]):
             filter_dict = filters.model_dump(exclude_unset=True)
         else:
             filter_dict = {}
-        logger.info(f"Поиск всех записей {cls.model.__name__} по фильтрам: {filter_dict}")
+        log.debug("Поиск всех записей %s по фильтрам: %s", cls.model.__name__, filter_dict, extra=SAMPLED)
         try:
-            query = select(cls.model).filter_by(**filter_dict)
-            result = await session.execute(query)
+            keys, params = cls._filter_keys(filter_dict)
+            query = cls._statement("select", keys, lambda: select(cls.model).where(*cls._where(keys)))
+            result = await session.execute(query, params)
             records = result.scalars().all()
-            logger.info(f"Найдено {len(records)} записей.")
+            log.debug("Найдено %s записей.", len(records), extra=SAMPLED)
             return records
         except SQLAlchemyError as e:
-            logger.error(f"Ошибка при поиске всех записей по фильтрам {filter_dict}: {e}")
+            log.error("Ошибка при поиске всех записей по фильтрам %s: %s", filter_dict, e)
             raise
 
 
@@ -86,15 +158,15 @@ class BaseDAO(Generic[T]):
     async def add(cls, session: AsyncSession, values: BaseModel):
         """Добавить одну запись."""
         values_dict = values.model_dump(exclude_unset=True)
-        logger.info(f"Добавление записи {cls.model.__name__} с параметрами: {values_dict}")
+        log.debug("Добавление записи %s с параметрами: %s", cls.model.__name__, values_dict)
         new_instance = cls.model(**values_dict)
         session.add(new_instance)
         try:
             await session.flush()
-            logger.info(f"Запись {cls.model.__name__} успешно добавлена.")
+            log.debug("Запись %s успешно добавлена.", cls.model.__name__)
         except SQLAlchemyError as e:
             await session.rollback()
-            logger.error(f"Ошибка при добавлении записи: {e}")
+            log.error("Ошибка при добавлении записи: %s", e)
             raise e
         return new_instance
 
@@ -103,15 +175,15 @@ class BaseDAO(Generic[T]):
     async def add_many(cls, session: AsyncSession, instances: List[BaseModel]):
         """Добавить несколько записей."""
         values_list = [item.model_dump(exclude_unset=True) for item in instances]
-        logger.info(f"Добавление нескольких записей {cls.model.__name__}. Количество: {len(values_list)}")
+        log.debug("Добавление нескольких записей %s. Количество: %s", cls.model.__name__, len(values_list))
         new_instances = [cls.model(**values) for values in values_list]
         session.add_all(new_instances)
         try:
             await session.flush()
-            logger.info(f"Успешно добавлено {len(new_instances)} записей.")
+            log.debug("Успешно добавлено %s записей.", len(new_instances))
         except SQLAlchemyError as e:
             await session.rollback()
-            logger.error(f"Ошибка при добавлении нескольких записей: {e}")
+            log.error("Ошибка при добавлении нескольких записей: %s", e)
             raise e
         return new_instances
 
@@ -121,21 +193,24 @@ class BaseDAO(Generic[T]):
         """Обновить записи по фильтрам."""
         filter_dict = filters.model_dump(exclude_unset=True)
         values_dict = values.model_dump(exclude_unset=True)
-        logger.info(f"Обновление записей {cls.model.__name__} по фильтру: {filter_dict} с параметрами: {values_dict}")
-        query = (
+        log.debug(
+            "Обновление записей %s по фильтру: %s с параметрами: %s", cls.model.__name__, filter_dict, values_dict
+        )
+        keys, params = cls._filter_keys(filter_dict)
+        # из кеша берется только WHERE: синхронизация сессии ("fetch") читает новые значения из самого запроса
+        query = cls._statement("update", keys, lambda: (
             sqlalchemy_update(cls.model)
-            .where(*[getattr(cls.model, k) == v for k, v in filter_dict.items()])
-            .values(**values_dict)
+            .where(*cls._where(keys))
             .execution_options(synchronize_session="fetch")
-        )
+        )).values(**values_dict)
         try:
-            result = await session.execute(query)
+            result = await session.execute(query, params)
             await session.flush()
-            logger.info(f"Обновлено {result.rowcount} записей.")
+            log.debug("Обновлено %s записей.", result.rowcount)
             return result.rowcount
         except SQLAlchemyError as e:
             await session.rollback()
-            logger.error(f"Ошибка при обновлении записей: {e}")
+            log.error("Ошибка при обновлении записей: %s", e)
             raise e
 
 
@@ -143,20 +218,21 @@ class BaseDAO(Generic[T]):
     async def delete(cls, session: AsyncSession, filters: BaseModel):
         """Удалить записи по фильтру."""
         filter_dict = filters.model_dump(exclude_unset=True)
-        logger.info(f"Удаление записей {cls.model.__name__} по фильтру: {filter_dict}")
+        log.debug("Удаление записей %s по фильтру: %s", cls.model.__name__, filter_dict)
         if not filter_dict:
-            logger.error("Нужен хотя бы один фильтр для удаления.")
+            log.error("Нужен хотя бы один фильтр для удаления.")
             raise ValueError("Нужен хотя бы один фильтр для удаления.")
 
-        query = sqlalchemy_delete(cls.model).filter_by(**filter_dict)
+        keys, params = cls._filter_keys(filter_dict)
+        query = cls._statement("delete", keys, lambda: sqlalchemy_delete(cls.model).where(*cls._where(keys)))
         try:
-            result = await session.execute(query)
+            result = await session.execute(query, params)
             await session.flush()
-            logger.info(f"Удалено {result.rowcount} записей.")
+            log.debug("Удалено %s записей.", result.rowcount)
             return result.rowcount
         except SQLAlchemyError as e:
             await session.rollback()
-            logger.error(f"Ошибка при удалении записей: {e}")
+            log.error("Ошибка при удалении записей: %s", e)
             raise e
 
 
@@ -164,14 +240,177 @@ class BaseDAO(Generic[T]):
     async def count(cls, session: AsyncSession, filters: BaseModel | None = None):
         """Подсчитать количество записей."""
         filter_dict = filters.model_dump(exclude_unset=True) if filters else {}
-        logger.info(f"Подсчет количества записей {cls.model.__name__} по фильтру: {filter_dict}")
+        log.debug("Подсчет количества записей %s по фильтру: %s", cls.model.__name__, filter_dict, extra=SAMPLED)
         try:
-            query = select(func.count(cls.model.id)).filter_by(**filter_dict)
-            result = await session.execute(query)
+            keys, params = cls._filter_keys(filter_dict)
+            query = cls._statement("count", keys, lambda: select(func.count(cls.model.id)).where(*cls._where(keys)))
+            result = await session.execute(query, params)
             count = result.scalar()
-            logger.info(f"Найдено {count} записей.")
+            log.debug("Найдено %s записей.", count, extra=SAMPLED)
             return count
         except SQLAlchemyError as e:
-            logger.error(f"Ошибка при подсчете записей: {e}")
+            log.error("Ошибка при подсчете записей: %s", e)
             raise
 
+
+
+    @classmethod
+    async def upsert_many(
+            cls,
+            session: AsyncSession,
+            rows: Iterable[BaseModel | Mapping[str, Any]],
+            conflict: Sequence[str] = ("id",),
+            update: Sequence[str] | None = None,
+    ) -> int:
+        """
+        Добавить или обновить записи: INSERT ... ON CONFLICT (conflict) DO UPDATE пакетами по DB_BULK_CHUNK_SIZE.
+        update - обновляемые колонки (по умолчанию все переданные, кроме conflict; пустой - DO NOTHING).
+        Возвращает количество добавленных и обновленных записей.
+        """
+        values_list = cls._as_dicts(rows)
+        log.debug("Пакетное добавление/обновление %s. Количество: %s", cls.model.__name__, len(values_list))
+        dialect = session.get_bind().dialect.name
+        if dialect not in UPSERT_INSERTS:
+            raise ValueError(f"upsert_many поддерживает только {', '.join(UPSERT_INSERTS)}, а не {dialect}")
+
+        table = cls.model.__table__
+        affected = 0
+        try:
+            for columns, group in _group_by_columns(values_list).items():
+                update_columns = [name for name in columns if name not in conflict] if update is None else update
+                # колонки с onupdate (updated_at) в ON CONFLICT DO UPDATE сами не обновляются
+                on_update = {
+                    table_column.name: table_column.onupdate.arg
+                    for table_column in table.columns
+                    if table_column.onupdate is not None and table_column.onupdate.is_clause_element
+                    and table_column.name not in update_columns
+                }
+                for chunk in _chunks(group, cls._chunk_size(len(columns))):
+                    stmt = UPSERT_INSERTS[dialect](table).values(list(chunk))
+                    if update_columns:
+                        stmt = stmt.on_conflict_do_update(
+                            index_elements=list(conflict),
+                            set_={**{name: stmt.excluded[name] for name in update_columns}, **on_update},
+                        )
+                    else:
+                        stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict))
+                    affected += (await session.execute(stmt)).rowcount
+            log.debug("Добавлено или обновлено %s записей.", affected)
+            return affected
+        except SQLAlchemyError as e:
+            await session.rollback()
+            log.error("Ошибка при пакетном добавлении/обновлении записей: %s", e)
+            raise e
+
+
+    @classmethod
+    async def update_many(
+            cls,
+            session: AsyncSession,
+            rows: Iterable[BaseModel | Mapping[str, Any]],
+            key: str = "id",
+    ) -> int:
+        """
+        Обновить записи по значению колонки key: каждая строка - key и новые значения колонок.
+        Один executemany на набор колонок; драйверы без количества строк для executemany (asyncpg)
+        получают UPDATE ... FROM (VALUES ...) по пакетам. Возвращает количество обновленных записей.
+        """
+        values_list = cls._as_dicts(rows)
+        log.debug("Пакетное обновление %s по %s. Количество: %s", cls.model.__name__, key, len(values_list))
+        dialect = session.get_bind().dialect
+        table = cls.model.__table__
+        updated = 0
+        try:
+            for columns, group in _group_by_columns(values_list).items():
+                update_columns = [name for name in columns if name != key]
+                if not update_columns:
+                    continue
+                if dialect.supports_sane_multi_rowcount:
+                    # имена параметров не должны совпадать с колонками в SET
+                    stmt = (
+                        sqlalchemy_update(table)
+                        .where(table.c[key] == bindparam(f"p_{key}"))
+                        .values({name: bindparam(f"p_{name}") for name in update_columns})
+                    )
+                    for chunk in _chunks(group, settings.DB_BULK_CHUNK_SIZE):
+                        params = [{f"p_{name}": value for name, value in values_dict.items()} for values_dict in chunk]
+                        updated += (await session.execute(stmt, params)).rowcount
+                else:
+                    for chunk in _chunks(group, cls._chunk_size(len(columns))):
+                        data = values(*(column(name, table.c[name].type) for name in columns), name="data").data(
+                            [tuple(values_dict[name] for name in columns) for values_dict in chunk]
+                        )
+                        stmt = (
+                            sqlalchemy_update(table)
+                            .where(table.c[key] == data.c[key])
+                            .values({name: data.c[name] for name in update_columns})
+                        )
+                        updated += (await session.execute(stmt)).rowcount
+            log.debug("Обновлено %s записей.", updated)
+            return updated
+        except SQLAlchemyError as e:
+            await session.rollback()
+            log.error("Ошибка при пакетном обновлении записей: %s", e)
+            raise e
+
+
+    @classmethod
+    async def delete_many(cls, session: AsyncSession, keys: Iterable[Any], key: str = "id") -> int:
+        """Удалить записи со значениями колонки key из keys пакетами по DB_BULK_CHUNK_SIZE. Возвращает количество удаленных."""
+        keys = list(keys)
+        log.debug("Пакетное удаление %s по %s. Количество: %s", cls.model.__name__, key, len(keys))
+        table = cls.model.__table__
+        deleted = 0
+        try:
+            for chunk in _chunks(keys, cls._chunk_size(1)):
+                deleted += (await session.execute(sqlalchemy_delete(table).where(table.c[key].in_(chunk)))).rowcount
+            log.debug("Удалено %s записей.", deleted)
+            return deleted
+        except SQLAlchemyError as e:
+            await session.rollback()
+            log.error("Ошибка при пакетном удалении записей: %s", e)
+            raise e
+
+
+    @classmethod
+    async def copy_in(
+            cls,
+            session: AsyncSession,
+            rows: Iterable[BaseModel | Mapping[str, Any]],
+            columns: Sequence[str] | None = None,
+    ) -> int:
+        """
+        Быстрая загрузка новых записей: в PostgreSQL (asyncpg) - COPY в текущей транзакции сессии,
+        в остальных БД - пакетный INSERT. columns - загружаемые колонки (по умолчанию колонки первой строки),
+        остальные получают значения по умолчанию БД. Возвращает количество добавленных записей.
+        """
+        values_list = cls._as_dicts(rows)
+        if not values_list:
+            return 0
+        columns = list(columns or values_list[0])
+        log.debug("Загрузка %s. Количество: %s", cls.model.__name__, len(values_list))
+        table = cls.model.__table__
+        try:
+            connection = await session.connection()
+            if connection.dialect.driver != "asyncpg":
+                records = [{name: values_dict.get(name) for name in columns} for values_dict in values_list]
+                await session.execute(insert(table), records)
+                return len(records)
+
+            # драйвер открывает транзакцию при первом запросе: COPY должен попасть в транзакцию сессии
+            await connection.exec_driver_sql("SELECT 1")
+            raw_connection = await connection.get_raw_connection()
+            status = await raw_connection.driver_connection.copy_records_to_table(
+                table.name,
+                records=[tuple(values_dict.get(name) for name in columns) for values_dict in values_list],
+                columns=columns,
+                schema_name=table.schema,
+            )
+            copied = int(status.split()[-1])
+            log.debug("Загружено %s записей.", copied)
+            return copied
+        except (SQLAlchemyError, PostgresError, InterfaceError) as e:
+            # COPY идет напрямую через asyncpg, его ошибки не оборачиваются в SQLAlchemyError
+            await session.rollback()
+            log.error("Ошибка при загрузке записей: %s", e)
+            raise e
@@ -1,11 +1,15 @@
+import asyncio
+import time
 import uuid
-from datetime import datetime
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime, timezone
 from decimal import Decimal
-from typing import Annotated
+from typing import Annotated, AsyncIterator
 
-from sqlalchemy import TIMESTAMP, Integer, func, inspect
+from sqlalchemy import TIMESTAMP, DateTime, Integer, TypeDecorator, event, exc, func, inspect, make_url
 from sqlalchemy.ext.asyncio import (
     AsyncAttrs,
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
@@ -16,15 +20,213 @@ from sqlalchemy.orm import (
     declared_attr,
     mapped_column,
 )
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
-from app.config import database_url
+from app.config import database_url, settings
 
-engine = create_async_engine(url=database_url)
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который считает время получения соединения и отказы по таймауту."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            # время ожидания свободного соединения, включая открытие нового при росте пула
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+
+def is_sqlite_file(url: str) -> bool:
+    """URL базы SQLite в файле (не в памяти)."""
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:")
+
+
+def engine_options(url: str) -> dict:
+    """Параметры движка из настроек: пул и кеш подготовленных выражений для PostgreSQL, пул для файла SQLite."""
+    if is_sqlite_file(url):
+        # постоянные соединения сохраняют между запросами кеш страниц и отображение файла в память
+        return {
+            "poolclass": MeteredQueuePool,
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT,
+        }
+    if not url.startswith("postgresql"):
+        # для SQLite в памяти остается пул по умолчанию (StaticPool)
+        return {}
+    return {
+        "poolclass": MeteredQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": {"prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE},
+    }
+
+
+def pool_stats(engine: AsyncEngine) -> dict:
+    """Состояние пула соединений: выданные и свободные соединения, переполнение, время ожидания."""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    stats = {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # overflow() отрицателен, пока пул не открыл все pool_size соединений
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+    }
+    if isinstance(pool, MeteredQueuePool):
+        stats.update({
+            "checkouts": pool.checkouts,
+            "timeouts": pool.timeouts,
+            "wait_avg_ms": round(pool.wait_total / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+            "wait_max_ms": round(pool.wait_max * 1000, 3),
+        })
+    return stats
+
+
+def sqlite_pragmas() -> dict[str, str | int]:
+    """PRAGMA профиля SQLite для продакшена из настроек."""
+    return {
+        # WAL: читатели не блокируются записью и не блокируют её
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        # в режиме WAL NORMAL не теряет согласованность, fsync только на контрольных точках
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+    }
+
+
+def create_database_engine(url: str) -> AsyncEngine:
+    """Создает движок с настройками из Settings; для файла SQLite каждое соединение получает PRAGMA профиля."""
+    engine = create_async_engine(url=url, **engine_options(url))
+    if is_sqlite_file(url):
+        pragmas = sqlite_pragmas()
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return engine
+
+
+class SingleWriter:
+    """
+    Очередь записи в SQLite: отдельная задача по одному выдает право на транзакцию записи.
+    Синхронизация курсов и запись пользователей внутри процесса не конкурируют за блокировку файла,
+    а ждут очереди в порядке поступления.
+    Очередь действует только в своем процессе: воркеры uvicorn и отдельный воркер синхронизации
+    по-прежнему конкурируют за файл через busy_timeout и могут получить "database is locked".
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.writes = 0
+        self.wait_max = 0.0
+
+    @property
+    def pending(self) -> int:
+        """Количество транзакций записи, ожидающих очереди."""
+        return self._queue.qsize() if self._queue else 0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run(self._queue), name="sqlite-single-writer")
+        return self._queue
+
+    @staticmethod
+    async def _run(queue: asyncio.Queue) -> None:
+        while True:
+            granted, done = await queue.get()
+            if granted.cancelled():
+                continue  # ожидавший отменен до получения очереди
+            granted.set_result(None)
+            await done
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Удерживает право записи на время блока."""
+        loop = asyncio.get_running_loop()
+        granted, done = loop.create_future(), loop.create_future()
+        started = time.perf_counter()
+        await self._ensure_started().put((granted, done))
+        try:
+            await granted
+        except asyncio.CancelledError:
+            # право записи могло быть выдано одновременно с отменой: возвращаем его
+            if granted.done() and not granted.cancelled():
+                done.set_result(None)
+            raise
+        self.writes += 1
+        self.wait_max = max(self.wait_max, time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            done.set_result(None)
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+engine = create_database_engine(database_url)
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 str_uniq = Annotated[str, mapped_column(unique=True, nullable=False)]
 float_col = Annotated[float, mapped_column(nullable=False)]
 
 
+class TZDateTime(TypeDecorator):
+    """
+    Время с часовым поясом: в БД хранится в UTC, из БД возвращается aware-datetime в UTC.
+    PostgreSQL хранит timestamptz сам, для SQLite (без часовых поясов) значение приводится к UTC вручную,
+    поэтому сравнения в WHERE одинаково работают на обеих БД.
+    """
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value: datetime | None, dialect):
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            raise ValueError("TZDateTime принимает только время с часовым поясом")
+        value = value.astimezone(timezone.utc)
+        return value if dialect.name == "postgresql" else value.replace(tzinfo=None)
+
+    def process_result_value(self, value: datetime | None, dialect):
+        if value is None:
+            return None
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
 class Base(AsyncAttrs, DeclarativeBase):
     __abstract__ = True
 
@@ -1,40 +1,294 @@
-from contextlib import asynccontextmanager
+import logging
+import random
+import time
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
 from functools import wraps
-from typing import AsyncGenerator, Callable, Optional
+from typing import AsyncContextManager, AsyncGenerator, Callable, Iterator, Optional, Sequence
 
 from fastapi import Depends, HTTPException
-from loguru import logger
-from sqlalchemy import text
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import Engine, event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.selectable import Select
 
-from app.dao.database import async_session_maker
+from app.config import settings
+from app.dao.database import SingleWriter, async_session_maker, create_database_engine, is_sqlite_file
+
+
+log = logging.getLogger(__name__)
+
+
+# Время последней зафиксированной записи в текущем контексте (запрос FastAPI, задача планировщика):
+# пока не прошло DB_READ_YOUR_WRITES_SECONDS, чтения в этом контексте идут на основную БД
+_last_write_at: ContextVar[float | None] = ContextVar("last_write_at", default=None)
+
+
+def _wrote_recently() -> bool:
+    last_write_at = _last_write_at.get()
+    return last_write_at is not None and time.monotonic() - last_write_at < settings.DB_READ_YOUR_WRITES_SECONDS
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush(session: Session, flush_context) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_dml(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+class RoutingSession(Session):
+    """
+    Сессия чтения: запросы идут на реплику, пока в сессии не было записи.
+    Запись (flush, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE, произвольный text()) выполняется
+    на основной БД, и все следующие запросы сессии тоже идут туда, чтобы читать свои записи.
+    """
+
+    def __init__(self, *args, replica: Engine, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica = replica
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        if not self.info.get("wrote") and not self._flushing and not _wrote_recently():
+            if isinstance(clause, Select) and clause._for_update_arg is None:
+                return self.replica
+        if isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+
+# первые слова text()-запросов, которые пишут в БД
+_WRITE_KEYWORDS = {"INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER"}
+
+
+def _is_write(statement) -> bool:
+    if isinstance(statement, UpdateBase):
+        return True
+    if isinstance(statement, TextClause):
+        words = statement.text.split(None, 1)
+        return bool(words) and words[0].upper() in _WRITE_KEYWORDS
+    return False
+
+
+class LazySession:
+    """
+    Заместитель AsyncSession для зависимостей FastAPI: сессия создается при первом обращении
+    (execute, get, add, ...), а соединение из пула берется при первом запросе к БД.
+    Запросы, которые обслуживаются из памяти, не создают сессию и не занимают соединение.
+    С write_slot право записи (SingleWriter) берется перед первой записью - DML, text() с
+    INSERT/UPDATE/DELETE или flush изменений ORM - и отдается после commit, rollback или close,
+    поэтому чтения и ожидание внешних источников до первой записи не задерживают очередь записи.
+    add/add_all/delete только ставят изменения в очередь сессии: право записи берется в первом
+    асинхронном вызове, который может их сбросить (запрос с autoflush, flush, refresh, merge, commit).
+    run_sync и connection() выполняют произвольный код, поэтому берут право записи всегда.
+    """
+
+    def __init__(
+            self,
+            factory: Callable[[], AsyncSession],
+            write_slot: Callable[[], AsyncContextManager] | None = None,
+    ):
+        self._factory = factory
+        self._session: AsyncSession | None = None
+        self._write_slot = write_slot
+        self._slot: AsyncExitStack | None = None
+
+    @property
+    def writing(self) -> bool:
+        """Сессия держит право записи."""
+        return self._slot is not None
+
+    async def _before(self, statement=None, always: bool = False) -> None:
+        """Берет право записи, если запрос пишет или перед ним будут сброшены изменения ORM (autoflush)."""
+        if self._write_slot is None or self._slot is not None:
+            return
+        session = self.session
+        if always or _is_write(statement) or session.new or session.dirty or session.deleted:
+            slot = AsyncExitStack()
+            await slot.enter_async_context(self._write_slot())
+            self._slot = slot
+
+    async def _release(self) -> None:
+        if self._slot is not None:
+            slot, self._slot = self._slot, None
+            await slot.aclose()
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._factory()
+        return self._session
+
+    @property
+    def info(self) -> dict:
+        return self._session.info if self._session is not None else {}
+
+    def __getattr__(self, name: str):
+        return getattr(self.session, name)
+
+    async def execute(self, statement, *args, **kwargs):
+        await self._before(statement)
+        return await self.session.execute(statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        await self._before(statement)
+        return await self.session.scalar(statement, *args, **kwargs)
+
+    async def scalars(self, statement, *args, **kwargs):
+        await self._before(statement)
+        return await self.session.scalars(statement, *args, **kwargs)
+
+    async def stream(self, statement, *args, **kwargs):
+        await self._before(statement)
+        return await self.session.stream(statement, *args, **kwargs)
+
+    async def stream_scalars(self, statement, *args, **kwargs):
+        await self._before(statement)
+        return await self.session.stream_scalars(statement, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        await self._before()
+        return await self.session.get(*args, **kwargs)
+
+    async def get_one(self, *args, **kwargs):
+        await self._before()
+        return await self.session.get_one(*args, **kwargs)
+
+    async def refresh(self, *args, **kwargs) -> None:
+        await self._before()
+        await self.session.refresh(*args, **kwargs)
+
+    async def merge(self, *args, **kwargs):
+        await self._before()
+        return await self.session.merge(*args, **kwargs)
+
+    async def flush(self, *args, **kwargs) -> None:
+        await self._before()
+        await self.session.flush(*args, **kwargs)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        await self._before(always=True)
+        return await self.session.run_sync(fn, *args, **kwargs)
+
+    async def connection(self, *args, **kwargs):
+        await self._before(always=True)
+        return await self.session.connection(*args, **kwargs)
+
+    async def commit(self) -> None:
+        if self._session is not None:
+            try:
+                await self._before()
+                await self._session.commit()
+            finally:
+                await self._release()
+
+    async def rollback(self) -> None:
+        if self._session is not None:
+            try:
+                await self._session.rollback()
+            finally:
+                await self._release()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            try:
+                await self._session.close()
+            finally:
+                await self._release()
+
+    async def __aenter__(self) -> "LazySession":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+# Счетчик выдачи соединений из пулов в текущем контексте (см. DatabaseSessionManager.count_checkouts)
+_checkout_counter: ContextVar[list[int] | None] = ContextVar("checkout_counter", default=None)
+
+
+def _count_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+    counter = _checkout_counter.get()
+    if counter is not None:
+        counter[0] += 1
 
 
 class DatabaseSessionManager:
     """
     Класс для управления асинхронными сессиями базы данных, 
     включая поддержку транзакций и зависимостей для FastAPI по работе с сессией.
+    С репликами сессии без коммита читают с реплики, сессии с коммитом работают с основной БД.
+    Для файла SQLite сессии по очереди получают право записи у SingleWriter перед первой записью.
     """
 
-    def __init__(self, session_maker: async_sessionmaker[AsyncSession]):
+    def __init__(self, session_maker: async_sessionmaker[AsyncSession], replica_urls: Sequence[str] = ()):
         self.session_maker = session_maker
+        self.replica_engines: list[AsyncEngine] = [create_database_engine(url) for url in replica_urls]
+        primary = session_maker.kw.get("bind")
+        for engine in ([primary] if primary else []) + self.replica_engines:
+            event.listen(engine.sync_engine, "checkout", _count_checkout)
+        self.writer: SingleWriter | None = (
+            SingleWriter() if primary and is_sqlite_file(primary.url) and settings.SQLITE_SINGLE_WRITER else None
+        )
+
+    def write_slot(self):
+        """Право на транзакцию записи: очередь SingleWriter для SQLite, для остальных БД - без ожидания."""
+        return self.writer.slot() if self.writer else nullcontext()
+
+    def lazy_session(self, read_only: bool = False) -> LazySession:
+        """Ленивая сессия; для SQLite-файла право записи берется перед первой записью в ней."""
+        factory = self.read_session if read_only else self.session_maker
+        return LazySession(factory, write_slot=self.write_slot if self.writer else None)
+
+    @staticmethod
+    @contextmanager
+    def count_checkouts() -> Iterator[list[int]]:
+        """Считает соединения, выданные из пулов внутри блока (например, за один запрос): counter[0]."""
+        counter = [0]
+        token = _checkout_counter.set(counter)
+        try:
+            yield counter
+        finally:
+            _checkout_counter.reset(token)
+
+    def read_session(self) -> AsyncSession:
+        """Сессия для чтения: на случайной реплике (или на основной БД, если реплик нет)."""
+        if not self.replica_engines:
+            return self.session_maker()
+        replica = random.choice(self.replica_engines)
+        return self.session_maker(sync_session_class=RoutingSession, replica=replica.sync_engine)
+
+    @staticmethod
+    def remember_write(session: AsyncSession) -> None:
+        """После коммита с записью чтения в текущем контексте переключаются на основную БД."""
+        if session.info.pop("wrote", False):
+            _last_write_at.set(time.monotonic())
 
     @asynccontextmanager
-    async def create_session(self) -> AsyncGenerator[AsyncSession, None]:
+    async def create_session(self, read_only: bool = False) -> AsyncGenerator[LazySession, None]:
         """
-        Создаёт и предоставляет новую сессию базы данных.
+        Предоставляет сессию базы данных, которая создается при первом запросе к БД.
         Гарантирует закрытие сессии по завершении работы.
         """
-        async with self.session_maker() as session:
-            try:
-                yield session
-            except HTTPException:
-                raise  # пробрасываем HTTP-исключения без логирования
-            except Exception as e:
-                logger.error(f"Ошибка при создании сессии базы данных: {e}")
-                raise
-            finally:
-                await session.close()
+        session = self.lazy_session(read_only)
+        try:
+            yield session
+        except HTTPException:
+            raise  # пробрасываем HTTP-исключения без логирования
+        except Exception as e:
+            log.error("Ошибка при создании сессии базы данных: %s", e)
+            raise
+        finally:
+            await session.close()
 
     @asynccontextmanager
     async def transaction(self, session: AsyncSession) -> AsyncGenerator[None, None]:
@@ -44,16 +298,17 @@ class DatabaseSessionManager:
         try:
             yield
             await session.commit()
+            self.remember_write(session)
         except Exception as e:
             await session.rollback()
-            logger.exception(f"Ошибка транзакции: {e}")
+            log.exception("Ошибка транзакции: %s", e)
             raise
 
     async def get_session_without_transaction(self) -> AsyncGenerator[AsyncSession, None]:
         """
-        Зависимость для FastAPI, возвращающая сессию без управления транзакцией.
+        Зависимость для FastAPI, возвращающая сессию без управления транзакцией (чтение с реплики).
         """
-        async with self.create_session() as session:
+        async with self.create_session(read_only=True) as session:
             yield session
 
     async def get_session_with_transaction(self) -> AsyncGenerator[AsyncSession, None]:
@@ -71,12 +326,14 @@ class DatabaseSessionManager:
         Параметры:
         - `isolation_level`: уровень изоляции для транзакции (например, "SERIALIZABLE").
         - `commit`: если `True`, выполняется коммит после вызова метода.
+        Без коммита и уровня изоляции метод получает сессию чтения (с реплики).
         """
 
         def decorator(method):
             @wraps(method)
             async def wrapper(*args, **kwargs):
-                async with self.session_maker() as session:
+                session = self.lazy_session(read_only=not commit and not isolation_level)
+                async with session:
                     try:
                         if isolation_level:
                             await session.execute(text(f"SET TRANSACTION ISOLATION LEVEL {isolation_level}"))
@@ -85,11 +342,12 @@ class DatabaseSessionManager:
 
                         if commit:
                             await session.commit()
+                            self.remember_write(session)
 
                         return result
                     except Exception as e:
                         await session.rollback()
-                        logger.error(f"Ошибка при выполнении транзакции: {e}")
+                        log.error("Ошибка при выполнении транзакции: %s", e)
                         raise
                     finally:
                         await session.close()
@@ -116,7 +374,7 @@ class DatabaseSessionManager:
 
 
 # Инициализация менеджера сессий базы данных
-session_manager = DatabaseSessionManager(async_session_maker)
+session_manager = DatabaseSessionManager(async_session_maker, settings.DB_REPLICA_URLS)
 
 # Зависимости FastAPI для использования сессий
 # без коммита
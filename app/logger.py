@@ -1,10 +1,103 @@
+"""
+Логирование приложения на стандартном logging.
+
+Модули пишут в свои логгеры (logging.getLogger(__name__)) с ленивым форматированием
+(log.debug("... %s", value)): строка собирается, только если запись пройдет по уровню.
+Уровни задаются для приложения и отдельных модулей (LOG_LEVEL, LOG_LEVELS).
+Записи попадают в ограниченную очередь и пишутся в stdout отдельным потоком (QueueListener),
+поэтому запрос не ждет вывода; при переполнении очереди записи отбрасываются и считаются.
+Частые события (на каждый запрос или банк) помечаются extra=SAMPLED и выводятся выборочно.
+"""
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
+from collections import defaultdict
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# отметка частого события: из таких записей выводится одна из sample_every (отдельно по каждому сообщению)
+SAMPLED = {"sampled": True}
+
+log = logging.getLogger("app")
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает первую и затем каждую sample_every-ю запись частого события; WARNING и выше - всегда."""
+
+    def __init__(self, sample_every: int = 1):
+        super().__init__()
+        self.sample_every = max(sample_every, 1)
+        self._seen: defaultdict[tuple[str, str], int] = defaultdict(int)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.sample_every == 1 or record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        key = (record.name, str(record.msg))
+        count = self._seen[key]
+        self._seen[key] = count + 1
+        return count % self.sample_every == 0
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не ждет места в очереди: при переполнении запись отбрасывается."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def configure_logging(
+        level: str = "INFO",
+        levels: dict[str, str] | None = None,
+        sample_every: int = 1,
+        queue_size: int = 10000,
+        stream=None,
+) -> NonBlockingQueueHandler:
+    """
+    Настраивает логирование процесса: уровень логгера приложения ("app") и отдельных модулей,
+    очередь с фоновым выводом в stream (по умолчанию stdout) и выборку частых событий.
+    Повторный вызов заменяет прежнюю настройку.
+    """
+    global _listener
+    stop_logging()
+
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, NonBlockingQueueHandler)]:
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+    handler.addFilter(SamplingFilter(sample_every))
+    root.addHandler(handler)
+    # сторонние библиотеки - только предупреждения, если для них не задан уровень
+    root.setLevel(logging.WARNING)
+    log.setLevel(level.upper())
+    for name, module_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(module_level.upper())
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    return handler
+
 
+def stop_logging() -> None:
+    """Останавливает фоновый вывод, дописав накопленные в очереди записи."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
-log = logging.getLogger()
-log.setLevel(logging.DEBUG)
 
-handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(logging.DEBUG)
-log.addHandler(handler)
\ No newline at end of file
+atexit.register(stop_logging)
@@ -1,42 +1,64 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from datetime import timedelta
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.interval import IntervalTrigger
-from fastapi import APIRouter, FastAPI
+from fastapi import APIRouter, Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-from loguru import logger
 
+from app.api.http_cache import HTTPCacheMiddleware
 from app.api.router import router as router_api
+from app.api.shared_snapshot import shared_snapshot_file
+from app.api.snapshot import rate_snapshot
+from app.auth.dependencies import get_current_admin_user
 from app.auth.router import router as router_auth
-from app.parser.scheduler import add_or_update_data_to_db
+from app.config import settings
+from app.dao.database import engine, pool_stats
+from app.dao.session_maker import session_manager
+from app.parser.events import consume_sync_events, sync_channel
+from app.parser.scheduler import SyncScheduler, load_last_snapshot, load_snapshot_from_db
 
 
-scheduler = AsyncIOScheduler()
+async def refresh_rate_snapshot(event: dict, sync_scheduler: SyncScheduler | None) -> None:
+    """Обновляет снимок курсов по событию о завершении синхронизации в другом процессе."""
+    snapshot = await rate_snapshot.refresh_from(shared_snapshot_file) if shared_snapshot_file else None
+    current = rate_snapshot.current
+    if snapshot is None and (not current or event.get("data_hash", current.data_hash) != current.data_hash):
+        # общий файл на другом хосте, отключен или еще не записан - строим снимок по базе
+        snapshot = await load_snapshot_from_db()
+    if snapshot and not (sync_scheduler and sync_scheduler.is_leader):
+        # планировщик работает только у лидера, интервал у него адаптивный - рассчитываем на минимальный
+        rate_snapshot.next_sync_at = snapshot.created_at + timedelta(minutes=settings.SYNC_INTERVAL_MIN_MINUTES)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    scheduler = AsyncIOScheduler()
+    # синхронизацию выполняет только один процесс: лидер среди веб-воркеров или отдельный воркер
+    sync_scheduler = SyncScheduler() if settings.SYNC_IN_WEB else None
+    app.state.sync_scheduler = sync_scheduler
+    events_task = None
     try:
-        await add_or_update_data_to_db()
-
-        # плановая задача с защитой от дублирования задачи если lifespan вызовется повторно
-        scheduler.add_job(
-            add_or_update_data_to_db,
-            trigger=IntervalTrigger(minutes=10),
-            # trigger=IntervalTrigger(seconds=5),
-            id="currency_update_job",
-            replace_existing=True,
-        )
-        scheduler.start()
-        logger.info("Планировщик запущен")
+        # начинаем отдавать последние известные курсы сразу, первая синхронизация идет в фоне
+        await load_last_snapshot()
+        if sync_scheduler:
+            await sync_scheduler.start()
+
+        if sync_channel:
+            events_task = asyncio.create_task(
+                consume_sync_events(sync_channel, lambda event: refresh_rate_snapshot(event, sync_scheduler))
+            )
         yield
 
     finally:
-        if scheduler.running:
-            # Остановка планировщика при завершении работы приложения
-            scheduler.shutdown()
-            logger.info("Планировщик остановлен")
+        if events_task:
+            events_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await events_task
+        if sync_scheduler:
+            await sync_scheduler.stop()
+        if session_manager.writer:
+            await session_manager.writer.close()
 
 
 def register_routers(app: FastAPI) -> None:
@@ -48,6 +70,44 @@ def register_routers(app: FastAPI) -> None:
     def home_page():
         return { "message": "Добро пожаловать!"}
 
+    # метрики раскрывают устройство развертывания (пулы, реплики, решения планировщика) - только для админов
+    @router_root.get("/sync/metrics", dependencies=[Depends(get_current_admin_user)])
+    def sync_metrics(request: Request):
+        """Решения адаптивного планировщика синхронизации (заполнены только у процесса-лидера)."""
+        sync_scheduler = getattr(request.app.state, "sync_scheduler", None)
+        if not sync_scheduler:
+            return {"leader": False}
+        return sync_scheduler.metrics()
+
+    @router_root.get("/db/metrics", dependencies=[Depends(get_current_admin_user)])
+    def db_metrics():
+        """Состояние пулов соединений с основной БД и репликами и очереди записи SQLite в этом процессе."""
+        stats = pool_stats(engine)
+        if session_manager.replica_engines:
+            stats["replicas"] = [pool_stats(replica) for replica in session_manager.replica_engines]
+        if session_manager.writer:
+            stats["writer"] = {
+                "writes": session_manager.writer.writes,
+                "pending": session_manager.writer.pending,
+                "wait_max_ms": round(session_manager.writer.wait_max * 1000, 3),
+            }
+        return stats
+
+    @router_root.get("/ready")
+    def readiness():
+        """Готовность к приему трафика: курсы есть (fresh или stale) или их пока нет (empty, 503)."""
+        status = rate_snapshot.freshness()
+        snapshot = rate_snapshot.current
+        return JSONResponse(
+            status_code=503 if status == "empty" else 200,
+            content={
+                "status": status,
+                "version": snapshot.version if snapshot else None,
+                "banks": len(snapshot.records) if snapshot else 0,
+                "synced_at": rate_snapshot.synced_at.isoformat() if rate_snapshot.synced_at else None,
+            },
+        )
+
     # Подключение роутеров
     app.include_router(router_root)
     app.include_router(router_auth)
@@ -61,6 +121,9 @@ def create_app() -> FastAPI:
     """
     app = FastAPI(lifespan=lifespan)
 
+    # ETag / Cache-Control и 304 для эндпоинтов из снимка курсов (snapshot_cached; внутри CORS, чтобы 304 тоже получали CORS-заголовки)
+    app.add_middleware(HTTPCacheMiddleware)
+
     # Настройка CORS
     app.add_middleware(
         CORSMiddleware,
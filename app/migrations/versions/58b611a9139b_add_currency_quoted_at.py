@@ -0,0 +1,76 @@
+"""add currency quoted_at
+
+Revision ID: 58b611a9139b
+Revises: 06029a81ca68
+Create Date: 2026-10-18 12:10:41.207315
+
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '58b611a9139b'
+down_revision: Union[str, None] = '06029a81ca68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Время на myfin указано по Москве (UTC+3)
+MOSCOW_TZ = timezone(timedelta(hours=3), "MSK")
+
+
+def parse_update_time(value: str, updated_at: datetime | None) -> datetime | None:
+    """Разбор update_time как в парсере на момент миграции; время без даты относится к дню updated_at."""
+    try:
+        quoted_at = datetime.strptime(value, '%d.%m.%Y %H:%M').replace(tzinfo=MOSCOW_TZ)
+    except ValueError:
+        try:
+            time = datetime.strptime(value, '%H:%M').time()
+        except ValueError:
+            return None
+        if updated_at is None:
+            return None
+        reference = updated_at.replace(tzinfo=updated_at.tzinfo or timezone.utc).astimezone(MOSCOW_TZ)
+        quoted_at = datetime.combine(reference.date(), time, tzinfo=MOSCOW_TZ)
+        if quoted_at > reference:
+            quoted_at -= timedelta(days=1)
+    return quoted_at.astimezone(timezone.utc)
+
+
+def upgrade() -> None:
+    op.add_column('currencyrates', sa.Column('quoted_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.create_index(op.f('ix_currencyrates_quoted_at'), 'currencyrates', ['quoted_at'], unique=False)
+
+    # заполнение для уже сохраненных банков: строки разбираются один раз здесь, дальше - парсером
+    bind = op.get_bind()
+    currencyrates = sa.table(
+        'currencyrates',
+        sa.column('id', sa.Integer()),
+        sa.column('update_time', sa.String()),
+        sa.column('updated_at', sa.TIMESTAMP()),
+        sa.column('quoted_at', sa.TIMESTAMP(timezone=True)),
+    )
+    rows = bind.execute(sa.select(currencyrates.c.id, currencyrates.c.update_time, currencyrates.c.updated_at))
+    values = [
+        {'row_id': row_id, 'quoted_at': quoted_at}
+        for row_id, update_time, updated_at in rows
+        if (quoted_at := parse_update_time(update_time, updated_at)) is not None
+    ]
+    if values:
+        if bind.dialect.name != 'postgresql':
+            # SQLite хранит время без часового пояса, в UTC - как TZDateTime в модели
+            for item in values:
+                item['quoted_at'] = item['quoted_at'].replace(tzinfo=None)
+        bind.execute(
+            currencyrates.update()
+            .where(currencyrates.c.id == sa.bindparam('row_id'))
+            .values(quoted_at=sa.bindparam('quoted_at')),
+            values,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_currencyrates_quoted_at'), table_name='currencyrates')
+    op.drop_column('currencyrates', 'quoted_at')
@@ -0,0 +1,71 @@
+"""add best rates view
+
+Revision ID: 7d68b643a010
+Revises: ffd5c149ed28
+Create Date: 2026-10-19 10:42:05.118634
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '7d68b643a010'
+down_revision: Union[str, None] = 'ffd5c149ed28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# валюта -> операция -> (колонка курса, направление сортировки лучших курсов)
+RATE_COLUMNS = {
+    'usd': {'buy': ('usd_buy', 'ASC'), 'sell': ('usd_sell', 'DESC')},
+    'eur': {'buy': ('eur_buy', 'ASC'), 'sell': ('eur_sell', 'DESC')},
+}
+# сколько лучших банков хранится в представлении (settings.BEST_RATES_VIEW_TOP_N)
+TOP_N = 50
+# колонки ответа API (CurrencyRateSchema) в топе банков
+PUBLIC_COLUMNS = (
+    'link', 'bank_en', 'bank_name', 'usd_buy', 'usd_sell', 'eur_buy', 'eur_sell', 'update_time'
+)
+
+
+def view_sql() -> str:
+    ranked = '\n    UNION ALL\n'.join(
+        f"""    SELECT '{currency}' AS currency, '{operation}' AS operation, {column} AS rate,
+           first_value({column}) OVER w AS best, row_number() OVER w AS position, currencyrates.*
+    FROM currencyrates
+    WINDOW w AS (ORDER BY {column} {direction}, id)"""
+        for currency, operations in RATE_COLUMNS.items()
+        for operation, (column, direction) in operations.items()
+    )
+    # время котировки - в UTC и в том же формате, что и при сериализации ответа API из таблицы
+    top_columns = ', '.join(f"'{column}', {column}" for column in PUBLIC_COLUMNS) + (
+        """, 'quoted_at', to_char(quoted_at AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS"+00:00"')"""
+    )
+    return f"""
+CREATE MATERIALIZED VIEW best_currency_rates AS
+WITH ranked AS (
+{ranked}
+)
+SELECT currency, operation,
+       min(best) AS rate,
+       array_agg(bank_name ORDER BY id) FILTER (WHERE rate = best) AS banks,
+       jsonb_agg(jsonb_build_object({top_columns}) ORDER BY position) FILTER (WHERE position <= {TOP_N}) AS top,
+       count(*) AS total
+FROM ranked
+GROUP BY currency, operation
+"""
+
+
+def upgrade() -> None:
+    # представление нужно только PostgreSQL, в SQLite лучшие курсы считаются запросами к таблице
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(view_sql())
+    # уникальный индекс обязателен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.execute('CREATE UNIQUE INDEX ix_best_currency_rates_key ON best_currency_rates (currency, operation)')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS best_currency_rates')
@@ -0,0 +1,36 @@
+"""add currency rate indexes
+
+Revision ID: ffd5c149ed28
+Revises: 58b611a9139b
+Create Date: 2026-10-18 23:20:17.402981
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'ffd5c149ed28'
+down_revision: Union[str, None] = '58b611a9139b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# курс -> направление сортировки лучших курсов (продажа - по убыванию)
+RATE_COLUMNS = {'usd_buy': 'ASC', 'usd_sell': 'DESC', 'eur_buy': 'ASC', 'eur_sell': 'DESC'}
+
+
+def upgrade() -> None:
+    for column, direction in RATE_COLUMNS.items():
+        op.create_index(
+            f'ix_currencyrates_{column}',
+            'currencyrates',
+            [sa.text(f'{column} {direction}'), 'id'],
+            unique=False,
+            postgresql_include=['bank_name', 'bank_en'],
+        )
+
+
+def downgrade() -> None:
+    for column in RATE_COLUMNS:
+        op.drop_index(f'ix_currencyrates_{column}', table_name='currencyrates')
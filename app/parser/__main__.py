@@ -0,0 +1,71 @@
+"""
+Воркер синхронизации курсов, отдельный от веб-процесса.
+
+    python -m app.parser sync          # плановая синхронизация (работает один лидер среди воркеров)
+    python -m app.parser sync --once   # однократная синхронизация, например из cron
+                                       # (код выхода 2, если синхронизацию сейчас выполняет лидер)
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+
+from app.dao.database import engine
+from app.parser.leader import create_leader_lock
+from app.parser.scheduler import SyncScheduler, add_or_update_data_to_db
+
+
+# при запуске через python -m модуль называется __main__: логгер задается явно, в иерархии "app"
+log = logging.getLogger("app.parser.worker")
+
+
+async def sync_once() -> int:
+    # однократный запуск берет ту же блокировку лидера, что и плановая синхронизация:
+    # иначе он гонялся бы с лидером (веб-процессом при SYNC_IN_WEB или воркером) за запись курсов и снимка
+    lock = create_leader_lock(engine)
+    if not await lock.acquire():
+        log.warning("Синхронизацию выполняет лидер, однократный запуск пропущен")
+        return 2
+    try:
+        snapshot, result = await add_or_update_data_to_db()
+    except Exception as e:
+        log.error("Синхронизация курсов завершилась ошибкой: %s", e)
+        return 1
+    finally:
+        await lock.release()
+    log.info(
+        "Синхронизация курсов завершена: банков %s, версия %s, изменилось %.0f%%",
+        len(snapshot.records), snapshot.version, result.change_ratio * 100,
+    )
+    return 0
+
+
+async def sync_forever() -> int:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    sync_scheduler = SyncScheduler()
+    try:
+        if not await sync_scheduler.start():
+            log.info("Синхронизацию выполняет другой воркер, ожидаем освобождения лидерства")
+        await stop.wait()
+    finally:
+        await sync_scheduler.stop()
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.parser", description="Синхронизация курсов валют с myfin")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sync = commands.add_parser("sync", help="синхронизировать курсы валют")
+    sync.add_argument("--once", action="store_true", help="выполнить одну синхронизацию и завершиться")
+    args = parser.parse_args(argv)
+
+    return asyncio.run(sync_once() if args.once else sync_forever())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Iterable
+
+
+class PageGroupState:
+    """Состояние группы страниц myfin, синхронизируемых с общим интервалом."""
+
+    def __init__(self, pages: tuple[int, ...], interval: timedelta):
+        self.pages = pages
+        self.interval = interval
+        # сглаженная доля изменившихся банков за синхронизацию (None - синхронизаций еще не было)
+        self.change_ratio: float | None = None
+        self.next_due: datetime | None = None
+        self.synced_at: datetime | None = None
+
+
+class AdaptiveSyncPlanner:
+    """
+    Планировщик интервала синхронизации по наблюдаемой частоте изменений курсов.
+    После каждой синхронизации интервал умножается на target_ratio / change_ratio
+    (не более чем вдвое за шаг) и ограничивается [min_interval, max_interval]:
+    в торговые часы курсы меняются часто и интервал сокращается, ночью растет до максимума.
+    С hot_pages=True у каждой страницы свой интервал, и страницы с частыми изменениями
+    опрашиваются чаще; полная синхронизация (с удалением пропавших банков) выполняется
+    не реже раза в max_interval.
+    """
+
+    def __init__(
+            self,
+            pages: Iterable[int],
+            initial_interval: timedelta,
+            min_interval: timedelta,
+            max_interval: timedelta,
+            target_ratio: float,
+            hot_pages: bool = False,
+            smoothing: float = 0.5,
+    ):
+        self.pages = tuple(pages)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_ratio = target_ratio
+        self.smoothing = smoothing
+        initial_interval = min(max(initial_interval, min_interval), max_interval)
+        groups = [(page,) for page in self.pages] if hot_pages else [self.pages]
+        self.groups = [PageGroupState(group, initial_interval) for group in groups]
+        self.last_full_sync_at: datetime | None = None
+
+        # счетчики для метрик
+        self.syncs = 0
+        self.failures = 0
+        self.page_requests = 0
+        self.changes = 0
+        self.decisions: deque[dict] = deque(maxlen=50)
+
+    def due_pages(self, now: datetime) -> tuple[int, ...]:
+        """Страницы, которые пора синхронизировать (все страницы - полная синхронизация)."""
+        if not self.last_full_sync_at or now - self.last_full_sync_at >= self.max_interval:
+            return self.pages
+        due = {page for group in self.groups if group.next_due <= now for page in group.pages}
+        return tuple(page for page in self.pages if page in due)
+
+    def next_run_at(self) -> datetime:
+        """Время следующей синхронизации: ближайший срок среди групп страниц и полной синхронизации."""
+        candidates = [group.next_due for group in self.groups if group.next_due]
+        if self.last_full_sync_at:
+            candidates.append(self.last_full_sync_at + self.max_interval)
+        return min(candidates)
+
+    def _next_interval(self, interval: timedelta, change_ratio: float) -> timedelta:
+        factor = self.target_ratio / change_ratio if change_ratio > 0 else 2.0
+        factor = min(max(factor, 0.5), 2.0)
+        return min(max(interval * factor, self.min_interval), self.max_interval)
+
+    def record(self, page_changes: dict[int, tuple[int, int]], now: datetime) -> None:
+        """
+        Учитывает результат синхронизации: page_changes - для каждой синхронизированной страницы
+        пара (количество изменившихся банков, количество банков на странице).
+        """
+        self.syncs += 1
+        self.page_requests += len(page_changes)
+        self.changes += sum(changed for changed, _ in page_changes.values())
+        if set(page_changes) == set(self.pages):
+            self.last_full_sync_at = now
+
+        for group in self.groups:
+            synced = [page_changes[page] for page in group.pages if page in page_changes]
+            if not synced:
+                continue
+            changed = sum(item[0] for item in synced)
+            total = sum(item[1] for item in synced)
+            ratio = changed / total if total else 0.0
+            if group.change_ratio is None:
+                group.change_ratio = ratio
+            else:
+                group.change_ratio = self.smoothing * ratio + (1 - self.smoothing) * group.change_ratio
+
+            previous = group.interval
+            group.interval = self._next_interval(group.interval, group.change_ratio)
+            group.synced_at = now
+            group.next_due = now + group.interval
+            self.decisions.append({
+                "at": now.isoformat(),
+                "pages": list(group.pages),
+                "changed": changed,
+                "total": total,
+                "change_ratio": round(group.change_ratio, 4),
+                "interval_seconds": previous.total_seconds(),
+                "next_interval_seconds": group.interval.total_seconds(),
+            })
+
+    def record_failure(self, pages: Iterable[int], now: datetime) -> None:
+        """После ошибки повторяем синхронизацию страниц через минимальный интервал, не меняя их интервалы."""
+        self.failures += 1
+        pages = set(pages)
+        for group in self.groups:
+            if pages & set(group.pages):
+                group.next_due = now + self.min_interval
+
+    def metrics(self) -> dict:
+        """
+        Решения планировщика и их влияние: текущие интервалы, ожидаемая задержка обнаружения
+        изменения (половина интервала) и число запросов к myfin в час.
+        """
+        page_intervals = {page: group.interval for group in self.groups for page in group.pages}
+        return {
+            "syncs": self.syncs,
+            "failures": self.failures,
+            "page_requests": self.page_requests,
+            "changes_detected": self.changes,
+            "changes_per_request": round(self.changes / self.page_requests, 4) if self.page_requests else 0.0,
+            "requests_per_hour": round(sum(3600 / i.total_seconds() for i in page_intervals.values()), 2),
+            "expected_staleness_seconds": round(
+                sum(i.total_seconds() for i in page_intervals.values()) / len(page_intervals) / 2, 1
+            ),
+            "last_full_sync_at": self.last_full_sync_at.isoformat() if self.last_full_sync_at else None,
+            "groups": [
+                {
+                    "pages": list(group.pages),
+                    "interval_seconds": group.interval.total_seconds(),
+                    "change_ratio": round(group.change_ratio, 4) if group.change_ratio is not None else None,
+                    "next_due": group.next_due.isoformat() if group.next_due else None,
+                }
+                for group in self.groups
+            ],
+            "decisions": list(self.decisions),
+        }
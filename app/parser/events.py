@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.api.shared_snapshot import SharedSnapshotFile, shared_snapshot_file
+from app.api.snapshot import RateSnapshot
+from app.config import settings
+from app.dao.database import engine
+
+
+log = logging.getLogger(__name__)
+
+
+def sync_event(snapshot: RateSnapshot) -> dict:
+    """Событие о завершении синхронизации: версия и хеш опубликованных данных."""
+    return {"version": snapshot.version, "data_hash": snapshot.data_hash, "banks": len(snapshot.records)}
+
+
+class PostgresSyncChannel:
+    """События о синхронизации через LISTEN/NOTIFY PostgreSQL: доходят до всех реплик API."""
+
+    def __init__(self, engine: AsyncEngine, channel: str):
+        self.engine = engine
+        self.channel = channel
+
+    async def publish(self, snapshot: RateSnapshot) -> None:
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self.channel, "payload": orjson.dumps(sync_event(snapshot)).decode()},
+            )
+        log.info("Отправлено событие о синхронизации курсов, версия %s", snapshot.version)
+
+    async def listen(self) -> AsyncIterator[dict]:
+        queue: asyncio.Queue[dict] = asyncio.Queue()
+
+        def on_notify(connection, pid, channel, payload):
+            queue.put_nowait(orjson.loads(payload))
+
+        async with self.engine.connect() as connection:
+            raw_connection = (await connection.get_raw_connection()).driver_connection
+            await raw_connection.add_listener(self.channel, on_notify)
+            try:
+                while True:
+                    yield await queue.get()
+            finally:
+                await raw_connection.remove_listener(self.channel, on_notify)
+
+
+class FileSyncChannel:
+    """
+    Замена очереди событий для одного хоста: событием служит новая версия общего файла снимка,
+    который воркер синхронизации записывает сам. Подписчики опрашивают заголовок файла.
+    """
+
+    def __init__(self, shared: SharedSnapshotFile, poll_seconds: float):
+        self.shared = shared
+        self.poll_seconds = poll_seconds
+
+    async def publish(self, snapshot: RateSnapshot) -> None:
+        log.debug("Событие о синхронизации курсов: общий файл снимка обновлен до версии %s", snapshot.version)
+
+    async def listen(self) -> AsyncIterator[dict]:
+        known_version = self.shared.read_version()
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            version = self.shared.read_version()
+            if version != known_version:
+                known_version = version
+                yield {"version": version}
+
+
+def create_sync_channel(engine: AsyncEngine, shared: SharedSnapshotFile | None):
+    """LISTEN/NOTIFY для PostgreSQL, общий файл снимка для остальных баз (None, если и он отключен)."""
+    if engine.dialect.name == "postgresql":
+        return PostgresSyncChannel(engine, settings.SYNC_EVENTS_CHANNEL)
+    if shared:
+        return FileSyncChannel(shared, settings.SNAPSHOT_POLL_SECONDS)
+    return None
+
+
+async def consume_sync_events(channel, handler: Callable[[dict], Awaitable[None]]) -> None:
+    """Передает события о синхронизации в handler, переподписываясь после обрыва соединения."""
+    while True:
+        try:
+            async for event in channel.listen():
+                try:
+                    await handler(event)
+                except Exception as e:
+                    log.error("Ошибка обработки события о синхронизации курсов: %s", e)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error("Подписка на события о синхронизации курсов прервана: %s", e)
+        await asyncio.sleep(settings.SNAPSHOT_POLL_SECONDS)
+
+
+# Канал событий о завершении синхронизации, общий для всего приложения
+sync_channel = create_sync_channel(engine, shared_snapshot_file)
@@ -0,0 +1,182 @@
+import asyncio
+import fcntl
+import logging
+import os
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.config import settings
+
+
+log = logging.getLogger(__name__)
+
+
+class FileLeaderLock:
+    """
+    Блокировка лидера на файле (flock) для SQLite и запуска на одном хосте.
+    Блокировку держит открытый дескриптор: при падении процесса ОС снимает ее сама,
+    и лидерство может перехватить другой воркер.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: int | None = None
+
+    async def acquire(self) -> bool:
+        """Пытается захватить блокировку без ожидания."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        self._write_owner()
+        return True
+
+    async def renew(self) -> bool:
+        """Продлевает аренду: проверяет, что файл блокировки не подменили и не удалили."""
+        if self._fd is None:
+            return False
+        try:
+            held = os.fstat(self._fd).st_ino == os.stat(self.path).st_ino
+        except FileNotFoundError:
+            held = False
+        if held:
+            self._write_owner()
+        else:
+            await self.release()
+        return held
+
+    async def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def _write_owner(self) -> None:
+        """Записывает pid лидера в файл блокировки (для диагностики)."""
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, str(os.getpid()).encode(), 0)
+
+
+class PostgresLeaderLock:
+    """
+    Блокировка лидера через advisory lock PostgreSQL, общая для всех воркеров и реплик.
+    Блокировка уровня сессии держится отдельным соединением: если лидер упал или соединение
+    оборвалось, PostgreSQL снимает ее сам.
+    """
+
+    def __init__(self, engine: AsyncEngine, key: int):
+        self.engine = engine
+        self.key = key
+        self._connection: AsyncConnection | None = None
+
+    async def acquire(self) -> bool:
+        connection = await self.engine.connect()
+        try:
+            acquired = await connection.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+            # не держим открытую транзакцию: блокировка уровня сессии переживает commit
+            await connection.commit()
+        except Exception:
+            await connection.close()
+            raise
+        if not acquired:
+            await connection.close()
+            return False
+        self._connection = connection
+        return True
+
+    async def renew(self) -> bool:
+        """Продлевает аренду: проверяет, что соединение живо и блокировка все еще за ним."""
+        if self._connection is None:
+            return False
+        try:
+            # ключ bigint advisory lock хранится в pg_locks как classid (старшие 32 бита) и objid (младшие),
+            # objsubid = 1 отличает его от блокировки по двум ключам int
+            held = await self._connection.scalar(
+                text(
+                    "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' "
+                    "AND ((classid::bigint << 32) | objid::bigint) = :key AND objsubid = 1 "
+                    "AND pid = pg_backend_pid() AND granted)"
+                ),
+                {"key": self.key},
+            )
+            await self._connection.commit()
+        except Exception as e:
+            log.warning("Соединение с блокировкой лидера потеряно: %s", e)
+            held = False
+        if not held:
+            await self.release()
+        return bool(held)
+
+    async def release(self) -> None:
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        try:
+            await connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            await connection.commit()
+        except Exception as e:
+            log.warning("Не удалось снять блокировку лидера: %s", e)
+        finally:
+            await connection.close()
+
+
+def create_leader_lock(engine: AsyncEngine):
+    """Advisory lock для PostgreSQL, файловая блокировка для остальных баз."""
+    if engine.dialect.name == "postgresql":
+        return PostgresLeaderLock(engine, settings.LEADER_LOCK_KEY)
+    return FileLeaderLock(os.path.join(settings.BASE_DIR, settings.LEADER_LOCK_PATH))
+
+
+class LeaderElection:
+    """
+    Выбор единственного процесса, выполняющего синхронизацию курсов.
+    Лидер раз в interval секунд продлевает аренду блокировки, остальные процессы
+    с тем же интервалом пытаются ее захватить (так лидерство переходит к другому воркеру при падении лидера).
+    """
+
+    def __init__(
+            self,
+            lock,
+            on_elected: Callable[[], Awaitable[None]],
+            on_demoted: Callable[[], Awaitable[None]],
+            interval: float,
+    ):
+        self.lock = lock
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.interval = interval
+        self.is_leader = False
+
+    async def step(self) -> bool:
+        """Один шаг выборов: продление аренды лидером или попытка захвата остальными."""
+        if self.is_leader:
+            if not await self.lock.renew():
+                self.is_leader = False
+                log.warning("Процесс %s потерял лидерство, синхронизация остановлена", os.getpid())
+                await self.on_demoted()
+        elif await self.lock.acquire():
+            self.is_leader = True
+            log.info("Процесс %s стал лидером и выполняет синхронизацию курсов", os.getpid())
+            await self.on_elected()
+        return self.is_leader
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.step()
+            except Exception as e:
+                log.error("Ошибка выбора лидера: %s", e)
+
+    async def stop(self) -> None:
+        """Снимает блокировку, чтобы лидерство сразу перешло к другому процессу."""
+        if self.is_leader:
+            self.is_leader = False
+            await self.on_demoted()
+        await self.lock.release()
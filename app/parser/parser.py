@@ -1,13 +1,16 @@
 import asyncio
-from typing import List, Optional
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
 
 from aiohttp import ClientError, ClientSession, ClientTimeout
 from bs4 import BeautifulSoup
-from loguru import logger
-from pydantic import BaseModel
 
-from app.api.schemas import CurrencyRateSchema
-from app.logger import log
+from app.api.schemas import RawCurrencyRate
+from app.logger import SAMPLED
+
+
+log = logging.getLogger(__name__)
 
 
 # Асинхронная функция для получения HTML с повторными попытками и экспоненциальной задержкой
@@ -17,19 +20,19 @@ async def fetch_html(url: str, session: ClientSession, retries: int = 3) -> Opti
         try:
             async with session.get(url) as response:
                 response.raise_for_status()  # Вызывает исключение при ошибке HTTP
-                log.debug(f"Содержимое response: {response}")
-                log.debug(f"Содержимое response.text(): {response.text()}")
-                return await response.text()
+                html = await response.text()
+                log.debug("Ответ %s: статус %s, %s символов", url, response.status, len(html))
+                return html
         except (ClientError, asyncio.TimeoutError) as e:
-            logger.error(f"Ошибка при запросе {url}: {e}")
+            log.error("Ошибка при запросе %s: %s", url, e)
             attempt += 1
             if attempt == retries:
-                logger.critical(f"Не удалось получить данные с {url} после {retries} попыток")
+                log.critical("Не удалось получить данные с %s после %s попыток", url, retries)
                 raise
             # Экспоненциальная задержка при попытках парсинга
             await asyncio.sleep(2 ** attempt)
         except Exception as e:
-            logger.error(f"Неизвестная ошибка при запросе {url}: {e}")
+            log.error("Неизвестная ошибка при запросе %s: %s", url, e)
             raise
 
 
@@ -45,8 +48,31 @@ def get_link_info(link_anchor):
     return None, None
 
 
+# Время на myfin указано по Москве (UTC+3, без перехода на летнее время)
+MOSCOW_TZ = timezone(timedelta(hours=3), "MSK")
+
+
+# Функция для разбора времени обновления курса: '26.02.2026 19:04' или только '19:04' для сегодняшних курсов
+def parse_update_time(value: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    try:
+        quoted_at = datetime.strptime(value, '%d.%m.%Y %H:%M').replace(tzinfo=MOSCOW_TZ)
+    except ValueError:
+        try:
+            time = datetime.strptime(value, '%H:%M').time()
+        except ValueError:
+            log.warning("Не удалось разобрать время обновления курса: %r", value)
+            return None
+        now = (now or datetime.now(timezone.utc)).astimezone(MOSCOW_TZ)
+        quoted_at = datetime.combine(now.date(), time, tzinfo=MOSCOW_TZ)
+        # время без даты из будущего - это вчерашнее обновление, показанное до смены даты на сайте
+        if quoted_at > now:
+            quoted_at -= timedelta(days=1)
+    # в UTC, как и значения из БД: одинаковые курсы дают одинаковые записи и хеш снимка
+    return quoted_at.astimezone(timezone.utc)
+
+
 # Функция для парсинга таблицы с валютами
-def parse_currency_table(html: str) -> List[BaseModel]:
+def parse_currency_table(html: str) -> List[RawCurrencyRate]:
     soup = BeautifulSoup(html, 'html.parser')
 
     try:
@@ -67,7 +93,7 @@ def parse_currency_table(html: str) -> List[BaseModel]:
                 eur_buy = float(row.find_all('td', class_='EUR')[0].get_text(strip=True).replace(',', '.'))
                 eur_sell = float(row.find_all('td', class_='EUR')[1].get_text(strip=True).replace(',', '.'))
             except (ValueError, IndexError) as e:
-                logger.warning(f"Ошибка при парсинге курсов валют для {bank_name}: {e}")
+                log.warning("Ошибка при парсинге курсов валют для %s: %s", bank_name, e)
                 continue  # Пропускаем этот банк, т.к. курс не удалось извлечь
 
             # получаем время последнего обновления курса валют конкретного банка.
@@ -80,36 +106,45 @@ def parse_currency_table(html: str) -> List[BaseModel]:
             if link_info[0] is None or link_info[1] is None:
                 continue 
 
-            currencies.append(CurrencyRateSchema(**{
-                'bank_name': bank_name, # /sberbank (link_info[2])
-                'bank_en': link_info[1], # /bank
-                'link': link_info[0], # ''
-                'usd_buy': usd_buy,
-                'usd_sell': usd_sell,
-                'eur_buy': eur_buy,
-                'eur_sell': eur_sell,
-                'update_time': update_time,
-            }))
-            logger.info(f"{bank_name=}")
+            # кортеж без валидации: типы уже приведены выше, проверка (если включена) - пакетом перед записью
+            currencies.append(RawCurrencyRate(
+                bank_name=bank_name, # /sberbank (link_info[2])
+                bank_en=link_info[1], # /bank
+                link=link_info[0], # ''
+                usd_buy=usd_buy,
+                usd_sell=usd_sell,
+                eur_buy=eur_buy,
+                eur_sell=eur_sell,
+                update_time=update_time,
+                quoted_at=parse_update_time(update_time),
+            ))
+            log.debug("Разобран банк %s", bank_name, extra=SAMPLED)
         return currencies
     except Exception as e:
-        logger.error(f"Ошибка при парсинге HTML: {e}")
+        log.error("Ошибка при парсинге HTML: %s", e)
         return []
 
 
 # Функция для получения данных с одной страницы
-async def fetch_page_data(url: str, session: ClientSession) -> List[BaseModel]:
+async def fetch_page_data(url: str, session: ClientSession) -> List[RawCurrencyRate]:
     html = await fetch_html(url, session)
     if html:
         return parse_currency_table(html)
     return []
 
 
-# Функция для сбора данных с нескольких страниц асинхронно с обработкой ошибок
-async def fetch_all_currencies() -> List[BaseModel]:
-    all_currencies = []
-    base_url = 'https://ru.myfin.by/currency?page='
+# Номера страниц myfin с курсами валют
+PAGES = (1, 2, 3, 4)
+
+
+def page_url(page: int) -> str:
+    # Первая страница имеет другой URL, у следующих страниц общий URL
+    if page == 1:
+        return 'https://ru.myfin.by/currency'
+    return f'https://ru.myfin.by/currency?page={page}'
+
 
+def create_client_session() -> ClientSession:
     # Создаем сессию с таймаутом
     timeout = ClientTimeout(total=10, connect=5)
 
@@ -117,17 +152,15 @@ async def fetch_all_currencies() -> List[BaseModel]:
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0.0.0 YaBrowser/24.1.0.0"
     }
-    async with ClientSession(timeout=timeout, headers=headers) as session:
-        tasks = []
+    return ClientSession(timeout=timeout, headers=headers)
 
-        # Для первой страницы, потому что она имеет другой URL
-        tasks.append(fetch_page_data('https://ru.myfin.by/currency', session))
 
-        # Для следующих страниц, потому что у них общий URL
+# Функция для сбора данных с нескольких страниц асинхронно с обработкой ошибок
+async def fetch_currency_pages(pages: Iterable[int] = PAGES) -> Dict[int, List[RawCurrencyRate]]:
+    pages = list(pages)
+    async with create_client_session() as session:
         # Создаем асинхронные задачи для получения данных с нескольких страниц
-        for page in range(2, 5):
-            url = f'{base_url}{page}'
-            tasks.append(fetch_page_data(url, session))
+        tasks = [fetch_page_data(page_url(page), session) for page in pages]
 
         # Дожидаемся выполнения всех задач
         # Вариант, где все задачи выполняются параллельно
@@ -139,11 +172,16 @@ async def fetch_all_currencies() -> List[BaseModel]:
         #     result = await task  # ждём каждую страницу по очереди
         #     results.append(result)
 
-        # Обрабатываем полученные данные
-        for currencies in results:
-            log.info(f"Количество банков на страницах: {len(currencies)}")
-            all_currencies.extend(currencies)
+    for page, currencies in zip(pages, results):
+        log.info("Количество банков на странице %s: %s", page, len(currencies))
+    return dict(zip(pages, results))
+
+
+async def fetch_all_currencies() -> List[RawCurrencyRate]:
+    results = await fetch_currency_pages()
 
-        log.info(f"Общее количество банков: {len(all_currencies)}")
+    # Обрабатываем полученные данные
+    all_currencies = [currency for currencies in results.values() for currency in currencies]
+    log.info("Общее количество банков: %s", len(all_currencies))
 
-    return all_currencies
\ No newline at end of file
+    return all_currencies
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from typing import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.dao import CurrencyRateDAO
+from app.api.schemas import RawCurrencyRate, SyncResult, validate_raw_rates
+from app.config import settings
+from app.parser.parser import PAGES, create_client_session, fetch_html, page_url, parse_currency_table
+
+
+log = logging.getLogger(__name__)
+
+
+# Признак окончания потока в очереди между стадиями
+_DONE = object()
+
+
+async def fetch_stage(pages: tuple[int, ...], html_queue: asyncio.Queue, concurrency: int) -> None:
+    """Загружает страницы параллельно и передает HTML парсеру по мере готовности."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with create_client_session() as session:
+        async def fetch(page: int) -> None:
+            async with semaphore:
+                html = await fetch_html(page_url(page), session)
+            # очередь ограничена: если парсер не успевает, загрузка ждет (backpressure)
+            await html_queue.put((page, html))
+
+        await asyncio.gather(*(fetch(page) for page in pages))
+    await html_queue.put(_DONE)
+
+
+async def parse_stage(html_queue: asyncio.Queue, record_queue: asyncio.Queue) -> None:
+    """Разбирает страницы в отдельном потоке (BeautifulSoup не блокирует event loop) и передает записи дальше."""
+    while (item := await html_queue.get()) is not _DONE:
+        page, html = item
+        records = await asyncio.to_thread(parse_currency_table, html) if html else []
+        # HTML и дерево разбора больше не нужны: в памяти одновременно не больше queue_size страниц
+        del html, item
+        log.info("Количество банков на странице %s: %s", page, len(records))
+        for record in records:
+            await record_queue.put((page, record))
+    await record_queue.put(_DONE)
+
+
+async def write_stage(
+        session: AsyncSession,
+        record_queue: asyncio.Queue,
+        pages: tuple[int, ...],
+        batch_size: int,
+        delete_missing: bool,
+) -> SyncResult:
+    """
+    Собирает банки пакетами по мере разбора, после загрузки всех страниц пишет их в БД
+    и удаляет банки, которых не было ни на одной странице.
+    Транзакция открывается только после загрузки: ее длительность не зависит от myfin
+    (ожидания страниц и повторов), строки PostgreSQL и право записи SQLite не удерживаются, пока ждем сеть.
+    """
+    page_banks = {page: set() for page in pages}
+    batches: list[list[RawCurrencyRate]] = []
+    batch = []
+
+    def collect(batch: list[RawCurrencyRate]) -> None:
+        if settings.SYNC_VALIDATE_RECORDS:
+            # одна проверка на пакет через TypeAdapter вместо модели pydantic на каждую запись
+            batch = validate_raw_rates(batch)
+        batches.append(batch)
+
+    while (item := await record_queue.get()) is not _DONE:
+        page, record = item
+        page_banks[page].add(record.bank_en)
+        batch.append(record)
+        if len(batch) >= batch_size:
+            collect(batch)
+            batch = []
+    if batch:
+        collect(batch)
+
+    db_rows, sync_result = await CurrencyRateDAO.start_currency_sync(session)
+    sync_result.page_banks = page_banks
+    for batch in batches:
+        await CurrencyRateDAO.upsert_currency_batch(session, batch, db_rows, sync_result)
+
+    # удаление пропавших банков возможно только после того, как получены все страницы
+    return await CurrencyRateDAO.finish_currency_sync(session, db_rows, sync_result, delete_missing)
+
+
+async def run_sync_pipeline(
+        session: AsyncSession,
+        pages: Iterable[int] = PAGES,
+        batch_size: int | None = None,
+        queue_size: int | None = None,
+        concurrency: int | None = None,
+) -> SyncResult:
+    """
+    Потоковая синхронизация курсов: загрузка -> парсинг и валидация -> пакетная запись в БД.
+    Стадии связаны ограниченными очередями: страницы разбираются по мере загрузки, и в памяти
+    не копятся все HTML-страницы и деревья разбора, а только записи банков до записи в БД (см. write_stage).
+    Все пакеты пишутся в транзакции session: коммит (или откат при ошибке любой стадии) - на вызывающем.
+    """
+    pages = tuple(pages)
+    batch_size = batch_size or settings.SYNC_BATCH_SIZE
+    queue_size = queue_size or settings.SYNC_QUEUE_SIZE
+    html_queue = asyncio.Queue(maxsize=queue_size)
+    record_queue = asyncio.Queue(maxsize=batch_size * queue_size)
+
+    tasks = [
+        asyncio.create_task(fetch_stage(pages, html_queue, concurrency or settings.SYNC_FETCH_CONCURRENCY)),
+        asyncio.create_task(parse_stage(html_queue, record_queue)),
+        asyncio.create_task(write_stage(session, record_queue, pages, batch_size, set(pages) == set(PAGES))),
+    ]
+    try:
+        *_, sync_result = await asyncio.gather(*tasks)
+    except BaseException:
+        # ошибка одной стадии останавливает остальные, иначе они зависнут на очередях
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return sync_result
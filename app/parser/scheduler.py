@@ -1,12 +1,202 @@
+import asyncio
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
+
+import logging
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.date import DateTrigger
+
 from app.api.dao import CurrencyRateDAO
+from app.api.schemas import CurrencyRateSchema, SyncResult
+from app.api.shared_snapshot import shared_snapshot_file
+from app.api.snapshot import RateSnapshot, rate_snapshot
+from app.config import settings
+from app.dao.database import engine
 from app.dao.session_maker import session_manager
-from app.parser.parser import fetch_all_currencies
-from app.logger import log
+from app.parser.events import sync_channel
+from app.parser.leader import LeaderElection, create_leader_lock
+from app.parser.adaptive import AdaptiveSyncPlanner
+from app.parser.parser import PAGES
+from app.parser.pipeline import run_sync_pipeline
+
+
+log = logging.getLogger(__name__)
 
 
 # Декоратор для добавления и обновления данных
 @session_manager.connection(commit=True)
-async def add_or_update_data_to_db(session):
-    records = await fetch_all_currencies()
-    # log.info(f"Парсер вернул банков: {len(records)}")
-    await CurrencyRateDAO.bulk_update_currency(session=session, records=records)
\ No newline at end of file
+async def sync_rates_to_db(session, pages: tuple[int, ...] = PAGES) -> tuple[SyncResult, list[CurrencyRateSchema]]:
+    # страницы загружаются и разбираются потоково, в БД банки пишутся после загрузки всех страниц
+    # (транзакция не ждет myfin), пропавшие банки удаляются только при синхронизации всех страниц
+    result = await run_sync_pipeline(session, pages)
+
+    rows = await CurrencyRateDAO.find_all(session=session)
+    return result, [CurrencyRateSchema.model_validate(row) for row in rows]
+
+
+@session_manager.connection(commit=True)
+async def refresh_best_rates_view(session) -> None:
+    await CurrencyRateDAO.refresh_best_rates_view(session=session)
+
+
+# представление лучших курсов не удалось обновить: следующая синхронизация пересчитает его,
+# даже если курсы не изменились (иначе устаревшее представление жило бы до следующего изменения)
+best_rates_view_stale = False
+
+
+async def add_or_update_data_to_db(pages: tuple[int, ...] = PAGES) -> tuple[RateSnapshot, SyncResult]:
+    result, records = await sync_rates_to_db(pages=pages)
+
+    # представление лучших курсов пересчитывается после коммита синхронизации, если курсы изменились
+    # или прошлый пересчет не удался; при ошибке снимок публикуется как обычно
+    global best_rates_view_stale
+    if result.added or result.updated or result.deleted or best_rates_view_stale:
+        try:
+            await refresh_best_rates_view()
+            best_rates_view_stale = False
+        except Exception as e:
+            best_rates_view_stale = True
+            log.error("Не удалось обновить представление лучших курсов, повторим при следующей синхронизации: %s", e)
+
+    # после коммита публикуем снимок курсов, чтобы статистика считалась один раз за синхронизацию,
+    # записываем его в общий файл для остальных воркеров и сообщаем о завершении синхронизации
+    snapshot = await rate_snapshot.publish_in_thread(records, shared=shared_snapshot_file)
+    if sync_channel:
+        await sync_channel.publish(snapshot)
+    return snapshot, result
+
+
+@session_manager.connection(commit=False)
+async def load_snapshot_from_db(session, synced: bool = True) -> RateSnapshot:
+    """Строит снимок курсов по данным в базе (для процессов, которые сами не синхронизируют курсы)."""
+    rows = await CurrencyRateDAO.find_all(session=session)
+    return await rate_snapshot.publish_in_thread(
+        (CurrencyRateSchema.model_validate(row) for row in rows), synced=synced
+    )
+
+
+async def load_last_snapshot() -> RateSnapshot | None:
+    """
+    Быстрый старт: последний опубликованный снимок из общего файла, а если его нет - из базы.
+    Не обращается к myfin, поэтому занимает миллисекунды и не зависит от его доступности.
+    """
+    snapshot = await rate_snapshot.refresh_from(shared_snapshot_file) if shared_snapshot_file else None
+    if snapshot is None:
+        try:
+            snapshot = await load_snapshot_from_db(synced=False)
+        except Exception as e:
+            log.error("Не удалось загрузить курсы из базы при старте: %s", e)
+            return None
+    log.info(
+        "Загружен последний снимок курсов: банков %s, состояние %s", len(snapshot.records), rate_snapshot.freshness()
+    )
+    return snapshot
+
+
+class SyncScheduler:
+    """
+    Плановая синхронизация курсов в процессе-лидере.
+    Используется и веб-приложением, и отдельным воркером (python -m app.parser).
+    Время следующей синхронизации (и при SYNC_HOT_PAGES - набор страниц) выбирает AdaptiveSyncPlanner.
+    """
+
+    JOB_ID = "currency_update_job"
+
+    def __init__(self):
+        self.scheduler = AsyncIOScheduler()
+        self.planner = AdaptiveSyncPlanner(
+            PAGES,
+            initial_interval=timedelta(minutes=settings.SYNC_INTERVAL_MINUTES),
+            min_interval=timedelta(minutes=settings.SYNC_INTERVAL_MIN_MINUTES),
+            max_interval=timedelta(minutes=settings.SYNC_INTERVAL_MAX_MINUTES),
+            target_ratio=settings.SYNC_TARGET_CHANGE_RATIO,
+            hot_pages=settings.SYNC_HOT_PAGES,
+        )
+        self.election = LeaderElection(
+            create_leader_lock(engine),
+            on_elected=self.start_sync,
+            on_demoted=self.stop_sync,
+            interval=settings.LEADER_RENEW_SECONDS,
+        )
+        self._election_task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.election.is_leader
+
+    def update_next_sync_at(self, event=None) -> None:
+        # время следующей синхронизации нужно для Cache-Control ответов с курсами
+        job = self.scheduler.get_job(self.JOB_ID)
+        rate_snapshot.next_sync_at = job.next_run_time if job else None
+
+    def schedule_sync(self, run_at: datetime) -> None:
+        # задача с защитой от дублирования, если лидерство получено повторно
+        self.scheduler.add_job(
+            self.run_sync,
+            trigger=DateTrigger(run_date=run_at),
+            id=self.JOB_ID,
+            replace_existing=True,
+        )
+        self.update_next_sync_at()
+
+    async def run_sync(self) -> None:
+        """Синхронизирует страницы, которые пора обновить, и планирует следующую синхронизацию."""
+        now = datetime.now(timezone.utc)
+        pages = self.planner.due_pages(now)
+        try:
+            if pages:
+                _, result = await add_or_update_data_to_db(pages)
+                self.planner.record(
+                    {page: (len(banks & result.changed_banks), len(banks)) for page, banks in result.page_banks.items()},
+                    now,
+                )
+        except Exception as e:
+            log.error("Ошибка синхронизации курсов: %s", e)
+            self.planner.record_failure(pages, now)
+        finally:
+            if self.is_leader:
+                run_at = self.planner.next_run_at()
+                log.info("Следующая синхронизация курсов: %s", run_at.isoformat())
+                self.schedule_sync(run_at)
+
+    async def start_sync(self) -> None:
+        """
+        Синхронизация курсов сразу после избрания и далее по расписанию (только у лидера).
+        Первая синхронизация выполняется планировщиком в фоне и не задерживает старт приложения.
+        """
+        self.schedule_sync(datetime.now(timezone.utc))
+
+    async def stop_sync(self) -> None:
+        if self.scheduler.get_job(self.JOB_ID):
+            self.scheduler.remove_job(self.JOB_ID)
+
+    def metrics(self) -> dict:
+        return {
+            "leader": self.is_leader,
+            "next_sync_at": rate_snapshot.next_sync_at.isoformat() if rate_snapshot.next_sync_at else None,
+            "best_rates_view_stale": best_rates_view_stale,
+            **self.planner.metrics(),
+        }
+
+    async def start(self) -> bool:
+        """Запускает планировщик и выборы лидера. Возвращает True, если этот процесс стал лидером."""
+        self.scheduler.start()
+        self.scheduler.add_listener(self.update_next_sync_at, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+        log.info("Планировщик запущен")
+
+        is_leader = await self.election.step()
+        self._election_task = asyncio.create_task(self.election.run())
+        return is_leader
+
+    async def stop(self) -> None:
+        if self._election_task:
+            self._election_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._election_task
+        await self.election.stop()
+
+        if self.scheduler.running:
+            # Остановка планировщика при завершении работы приложения
+            self.scheduler.shutdown()
+            log.info("Планировщик остановлен")
@@ -0,0 +1,48 @@
+"""
+Замер задержки поиска банков по триграммному индексу.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_bank_search
+"""
+import random
+import time
+
+from app.api.search import BankSearchIndex
+
+
+CONSONANTS = "бвгджзклмнпрстфхцчш"
+VOWELS = "аеиоуыя"
+QUERIES = ["сбер", "тинькоф", "газпромбанк", "альфа банк", "уралсиб", "россельхоз"]
+
+
+def build_index(size: int) -> BankSearchIndex:
+    rng = random.Random(size)
+    index = BankSearchIndex()
+    for i in range(size):
+        syllables = (rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(2, 5)))
+        index.add(f"bank-{i}", f"{''.join(syllables).capitalize()} Банк")
+    return index
+
+
+def bench(size: int, repeat: int = 200) -> None:
+    started = time.perf_counter()
+    index = build_index(size)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    timings = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            started = time.perf_counter()
+            index.search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+
+    print(
+        f"банков={size:>6}  построение={build_ms:8.1f} мс  "
+        f"p50={timings[len(timings) // 2]:.3f} мс  p99={timings[int(len(timings) * 0.99)]:.3f} мс"
+    )
+
+
+if __name__ == "__main__":
+    for size in (300, 5_000, 50_000):
+        bench(size, repeat=200 if size < 50_000 else 10)
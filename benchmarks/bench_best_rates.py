@@ -0,0 +1,73 @@
+"""
+Задержка /best_purchase_rates/?usd=true&eur=true: прежние три последовательных запроса
+(COUNT(*) + ORDER BY/LIMIT для USD + для EUR) против одного запроса _find_best_rates:
+UNION ALL из ORDER BY/LIMIT по каждой валюте и количество банков скалярным подзапросом COUNT.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_best_rates [--rtt-ms 1.0] [--url postgresql+asyncpg://...]
+
+--rtt-ms добавляет задержку сети перед каждым запросом (для SQLite в памяти её нет).
+"""
+import argparse
+import asyncio
+
+from benchmarks.common import create_rates_db, measure
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.dao import CurrencyRateDAO
+from app.api.models import CurrencyRate
+
+
+ITERATIONS = 300
+
+
+async def legacy_best_purchase_rates(session: AsyncSession, count: int = 10):
+    total = (await session.execute(select(func.count(CurrencyRate.id)))).scalar()
+    result = {}
+    for currency_type, field in (("usd", CurrencyRate.usd_buy), ("eur", CurrencyRate.eur_buy)):
+        res = await session.execute(select(*CurrencyRateDAO.public_columns).order_by(field).limit(count))
+        result[currency_type] = [row._asdict() for row in res]
+    return total, result
+
+
+async def main(rtt_ms: float, url: str | None, banks: int):
+    engine, _ = await create_rates_db(banks=banks, **({"url": url} if url else {}))
+
+    class NetworkSession(AsyncSession):
+        async def execute(self, *args, **kwargs):
+            if rtt_ms:
+                await asyncio.sleep(rtt_ms / 1000)
+            return await super().execute(*args, **kwargs)
+
+    session_maker = async_sessionmaker(engine, class_=NetworkSession, expire_on_commit=False)
+
+    async def legacy():
+        async with session_maker() as session:
+            return await legacy_best_purchase_rates(session)
+
+    async def single_query():
+        async with session_maker() as session:
+            return await CurrencyRateDAO.find_best_purchase_rates(session=session, usd=True, eur=True, count=10)
+
+    async with session_maker() as session:
+        assert await legacy_best_purchase_rates(session) == await CurrencyRateDAO.find_best_purchase_rates(
+            session=session, usd=True, eur=True, count=10
+        )
+
+    print(f"банков={banks}, задержка сети={rtt_ms} мс")
+    for title, func_ in (("три запроса", legacy), ("один запрос", single_query)):
+        elapsed_ms, _ = await measure(func_, ITERATIONS)
+        print(f"  {title:<12} {elapsed_ms:8.3f} мс/запрос")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--banks", type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(main(args.rtt_ms, args.url, args.banks))
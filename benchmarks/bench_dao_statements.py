@@ -0,0 +1,89 @@
+"""
+Накладные расходы BaseDAO на вызов: до - select(...).filter_by(**filters) строится на каждый вызов,
+и SQLAlchemy каждый раз заново вычисляет ключ кеша компиляции; после - запрос из кеша BaseDAO
+(bindparam вместо значений), ключ кеша компиляции запомнен в объекте запроса.
+Считается время построения запроса с ключом кеша и полный вызов (SQLite в памяти) для
+find_one_or_none_by_id, find_one_or_none и count. Сообщения приложения отключены (benchmarks.common).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_dao_statements [--calls 20000]
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import create_rates_db
+
+from pydantic import BaseModel
+from sqlalchemy import func, select
+
+from app.api.dao import CurrencyRateDAO
+from app.api.models import CurrencyRate
+
+
+class BankFilter(BaseModel):
+    bank_en: str
+
+
+def before_statements(data_id: int, filters: BaseModel):
+    filter_dict = filters.model_dump(exclude_unset=True)
+    return (
+        (select(CurrencyRate).filter_by(id=data_id), {}),
+        (select(CurrencyRate).filter_by(**filter_dict), {}),
+        (select(func.count(CurrencyRate.id)).filter_by(**filter_dict), {}),
+    )
+
+
+def after_statements(data_id: int, filters: BaseModel):
+    keys, params = CurrencyRateDAO._filter_keys(filters.model_dump(exclude_unset=True))
+    return (
+        (CurrencyRateDAO._statement("by_id", (), lambda: None), {"data_id": data_id}),
+        (CurrencyRateDAO._statement("select", keys, lambda: None), params),
+        (CurrencyRateDAO._statement("count", keys, lambda: None), params),
+    )
+
+
+async def before_calls(session, data_id: int, filters: BaseModel):
+    for query, _ in before_statements(data_id, filters):
+        (await session.execute(query)).scalar_one_or_none()
+
+
+async def after_calls(session, data_id: int, filters: BaseModel):
+    await CurrencyRateDAO.find_one_or_none_by_id(session, data_id)
+    await CurrencyRateDAO.find_one_or_none(session, filters)
+    await CurrencyRateDAO.count(session, filters)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20_000)
+    parser.add_argument("--banks", type=int, default=300)
+    args = parser.parse_args()
+
+    engine, session_maker = await create_rates_db(banks=args.banks)
+    filters = [BankFilter(bank_en=f"bank-{i % args.banks}") for i in range(args.calls)]
+
+    async with session_maker() as session:
+        # прогрев: кеш BaseDAO и кеш компиляции SQLAlchemy
+        await after_calls(session, 1, filters[0])
+        await before_calls(session, 1, filters[0])
+
+        for label, build in (("до", before_statements), ("после", after_statements)):
+            started = time.perf_counter()
+            for i, item in enumerate(filters):
+                for query, _ in build(i + 1, item):
+                    query._generate_cache_key()
+            elapsed = time.perf_counter() - started
+            print(f"{label:<6} построение запроса и ключа кеша: {elapsed / args.calls / 3 * 1e6:6.1f} мкс на запрос")
+
+        for label, call in (("до", before_calls), ("после", after_calls)):
+            started = time.perf_counter()
+            for i, item in enumerate(filters):
+                await call(session, i % args.banks + 1, item)
+            elapsed = time.perf_counter() - started
+            print(f"{label:<6} вызов DAO (SQLite в памяти):       {elapsed / args.calls / 3 * 1e6:6.1f} мкс на запрос")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""
+Длительная параллельная нагрузка на пул соединений: --clients клиентов без пауз выполняют запрос
+/best_purchase_rates/ (CurrencyRateDAO.find_best_purchase_rates) в течение --seconds секунд
+при разных размерах пула. Считаются пропускная способность, задержка (p50/p95),
+время ожидания соединения из пула (MeteredQueuePool) и отказы по таймауту.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_db_pool [--clients 50] [--rtt-ms 2] [--url postgresql+asyncpg://...]
+
+По умолчанию используется файл SQLite во временном каталоге; --rtt-ms добавляет задержку сети
+к каждому запросу, пока соединение выдано клиенту (для SQLite её нет).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.common import create_rates_db
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.api.dao import CurrencyRateDAO
+from app.config import settings
+from app.dao.database import MeteredQueuePool, pool_stats
+
+
+async def run(url: str, pool_size: int, max_overflow: int, clients: int, seconds: float, rtt_ms: float) -> None:
+    engine = create_async_engine(
+        url,
+        poolclass=MeteredQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+
+    class NetworkSession(AsyncSession):
+        async def execute(self, *args, **kwargs):
+            result = await super().execute(*args, **kwargs)
+            if rtt_ms:
+                await asyncio.sleep(rtt_ms / 1000)
+            return result
+
+    session_maker = async_sessionmaker(engine, class_=NetworkSession, expire_on_commit=False)
+    latencies, timeouts = [], 0
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        nonlocal timeouts
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                async with session_maker() as session:
+                    await CurrencyRateDAO.find_best_purchase_rates(session=session, usd=True, eur=True, count=10)
+            except PoolTimeoutError:
+                timeouts += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    stats = pool_stats(engine)
+    await engine.dispose()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+    print(
+        f"пул {pool_size:>3}+{max_overflow:<3} {len(latencies) / elapsed:8.0f} запр/с  "
+        f"p50 {statistics.median(latencies) * 1000:7.2f} мс  p95 {p95 * 1000:7.2f} мс  "
+        f"ожидание пула ср. {stats['wait_avg_ms']:7.2f} мс, макс. {stats['wait_max_ms']:8.2f} мс  "
+        f"таймаутов {timeouts}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--banks", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--rtt-ms", type=float, default=2.0)
+    parser.add_argument("--pool-sizes", default="2,5,10,20")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.sqlite3')}"
+        engine, _ = await create_rates_db(banks=args.banks, url=url)
+        await engine.dispose()
+
+        print(f"клиентов={args.clients}, задержка сети={args.rtt_ms} мс, {args.seconds} с на размер пула")
+        for pool_size in map(int, args.pool_sizes.split(",")):
+            await run(url, pool_size, 0, args.clients, args.seconds, args.rtt_ms)
+        # настройки по умолчанию: постоянные соединения и переполнение при пиках
+        await run(url, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW, args.clients, args.seconds, args.rtt_ms)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Стоимость логирования на запрос с авторизацией: get_current_user и поиск пользователя по ID (BaseDAO).
+До - три print() в get_current_user, два сообщения loguru INFO с f-строками в find_one_or_none_by_id
+и обработчик DEBUG на корневом логгере (в него писал и aiosqlite на каждую операцию).
+После - logging с ленивым форматированием: сообщения BaseDAO на уровне DEBUG, при LOG_LEVEL=INFO
+они не форматируются; при DEBUG частые события выводятся выборочно через фоновую очередь.
+Вывод идет в os.devnull, поэтому считается только работа процесса, без записи в терминал.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_logging [--requests 5000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from benchmarks.common import create_rates_db
+
+from loguru import logger
+
+from app.api.dao import CurrencyRateDAO
+from app.logger import configure_logging, stop_logging
+
+
+DAO_LEVEL = {"app.dao.base": "NOTSET"}
+
+
+async def before_request(session, data_id: int, devnull) -> None:
+    expire = int(time.time()) + 1800
+    print(f"{expire=}", file=devnull)
+    expire_time = datetime.fromtimestamp(expire, tz=timezone.utc)
+    print(f"{expire_time=}", file=devnull)
+    time_now = datetime.now(timezone.utc)
+    print(f"{time_now=}", file=devnull)
+    logger.info(f"Поиск {CurrencyRateDAO.model.__name__} с ID: {data_id}")
+    record = await CurrencyRateDAO.find_one_or_none_by_id(session, data_id)
+    logger.info(f"Запись с ID {data_id} {'найдена' if record else 'не найдена'}.")
+
+
+async def after_request(session, data_id: int, devnull) -> None:
+    expire = int(time.time()) + 1800
+    datetime.fromtimestamp(expire, tz=timezone.utc) < datetime.now(timezone.utc)
+    await CurrencyRateDAO.find_one_or_none_by_id(session, data_id)
+
+
+def configure_before(devnull) -> None:
+    """Прежняя настройка: корневой логгер DEBUG со своим обработчиком и loguru на уровне DEBUG."""
+    stop_logging()
+    root = logging.getLogger()
+    root.handlers = [logging.StreamHandler(devnull)]
+    root.setLevel(logging.DEBUG)
+    logging.getLogger("app").setLevel(logging.NOTSET)
+    # сообщения BaseDAO прежней версии - loguru в before_request, нынешние не учитываются
+    logging.getLogger("app.dao.base").setLevel(logging.WARNING)
+    logger.remove()
+    logger.add(devnull, level="DEBUG")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--banks", type=int, default=300)
+    args = parser.parse_args()
+
+    engine, session_maker = await create_rates_db(banks=args.banks)
+    with open(os.devnull, "w") as devnull:
+        variants = (
+            ("до", before_request, lambda: configure_before(devnull)),
+            ("после, INFO", after_request, lambda: configure_logging("INFO", DAO_LEVEL, stream=devnull)),
+            ("после, DEBUG", after_request, lambda: configure_logging("DEBUG", DAO_LEVEL, 100, stream=devnull)),
+        )
+        results = {}
+        async with session_maker() as session:
+            for label, request, configure in variants:
+                configure()
+                await request(session, 1, devnull)  # прогрев
+                started = time.perf_counter()
+                for i in range(args.requests):
+                    await request(session, i % args.banks + 1, devnull)
+                results[label] = (time.perf_counter() - started) / args.requests * 1e6
+                stop_logging()
+                print(f"{label:<13} {results[label]:7.1f} мкс на запрос")
+    await engine.dispose()
+    print(f"логирование на запрос: -{results['до'] - results['после, INFO']:.1f} мкс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+Пропускная способность и CPU на запрос /api/all_currency/:
+до - чтение из БД, orjson и gzip на каждый запрос (как делает прокси),
+после - готовое сжатое тело из снимка.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_precompressed
+"""
+import asyncio
+import gzip
+import time
+from unittest.mock import MagicMock
+
+from benchmarks.common import create_rates_db
+
+from app.api.dao import CurrencyRateDAO
+from app.api.schemas import CurrencyRateSchema
+from app.api.snapshot import EncodedBody, rate_snapshot
+from app.auth.dependencies import get_current_user
+from app.dao.session_maker import session_manager
+from app.main import app
+
+
+REQUESTS = 500
+
+
+async def call_asgi(path: str, accept_encoding: str) -> bytes:
+    """Выполняет GET-запрос к приложению напрямую через ASGI и возвращает сырое тело ответа."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"accept-encoding", accept_encoding.encode())],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return b"".join(body)
+
+
+async def run(title: str, request) -> None:
+    await request()
+    started_wall, started_cpu = time.perf_counter(), time.process_time()
+    for _ in range(REQUESTS):
+        await request()
+    wall, cpu = time.perf_counter() - started_wall, time.process_time() - started_cpu
+    print(f"{title:<40} {REQUESTS / wall:8.0f} запросов/с  CPU {cpu * 1000 / REQUESTS:6.3f} мс/запрос")
+
+
+async def main():
+    engine, session_maker = await create_rates_db(banks=300)
+
+    async def bench_session():
+        async with session_maker() as session:
+            yield session
+
+    app.dependency_overrides[get_current_user] = lambda: MagicMock()
+    app.dependency_overrides[session_manager.get_session_without_transaction] = bench_session
+
+    async def before_identity():
+        rate_snapshot.clear()
+        return await call_asgi("/api/all_currency/", "identity")
+
+    async def before_proxy_gzip():
+        return gzip.compress(await before_identity(), compresslevel=6)
+
+    await run("до: БД + orjson", before_identity)
+    await run("до: БД + orjson + gzip в прокси", before_proxy_gzip)
+
+    async with session_maker() as session:
+        rows = await CurrencyRateDAO.find_all_rows(session=session)
+    records = [CurrencyRateSchema(**row) for row in rows]
+
+    started = time.perf_counter()
+    rate_snapshot.publish(records)
+    published_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    EncodedBody(rate_snapshot.current.all_currency_body.variants["identity"])
+    encoded_ms = (time.perf_counter() - started) * 1000
+    print(f"публикация снимка при синхронизации: {published_ms:.1f} мс, из них сжатие тел: {encoded_ms:.1f} мс")
+
+    for encoding in ("identity", "gzip", "br"):
+        async def after(encoding=encoding):
+            return await call_asgi("/api/all_currency/", encoding)
+        await run(f"после: готовое тело ({encoding})", after)
+
+    sizes = {name: len(body) for name, body in rate_snapshot.current.all_currency_body.variants.items()}
+    print(f"размеры тел, байт: {sizes}")
+
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+Представление записей на пути парсер -> БД для 10k синтетических банков:
+до - CurrencyRateSchema(**dict) на каждую запись и два model_dump() в bulk_update_currency,
+после - RawCurrencyRate (NamedTuple) с пакетной валидацией TypeAdapter (или без нее).
+Считаются время, память, занятая записями, и число выделенных блоков (tracemalloc).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_raw_records --rows 10000
+"""
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+from collections import Counter
+
+from benchmarks.common import create_rates_db, synthetic_rates
+
+from app.api.dao import CurrencyRateDAO
+from app.api.schemas import CurrencyRateSchema, RawCurrencyRate, validate_raw_rates
+
+
+def before(rows: list[dict]):
+    records = [CurrencyRateSchema(**row) for row in rows]
+    Counter(record.model_dump().get("bank_en") for record in records)
+    payload = [record.model_dump(exclude_unset=True) for record in records]
+    return records, payload
+
+
+def after(rows: list[dict]):
+    return [RawCurrencyRate(**row) for row in rows]
+
+
+def after_validated(rows: list[dict]):
+    return validate_raw_rates([RawCurrencyRate(**row) for row in rows])
+
+
+def measure(func, rows: list[dict], repeat: int = 5) -> tuple[float, float, int]:
+    """Лучшее время (мс), память результата (МиБ) и число выделенных при вызове блоков памяти."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(rows)
+        best = min(best, time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    before_snapshot = tracemalloc.take_snapshot()
+    result = func(rows)
+    after_snapshot = tracemalloc.take_snapshot()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after_snapshot.compare_to(before_snapshot, "filename") if stat.count_diff > 0)
+    del result
+    return best * 1000, retained / 1024 / 1024, blocks
+
+
+async def bulk_sync(rows: list[dict]) -> tuple[float, float]:
+    """Время bulk_update_currency (SQLite в памяти): первая синхронизация и повторная без изменений."""
+    engine, session_maker = await create_rates_db(banks=0)
+    records = after(rows)
+    timings = []
+    for _ in range(2):
+        async with session_maker() as session:
+            started = time.perf_counter()
+            await CurrencyRateDAO.bulk_update_currency(records=records, session=session)
+            timings.append((time.perf_counter() - started) * 1000)
+    await engine.dispose()
+    return timings[0], timings[1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rows = synthetic_rates(args.rows)
+    for label, func in (("до", before), ("после", after), ("после+TypeAdapter", after_validated)):
+        elapsed, retained, blocks = measure(func, rows)
+        print(f"{label:<18} {elapsed:8.1f} мс  записи {retained:6.1f} МиБ  выделено блоков {blocks:>8}")
+
+    first, repeated = asyncio.run(bulk_sync(rows))
+    print(f"bulk_update_currency: первая синхронизация {first:.0f} мс, повторная без изменений {repeated:.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Сравнение прежнего пути чтения курсов (ORM-объекты + валидация CurrencyRateSchema в FastAPI + json.dumps)
+с выборкой только нужных колонок и сериализацией через orjson.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_read_path
+"""
+import asyncio
+import json
+from typing import List
+
+from benchmarks.common import create_rates_db, measure
+
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from app.api.dao import CurrencyRateDAO
+from app.api.models import CurrencyRate
+from app.api.schemas import CurrencyRateSchema
+
+
+ITERATIONS = 200
+rates_adapter = TypeAdapter(List[CurrencyRateSchema])
+top_adapter = TypeAdapter(dict[str, List[CurrencyRateSchema]])
+
+
+def legacy_render(adapter: TypeAdapter, content) -> bytes:
+    """Повторяет serialize_response FastAPI для response_model: валидация, сериализация, json.dumps."""
+    validated = adapter.validate_python(content, from_attributes=True)
+    data = adapter.dump_python(validated, mode="json")
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+async def main():
+    engine, session_maker = await create_rates_db(banks=300)
+
+    async def legacy_all_currency():
+        async with session_maker() as session:
+            rows = (await session.execute(select(CurrencyRate))).scalars().all()
+            return legacy_render(rates_adapter, rows)
+
+    async def projected_all_currency():
+        async with session_maker() as session:
+            return ORJSONResponse(await CurrencyRateDAO.find_all_rows(session=session)).body
+
+    async def legacy_best_rates():
+        async with session_maker() as session:
+            result = {}
+            for field in (CurrencyRate.usd_buy, CurrencyRate.eur_buy):
+                res = await session.execute(select(CurrencyRate).order_by(field).limit(10))
+                result[field.key[:3]] = res.scalars().all()
+            return legacy_render(top_adapter, result)
+
+    async def projected_best_rates():
+        async with session_maker() as session:
+            result = await CurrencyRateDAO.find_best_purchase_rates(session=session, usd=True, eur=True, count=10)
+            return ORJSONResponse(result).body
+
+    # только сериализация: данные уже загружены
+    async with session_maker() as session:
+        orm_rows = (await session.execute(select(CurrencyRate))).scalars().all()
+        dict_rows = await CurrencyRateDAO.find_all_rows(session=session)
+
+    async def legacy_serialize_only():
+        return legacy_render(rates_adapter, orm_rows)
+
+    async def orjson_serialize_only():
+        return ORJSONResponse(dict_rows).body
+
+    cases = [
+        ("/all_currency/ до (ORM + pydantic + json)", legacy_all_currency),
+        ("/all_currency/ после (колонки + orjson)", projected_all_currency),
+        ("/best_*_rates/ до", legacy_best_rates),
+        ("/best_*_rates/ после", projected_best_rates),
+        ("сериализация 300 банков до", legacy_serialize_only),
+        ("сериализация 300 банков после", orjson_serialize_only),
+    ]
+    for title, func in cases:
+        elapsed_ms, peak_kib = await measure(func, ITERATIONS)
+        print(f"{title:<45} {elapsed_ms:8.3f} мс/запрос  пик памяти {peak_kib:8.1f} КиБ")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""
+Файл SQLite под нагрузкой: синхронизация курсов (пакеты записи в одной транзакции, между пакетами -
+ожидание загрузки следующей страницы) на фоне --readers параллельных читателей /best_purchase_rates/
+и --writers записей пользователей. До - движок aiosqlite по умолчанию (NullPool, журнал отката,
+без очереди записи), после - профиль create_database_engine (WAL, synchronous=NORMAL, mmap, кеш страниц,
+постоянные соединения) и SingleWriter. Считаются задержки чтения и записи и ошибки "database is locked".
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_sqlite_profile [--banks 1000] [--readers 8] [--writers 2]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.common import create_rates_db, synthetic_rates
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.api.dao import CurrencyRateDAO
+from app.api.schemas import RawCurrencyRate
+from app.dao.database import create_database_engine
+from app.dao.session_maker import DatabaseSessionManager
+
+
+def percentile(values: list[float], q: float) -> float:
+    return sorted(values)[min(int(len(values) * q), len(values) - 1)] * 1000 if values else 0.0
+
+
+async def run(label: str, url: str, profile: bool, banks: int, readers: int, writers: int, batches: int) -> None:
+    engine = create_database_engine(url) if profile else create_async_engine(url)
+    manager = DatabaseSessionManager(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    if not profile:
+        manager.writer = None
+
+    records = [RawCurrencyRate(**{**rate, "usd_buy": rate["usd_buy"] + 0.01}) for rate in synthetic_rates(banks)]
+    batch_size = -(-len(records) // batches)
+
+    @manager.connection(commit=True)
+    async def sync(session):
+        db_rows, result = await CurrencyRateDAO.start_currency_sync(session)
+        for start in range(0, len(records), batch_size):
+            await CurrencyRateDAO.upsert_currency_batch(session, records[start:start + batch_size], db_rows, result)
+            await asyncio.sleep(0.05)  # загрузка и разбор следующей страницы
+        return await CurrencyRateDAO.finish_currency_sync(session, db_rows, result)
+
+    @manager.connection(commit=False)
+    async def read(session):
+        return await CurrencyRateDAO.find_best_purchase_rates(session=session, usd=True, eur=True, count=10)
+
+    @manager.connection(commit=True)
+    async def write(i, session):
+        await session.execute(text("INSERT INTO bench_writes (value) VALUES (:value)"), {"value": i})
+
+    done = asyncio.Event()
+    read_times, write_times, errors = [], [], {"read": 0, "write": 0}
+
+    async def loop(kind: str, func, times: list[float], pause: float):
+        i = 0
+        while not done.is_set():
+            started = time.perf_counter()
+            try:
+                await func(i) if kind == "write" else await func()
+                times.append(time.perf_counter() - started)
+            except OperationalError:
+                errors[kind] += 1
+            i += 1
+            await asyncio.sleep(pause)
+
+    tasks = [asyncio.create_task(loop("read", read, read_times, 0)) for _ in range(readers)]
+    tasks += [asyncio.create_task(loop("write", write, write_times, 0.02)) for _ in range(writers)]
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    result = await sync()
+    sync_ms = (time.perf_counter() - started) * 1000
+    done.set()
+    await asyncio.gather(*tasks)
+    if manager.writer:
+        await manager.writer.close()
+    await engine.dispose()
+
+    print(
+        f"{label:<6} синхронизация {sync_ms:7.0f} мс (изменено {result.updated})  "
+        f"чтения {len(read_times):>5}: p50 {percentile(read_times, 0.5):6.1f} мс, "
+        f"p95 {percentile(read_times, 0.95):7.1f} мс, ошибок {errors['read']}  "
+        f"записи {len(write_times):>3}: p95 {percentile(write_times, 0.95):7.1f} мс, "
+        f"макс. {max(write_times, default=0) * 1000:7.1f} мс, ошибок {errors['write']}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--banks", type=int, default=1000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--batches", type=int, default=10)
+    args = parser.parse_args()
+
+    for label, profile in (("до", False), ("после", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.sqlite3')}"
+            engine, _ = await create_rates_db(banks=args.banks, url=url)
+            async with engine.begin() as conn:
+                await conn.execute(text("CREATE TABLE bench_writes (value INTEGER)"))
+            await engine.dispose()
+            await run(label, url, profile, args.banks, args.readers, args.writers, args.batches)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""
+Синхронизация курсов: до - загрузка всех страниц через gather, разбор, затем bulk_update_currency;
+после - потоковый конвейер run_sync_pipeline. Загрузка страниц эмулируется задержкой
+(страница N приходит через N * --latency-ms), разбор и запись в SQLite в памяти - настоящие.
+Считаются общее время, время до первой записи в БД и пиковая память (tracemalloc).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_sync_pipeline --banks-per-page 1000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from benchmarks.common import create_rates_db, synthetic_rates
+from sqlalchemy import event
+
+from app.api.dao import CurrencyRateDAO
+from app.parser.parser import PAGES, fetch_currency_pages
+from app.parser.pipeline import run_sync_pipeline
+
+
+def page_html(rates: list[dict]) -> str:
+    """HTML страницы myfin с курсами в разметке, которую разбирает parse_currency_table."""
+    rows = "".join(
+        f'<tr><td class="bank_name"><a href="/bank/{rate["bank_en"]}/currency">{rate["bank_name"]}</a>'
+        f'<span class="hint">рейтинг, отзывы, адреса отделений и банкоматов</span></td>'
+        f'<td class="USD">{rate["usd_buy"]}</td><td class="USD">{rate["usd_sell"]}</td>'
+        f'<td class="EUR">{rate["eur_buy"]}</td><td class="EUR">{rate["eur_sell"]}</td>'
+        f'<td><time>{rate["update_time"]}</time></td></tr>'
+        for rate in rates
+    )
+    return f'<html><body><table class="content_table"><tbody>{rows}</tbody></table></body></html>'
+
+
+async def run_once(sync, pages_html: dict[str, str], latency: float, trace: bool):
+    """Одна синхронизация в пустую базу: (результат, общее время, время до первой записи, пик памяти)."""
+    engine, session_maker = await create_rates_db(banks=0)
+
+    async def fetch_html(url, session, retries=3):
+        page = list(pages_html).index(url) + 1
+        await asyncio.sleep(latency * page)
+        return pages_html[url]
+
+    first_write = []
+    event.listen(
+        engine.sync_engine, "before_cursor_execute",
+        lambda conn, cursor, statement, *args: first_write.append(time.perf_counter())
+        if statement.startswith("INSERT") else None,
+    )
+
+    peak = 0
+    async with session_maker() as session:
+        with patch("app.parser.parser.fetch_html", fetch_html), patch("app.parser.pipeline.fetch_html", fetch_html):
+            if trace:
+                tracemalloc.start()
+            started = time.perf_counter()
+            result = await sync(session)
+            elapsed = time.perf_counter() - started
+            if trace:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+        await session.commit()
+    await engine.dispose()
+    return result, elapsed, first_write[0] - started, peak
+
+
+async def run(label: str, sync, pages_html: dict[str, str], latency: float) -> None:
+    # время меряется без tracemalloc (он замедляет разбор в разы), память - отдельным прогоном
+    result, elapsed, first_write, _ = await run_once(sync, pages_html, latency, trace=False)
+    *_, peak = await run_once(sync, pages_html, latency, trace=True)
+    print(
+        f"{label:<9} банков {result.total:>6}  всего {elapsed * 1000:8.1f} мс  "
+        f"до первой записи {first_write * 1000:8.1f} мс  пик памяти {peak / 1024 / 1024:6.1f} МиБ"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--banks-per-page", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    args = parser.parse_args()
+
+    rates = synthetic_rates(args.banks_per_page * len(PAGES))
+    urls = ["https://ru.myfin.by/currency"] + [f"https://ru.myfin.by/currency?page={page}" for page in PAGES[1:]]
+    pages_html = {
+        url: page_html(rates[i * args.banks_per_page:(i + 1) * args.banks_per_page]) for i, url in enumerate(urls)
+    }
+
+    async def before(session):
+        pages = await fetch_currency_pages()
+        records = [record for page_records in pages.values() for record in page_records]
+        return await CurrencyRateDAO.bulk_update_currency(records=records, session=session)
+
+    async def after(session):
+        return await run_sync_pipeline(session)
+
+    await run("до", before, pages_html, args.latency_ms / 1000)
+    await run("после", after, pages_html, args.latency_ms / 1000)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
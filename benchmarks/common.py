@@ -0,0 +1,77 @@
+"""Общие вспомогательные функции для бенчмарков: окружение и тестовая база с курсами."""
+import logging
+import os
+import random
+import time
+import tracemalloc
+
+# настройки приложения обязательны при импорте app.config, для бенчмарков хватает заглушек
+for key, value in {
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_NAME": "bench",
+    "DB_USER": "bench",
+    "DB_PASSWORD": "bench",
+    "SECRET_KEY": "bench",
+    "ALGORITHM": "HS256",
+}.items():
+    os.environ.setdefault(key, value)
+
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.api.models import CurrencyRate  # noqa: E402
+from app.auth.models import Role, User  # noqa: E402, F401
+from app.dao.database import Base  # noqa: E402
+
+# сообщения приложения о синхронизации и снимках искажают замеры: только предупреждения
+logging.getLogger("app").setLevel(logging.WARNING)
+
+
+def synthetic_rates(count: int, seed: int = 0) -> list[dict]:
+    """Синтетические курсы count банков."""
+    rng = random.Random(seed)
+    rates = []
+    for i in range(count):
+        usd_buy = round(rng.uniform(73, 78), 2)
+        eur_buy = round(rng.uniform(86, 91), 2)
+        rates.append({
+            "bank_name": f"Банк {i}",
+            "bank_en": f"bank-{i}",
+            "link": f"https://ru.myfin.by/bank/bank-{i}/currency",
+            "usd_buy": usd_buy,
+            "usd_sell": round(usd_buy + rng.uniform(1, 4), 2),
+            "eur_buy": eur_buy,
+            "eur_sell": round(eur_buy + rng.uniform(1, 4), 2),
+            "update_time": "26.02.2026 19:04",
+        })
+    return rates
+
+
+async def create_rates_db(banks: int = 300, url: str = "sqlite+aiosqlite://") -> tuple[AsyncEngine, async_sessionmaker]:
+    """Создает базу (по умолчанию SQLite в памяти) с таблицами приложения и курсами banks банков."""
+    kwargs = {"poolclass": StaticPool} if url == "sqlite+aiosqlite://" else {}
+    engine = create_async_engine(url, **kwargs)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        if banks:
+            await conn.execute(insert(CurrencyRate), synthetic_rates(banks))
+    return engine, async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def measure(func, iterations: int) -> tuple[float, float]:
+    """Среднее время (мс) и пиковая память (КиБ) на один вызов асинхронной функции."""
+    await func()  # прогрев
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    elapsed_ms = (time.perf_counter() - started) * 1000 / iterations
+
+    tracemalloc.start()
+    await func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak / 1024
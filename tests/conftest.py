@@ -1,8 +1,11 @@
 import pytest
 import asyncio
 from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
 from unittest.mock import MagicMock
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import get_current_admin_user, get_current_user
+from app.dao.database import Base
 from app.main import app
 
 
@@ -39,6 +42,17 @@ async def async_client():
         yield client
 
 
+@pytest.fixture
+async def db_session():
+    """Сессия к пустой SQLite в памяти со всеми таблицами приложения."""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
 @pytest.fixture
 def override_user(mock_user):
     """Получаем пользователя и затем используем во всех тестах."""
@@ -47,4 +61,12 @@ def override_user(mock_user):
     # def get_mock_user():
     #     return mock_user
     yield
-    app.dependency_overrides.clear()
\ No newline at end of file
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def override_admin(mock_user):
+    """Текущий пользователь - администратор."""
+    app.dependency_overrides[get_current_admin_user] = lambda: mock_user
+    yield
+    app.dependency_overrides.clear()
@@ -1,7 +1,22 @@
 import pytest
-from unittest.mock import AsyncMock, patch
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.dialects import postgresql
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.api.dao import CurrencyRateDAO
+from app.api.models import CurrencyRate
 from app.api.schemas import BestRateResponse, CurrencyRateSchema
+from app.api.http_cache import negotiate_encoding
+from app.api.search import BankSearchIndex
+from app.api.shared_snapshot import SharedSnapshotFile
+from app.api.snapshot import RateSnapshot, rate_snapshot
 from app.api.utils import validate_currency_type
+from app.auth.auth import create_tokens
+from app.config import settings
+from app.auth.models import Role, User
+from app.dao.database import Base
+from app.dao.session_maker import DatabaseSessionManager, session_manager
 
 
 # фикстуры для тестов api
@@ -26,6 +41,55 @@ def currency_rate_schema(currency_rate_data):
     return CurrencyRateSchema(**currency_rate_data)
 
 
+@pytest.fixture
+def snapshot_records(currency_rate_data):
+    """Курсы нескольких банков для снимка."""
+    rates = [(74.3, 78.4, 87.7, 93.1), (75.0, 77.9, 88.1, 92.5), (74.5, 79.0, 86.9, 93.4), (76.2, 78.0, 89.0, 91.8)]
+    return [
+        CurrencyRateSchema(**{
+            **currency_rate_data,
+            "bank_en": f"bank{i}",
+            "bank_name": f"Банк {i}",
+            "link": f"https://ru.myfin.by/bank/bank{i}/currency",
+            "usd_buy": usd_buy, "usd_sell": usd_sell, "eur_buy": eur_buy, "eur_sell": eur_sell,
+        })
+        for i, (usd_buy, usd_sell, eur_buy, eur_sell) in enumerate(rates)
+    ]
+
+
+@pytest.fixture
+def published_snapshot(snapshot_records):
+    """Публикует снимок курсов и очищает его после теста."""
+    snapshot = rate_snapshot.publish(snapshot_records)
+    yield snapshot
+    rate_snapshot.clear()
+
+
+@pytest.fixture
+async def users_db(tmp_path):
+    """Сессии приложения на временном файле SQLite с пользователем id 1."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.sqlite3'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Role).values(id=1, name="User"))
+        await conn.execute(insert(User).values(
+            id=1, first_name="Иван", last_name="Иванов", phone_number="+79001234567",
+            email="test@test.com", password="hash", role_id=1,
+        ))
+    # менеджер регистрирует на движке счетчик выдачи соединений
+    manager = DatabaseSessionManager(async_sessionmaker(engine, expire_on_commit=False))
+    with patch.object(session_manager, "session_maker", manager.session_maker):
+        yield
+    await engine.dispose()
+
+
+@pytest.fixture
+def access_cookie():
+    """Кука с настоящим access_token пользователя с id 1."""
+    token = create_tokens(data={"sub": "1"})["access_token"]
+    return f"user_access_token={token}"
+
+
 @pytest.fixture
 def best_rate_response():
     """Схема для лучшего курса."""
@@ -34,9 +98,9 @@ def best_rate_response():
 
 class BaseTestAPI:
     """Базовый класс с общими вспомогательными методами для тестов валютных курсов."""
-    async def _test_count_exceeds_total(self, async_client, override_user, url):
-        with patch("app.api.router.CurrencyRateDAO.get_total_count", new_callable=AsyncMock) as mock_total:
-            mock_total.return_value = 60
+    async def _test_count_exceeds_total(self, async_client, override_user, url, dao_method):
+        with patch(f"app.api.router.CurrencyRateDAO.{dao_method}", new_callable=AsyncMock) as mock_find:
+            mock_find.return_value = (60, {"usd": [], "eur": []})
             response = await async_client.get(url)
             assert response.status_code == 400
 
@@ -63,27 +127,67 @@ class TestValidateCurrencyType:
 # тесты для роутеров api
 class TestGetAllCurrency:
 
-    async def test_returns_list_of_currencies(self, async_client, override_user, currency_rate_schema):
-        with patch("app.api.router.CurrencyRateDAO.find_all", new_callable=AsyncMock) as mock_find_all:
-            mock_find_all.return_value = [currency_rate_schema]
+    async def test_returns_list_of_currencies(self, async_client, override_user, currency_rate_data):
+        with patch("app.api.router.CurrencyRateDAO.find_all_rows", new_callable=AsyncMock) as mock_find_all:
+            mock_find_all.return_value = [currency_rate_data]
             response = await async_client.get("/api/all_currency/")
 
             assert response.status_code == 200
             assert isinstance(response.json(), list)
+            assert response.json() == [currency_rate_data]
+
+    async def test_precompressed_from_snapshot(self, async_client, override_user, published_snapshot):
+        with patch("app.api.router.CurrencyRateDAO.find_all_rows", new_callable=AsyncMock) as mock_find_all:
+            response = await async_client.get("/api/all_currency/", headers={"Accept-Encoding": "gzip"})
+
+            assert response.status_code == 200
+            assert response.headers["content-encoding"] == "gzip"
+            assert response.json() == [record.model_dump() for record in published_snapshot.records]
+            mock_find_all.assert_not_called()
+
+    async def test_snapshot_without_db_connection(self, async_client, users_db, published_snapshot, access_cookie):
+        with patch("app.api.router.CurrencyRateDAO.find_all_rows", new_callable=AsyncMock) as mock_find_all, \
+                session_manager.count_checkouts() as checkouts:
+            response = await async_client.get("/api/all_currency/", headers={"Cookie": access_cookie})
+
+        assert response.status_code == 200
+        # единственное соединение берет get_current_user для поиска пользователя, эндпоинт отвечает из снимка
+        assert checkouts[0] == 1
+        mock_find_all.assert_not_called()
+
+    async def test_brotli_body(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/all_currency/", headers={"Accept-Encoding": "br"})
+
+        assert response.headers["content-encoding"] == "br"
+        # httpx сам распаковывает brotli
+        assert response.content == published_snapshot.all_currency_body.variants["identity"]
+
+
+class TestNegotiateEncoding:
+
+    def test_prefers_brotli(self):
+        assert negotiate_encoding("gzip, deflate, br") == "br"
+
+    def test_respects_q_values(self):
+        assert negotiate_encoding("br;q=0.5, gzip") == "gzip"
+
+    def test_identity_by_default(self):
+        assert negotiate_encoding(None) == "identity"
+        assert negotiate_encoding("deflate") == "identity"
 
 
 class TestGetCurrencyByBank:
 
-    async def test_bank_found(self, async_client, override_user, currency_rate_schema):
-        with patch("app.api.router.CurrencyRateDAO.find_one_or_none", new_callable=AsyncMock) as mock_find:
+    async def test_bank_found(self, async_client, override_user, currency_rate_data):
+        with patch("app.api.router.CurrencyRateDAO.find_row_by_bank_en", new_callable=AsyncMock) as mock_find:
 
-            mock_find.return_value = currency_rate_schema
+            mock_find.return_value = currency_rate_data
             response = await async_client.get("/api/currency_by_bank/sberbank")
 
             assert response.status_code == 200
 
     async def test_bank_not_found(self, async_client, override_user):
-        with patch("app.api.router.CurrencyRateDAO.find_one_or_none", new_callable=AsyncMock) as mock_find:
+        with patch("app.api.router.CurrencyRateDAO.find_row_by_bank_en", new_callable=AsyncMock) as mock_find:
 
             mock_find.return_value = None
             response = await async_client.get("/api/currency_by_bank/unknown_bank")
@@ -91,6 +195,35 @@ class TestGetCurrencyByBank:
             assert response.status_code == 404
 
 
+class TestGetCurrencyByBanks:
+
+    async def test_from_snapshot(self, async_client, override_user, published_snapshot):
+        with patch("app.api.router.CurrencyRateDAO.find_by_bank_ens", new_callable=AsyncMock) as mock_find:
+            response = await async_client.get("/api/currency_by_banks?bank_en=bank2&bank_en=BANK0&bank_en=unknown")
+
+            assert response.status_code == 200
+            assert [bank["bank_en"] for bank in response.json()["banks"]] == ["bank2", "bank0"]
+            assert response.json()["missing"] == ["unknown"]
+            mock_find.assert_not_called()
+
+    async def test_single_query_without_snapshot(self, async_client, override_user, currency_rate_data):
+        with patch("app.api.router.CurrencyRateDAO.find_by_bank_ens", new_callable=AsyncMock) as mock_find:
+            mock_find.return_value = [currency_rate_data]
+            response = await async_client.post(
+                "/api/currency_by_banks", json={"bank_en": ["sberbank", "vtb", "sberbank"]}
+            )
+
+            assert response.status_code == 200
+            assert response.json()["missing"] == ["vtb"]
+            mock_find.assert_awaited_once()
+            assert mock_find.await_args.kwargs["bank_ens"] == ["sberbank", "vtb"]
+
+    async def test_too_many_banks(self, async_client, override_user, published_snapshot):
+        bank_ens = [f"bank{i}" for i in range(settings.MAX_BATCH_BANKS + 1)]
+        response = await async_client.post("/api/currency_by_banks", json={"bank_en": bank_ens})
+        assert response.status_code == 400
+
+
 class TestGetBestPurchaseRate:
 
     async def test_valid_currency(self, async_client, override_user, best_rate_response):
@@ -116,6 +249,19 @@ class TestGetBestPurchaseRate:
 
             assert response.status_code == 404
 
+    async def test_max_age_passed_to_dao(self, async_client, override_user, best_rate_response):
+        with patch("app.api.router.CurrencyRateDAO.find_best_purchase_rate", new_callable=AsyncMock) as mock_find:
+
+            mock_find.return_value = best_rate_response
+            response = await async_client.get("/api/best_purchase_rate/usd?max_age=30")
+
+            assert response.status_code == 200
+            assert mock_find.call_args.kwargs["max_age"] == 30
+
+    async def test_invalid_max_age(self, async_client, override_user):
+        response = await async_client.get("/api/best_purchase_rate/usd?max_age=0")
+        assert response.status_code == 422
+
 
 class TestGetBestPurchaseRates(BaseTestAPI):
 
@@ -123,14 +269,21 @@ class TestGetBestPurchaseRates(BaseTestAPI):
         await self._test_no_currency_specified(async_client, override_user, "/api/best_purchase_rates/")
 
     async def test_count_exceeds_total(self, async_client, override_user):
-        await self._test_count_exceeds_total(async_client, override_user, "/api/best_purchase_rates/?usd=true&count=100")
+        await self._test_count_exceeds_total(
+            async_client, override_user, "/api/best_purchase_rates/?usd=true&count=100", "find_best_purchase_rates"
+        )
 
-    async def test_valid_request_for_purchase(self, async_client, override_user, currency_rate_schema):
-        with patch("app.api.router.CurrencyRateDAO.get_total_count", new_callable=AsyncMock) as mock_total, \
-             patch("app.api.router.CurrencyRateDAO.find_best_purchase_rates", new_callable=AsyncMock) as mock_find:
-            
-            mock_total.return_value = 60
-            mock_find.return_value = {"usd": [currency_rate_schema]}
+    async def test_no_fresh_rates(self, async_client, override_user):
+        with patch("app.api.router.CurrencyRateDAO.find_best_purchase_rates", new_callable=AsyncMock) as mock_find:
+            mock_find.return_value = (0, {"usd": []})
+            response = await async_client.get("/api/best_purchase_rates/?usd=true&count=1&max_age=5")
+
+        assert response.status_code == 404
+
+    async def test_valid_request_for_purchase(self, async_client, override_user, currency_rate_data):
+        with patch("app.api.router.CurrencyRateDAO.find_best_purchase_rates", new_callable=AsyncMock) as mock_find:
+
+            mock_find.return_value = (60, {"usd": [currency_rate_data]})
             response = await async_client.get("/api/best_purchase_rates/?usd=true")
 
             assert response.status_code == 200
@@ -166,15 +319,521 @@ class TestGetBestSaleRates(BaseTestAPI):
         await self._test_no_currency_specified(async_client, override_user, "/api/best_purchase_rates/")
     
     async def test_count_exceeds_total(self, async_client, override_user):
-        await self._test_count_exceeds_total(async_client, override_user, "/api/best_sale_rates/?eur=true&count=100")
+        await self._test_count_exceeds_total(
+            async_client, override_user, "/api/best_sale_rates/?eur=true&count=100", "find_best_sale_rates"
+        )
 
-    async def test_valid_request_for_sale(self, async_client, override_user, currency_rate_schema):
-        with patch("app.api.router.CurrencyRateDAO.get_total_count", new_callable=AsyncMock) as mock_total, \
-             patch("app.api.router.CurrencyRateDAO.find_best_sale_rates", new_callable=AsyncMock) as mock_find:
+    async def test_valid_request_for_sale(self, async_client, override_user, currency_rate_data):
+        with patch("app.api.router.CurrencyRateDAO.find_best_sale_rates", new_callable=AsyncMock) as mock_find:
 
-            mock_total.return_value = 60
-            mock_find.return_value = {"eur": [currency_rate_schema]}
+            mock_find.return_value = (60, {"eur": [currency_rate_data]})
             response = await async_client.get("/api/best_sale_rates/?eur=true")
 
             assert response.status_code == 200
             assert "eur" in response.json()
+
+
+class TestGetMarketStats:
+
+    async def test_no_snapshot(self, async_client, override_user):
+        response = await async_client.get("/api/stats/usd")
+        assert response.status_code == 404
+
+    async def test_invalid_currency(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/stats/gbp")
+        assert response.status_code == 400
+
+    async def test_stats_values(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/stats/usd?within_pct=1")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["banks_count"] == 4
+        assert data["buy"]["best"] == 74.3
+        assert data["buy"]["worst"] == 76.2
+        assert data["buy"]["median"] == pytest.approx(74.75)
+        assert data["sell"]["best"] == 79.0
+        assert data["buy_within_best"] == 3
+        assert data["sell_within_best"] == 2
+        assert data["delta"] is None
+
+    async def test_delta_with_previous_sync(self, async_client, override_user, published_snapshot, snapshot_records):
+        rate_snapshot.publish(
+            record.model_copy(update={"usd_buy": record.usd_buy + 1}) for record in snapshot_records
+        )
+        response = await async_client.get("/api/stats/usd")
+
+        assert response.status_code == 200
+        assert response.json()["delta"]["buy"]["mean"] == pytest.approx(1)
+        assert response.json()["delta"]["sell"]["mean"] == pytest.approx(0)
+
+
+class TestGetNearBestRates:
+
+    async def test_no_snapshot(self, async_client, override_user):
+        response = await async_client.get("/api/near_best_rates/usd?operation=buy&tolerance=0.2")
+        assert response.status_code == 404
+
+    async def test_buy_within_tolerance(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/near_best_rates/usd?operation=buy&tolerance=0.2")
+
+        assert response.status_code == 200
+        assert [bank["usd_buy"] for bank in response.json()] == [74.3, 74.5]
+
+    async def test_sell_starts_with_best(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/near_best_rates/usd?operation=sell&tolerance=0.6")
+
+        assert response.status_code == 200
+        assert [bank["usd_sell"] for bank in response.json()] == [79.0, 78.4]
+
+    async def test_count_only(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/near_best_rates/eur/count?operation=buy&tolerance=1")
+
+        assert response.status_code == 200
+        assert response.json() == {"count": 2}
+
+    async def test_invalid_operation(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/near_best_rates/usd?operation=hold&tolerance=1")
+        assert response.status_code == 422
+
+    async def test_max_age_fresh_only(self, async_client, override_user, snapshot_records):
+        now = datetime.now(timezone.utc)
+        # bank0 с лучшим курсом покупки 74.3 обновлялся давно, bank3 - без времени котировки
+        quoted = [now - timedelta(hours=3), now - timedelta(minutes=5), now - timedelta(minutes=30), None]
+        rate_snapshot.publish(
+            record.model_copy(update={"quoted_at": quoted_at}) for record, quoted_at in zip(snapshot_records, quoted)
+        )
+        try:
+            banks = await async_client.get("/api/near_best_rates/usd?operation=buy&tolerance=0.6&max_age=60")
+            count = await async_client.get("/api/near_best_rates/usd/count?operation=buy&tolerance=0.6&max_age=60")
+        finally:
+            rate_snapshot.clear()
+
+        assert [bank["usd_buy"] for bank in banks.json()] == [74.5, 75.0]
+        assert count.json() == {"count": 2}
+
+
+class TestGetRatesInRange:
+
+    async def test_bounds_are_inclusive(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/rates_in_range/usd?operation=sell&min_rate=78.0&max_rate=78.4")
+
+        assert response.status_code == 200
+        assert [bank["usd_sell"] for bank in response.json()] == [78.0, 78.4]
+
+    async def test_open_upper_bound(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/rates_in_range/eur/count?operation=sell&min_rate=93")
+
+        assert response.status_code == 200
+        assert response.json() == {"count": 2}
+
+    async def test_invalid_range(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/rates_in_range/usd?operation=buy&min_rate=80&max_rate=70")
+        assert response.status_code == 400
+
+
+class TestBankSearchIndex:
+
+    def test_prefix_ranks_first(self):
+        index = BankSearchIndex()
+        index.add("sberbank", "СберБанк")
+        index.add("vtb", "ВТБ")
+        index.add("rshb", "Россельхозбанк")
+
+        assert index.search("сбер")[0][0] == "sberbank"
+
+    def test_misspelled_name(self):
+        index = BankSearchIndex()
+        index.add("tinkoff", "Тинькофф Банк")
+        index.add("alfabank", "Альфа-Банк")
+
+        assert [bank_en for bank_en, _ in index.search("тинькоф")] == ["tinkoff"]
+
+    def test_sync_is_incremental(self, snapshot_records):
+        index = BankSearchIndex()
+        assert index.sync(snapshot_records) == (4, 0)
+
+        renamed = snapshot_records[0].model_copy(update={"bank_name": "Новый Банк"})
+        assert index.sync([renamed, *snapshot_records[1:3]]) == (1, 1)
+        assert len(index) == 3
+        assert index.search("новый")[0][0] == "bank0"
+        assert "bank3" not in [bank_en for bank_en, _ in index.search("банк 3")]
+
+
+class TestSearchBanks:
+
+    async def test_returns_rates(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/banks/search?q=bank2")
+
+        assert response.status_code == 200
+        assert response.json()[0]["bank_en"] == "bank2"
+        assert response.json()[0]["usd_buy"] == 74.5
+
+    async def test_query_too_short(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/api/banks/search?q=б")
+        assert response.status_code == 422
+
+
+class TestCurrencyRateDAO:
+
+    @pytest.fixture
+    async def rates_session(self, db_session, snapshot_records):
+        await db_session.execute(insert(CurrencyRate), [record.model_dump() for record in snapshot_records])
+        await db_session.commit()
+        return db_session
+
+    async def test_best_purchase_rates_in_one_query(self, rates_session):
+        statements = []
+        connection = await rates_session.connection()
+        event.listen(connection.sync_connection, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+        total, result = await CurrencyRateDAO.find_best_purchase_rates(rates_session, usd=True, eur=True, count=2)
+
+        assert len(statements) == 1
+        assert total == 4
+        assert [bank["usd_buy"] for bank in result["usd"]] == [74.3, 74.5]
+        assert [bank["eur_buy"] for bank in result["eur"]] == [86.9, 87.7]
+        assert set(result["usd"][0]) == set(CurrencyRateSchema.model_fields)
+
+    async def test_best_sale_rates_descending(self, rates_session):
+        total, result = await CurrencyRateDAO.find_best_sale_rates(rates_session, eur=True, count=3)
+
+        assert total == 4
+        assert list(result) == ["eur"]
+        assert [bank["eur_sell"] for bank in result["eur"]] == [93.4, 93.1, 92.5]
+
+    async def test_empty_table(self, db_session):
+        assert await CurrencyRateDAO.find_best_sale_rates(db_session, usd=True) == (0, {"usd": []})
+
+    async def test_bulk_update_skips_unchanged(self, rates_session, snapshot_records):
+        statements = []
+        connection = await rates_session.connection()
+        event.listen(connection.sync_connection, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        records = [snapshot_records[0].model_copy(update={"usd_buy": 70.0}), *snapshot_records[1:3]]
+
+        result = await CurrencyRateDAO.bulk_update_currency(records=records, session=rates_session)
+
+        assert (result.added, result.updated, result.unchanged, result.deleted) == (0, 1, 2, 1)
+        assert result.changed_banks == {"bank0", "bank3"}
+        assert result.change_ratio == 0.5
+        assert sum(statement.startswith("UPDATE") for statement in statements) == 1
+
+    async def test_bulk_update_partial_keeps_missing(self, rates_session, snapshot_records):
+        result = await CurrencyRateDAO.bulk_update_currency(
+            records=snapshot_records[:1], session=rates_session, delete_missing=False
+        )
+
+        assert result.deleted == 0
+        assert len(await CurrencyRateDAO.find_all(session=rates_session)) == 4
+
+    @staticmethod
+    async def query_plan(session, call) -> str:
+        """Выполняет вызов DAO и возвращает EXPLAIN QUERY PLAN всех его запросов."""
+        statements = []
+        connection = await session.connection()
+        listener = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+        event.listen(connection.sync_connection, "before_cursor_execute", listener)
+        await call
+        event.remove(connection.sync_connection, "before_cursor_execute", listener)
+
+        plan = []
+        for statement, parameters in statements:
+            rows = await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            plan.extend(row.detail for row in rows)
+        return "\n".join(plan)
+
+    async def test_top_rates_use_rate_indexes(self, rates_session):
+        plan = await self.query_plan(
+            rates_session, CurrencyRateDAO.find_best_sale_rates(rates_session, usd=True, eur=True, count=2)
+        )
+
+        assert "INDEX ix_currencyrates_usd_sell" in plan
+        assert "INDEX ix_currencyrates_eur_sell" in plan
+        assert "TEMP B-TREE FOR ORDER BY" not in plan
+
+    async def test_best_rate_uses_rate_index(self, rates_session):
+        plan = await self.query_plan(rates_session, CurrencyRateDAO.find_best_purchase_rate("eur", rates_session))
+
+        assert "INDEX ix_currencyrates_eur_buy" in plan
+        assert "SCAN currencyrates\n" not in plan + "\n"
+
+    async def test_best_rates_from_view(self):
+        session = AsyncMock()
+        session.execute.return_value = MagicMock(
+            first=MagicMock(return_value=MagicMock(rate=74.3, banks=["Банк 1", "Банк 2"])),
+            all=MagicMock(return_value=[MagicMock(currency="usd", total=4, top=[{"bank_en": "bank1"}] * 3)]),
+        )
+
+        with patch.object(CurrencyRateDAO, "_use_best_rates_view", return_value=True):
+            best = await CurrencyRateDAO.find_best_purchase_rate("usd", session)
+            total, result = await CurrencyRateDAO.find_best_purchase_rates(session, usd=True, eur=True, count=2)
+
+        # по одному запросу к представлению по ключу (валюта, операция), без обращения к таблице курсов
+        statements = [
+            str(call.args[0].compile(dialect=postgresql.dialect())) for call in session.execute.await_args_list
+        ]
+        assert all("FROM best_currency_rates" in sql and "currencyrates" not in sql.replace("best_", "") for sql in statements)
+        assert best == BestRateResponse(rate=74.3, banks=["Банк 1", "Банк 2"])
+        assert (total, result) == (4, {"usd": [{"bank_en": "bank1"}] * 2, "eur": []})
+
+    async def test_best_rates_view_fallback(self, rates_session):
+        # SQLite: представления нет, обновление не выполняется; count больше топа представления - запрос к таблице
+        assert not CurrencyRateDAO._use_best_rates_view(rates_session)
+        await CurrencyRateDAO.refresh_best_rates_view(rates_session)
+
+        with patch.object(CurrencyRateDAO, "_use_best_rates_view", return_value=True):
+            total, result = await CurrencyRateDAO.find_best_sale_rates(
+                rates_session, usd=True, count=settings.BEST_RATES_VIEW_TOP_N + 1
+            )
+
+        assert total == 4
+        assert len(result["usd"]) == 4
+
+    async def test_max_age_excludes_stale_quotes(self, db_session, snapshot_records):
+        now = datetime.now(timezone.utc)
+        # bank3 без времени котировки считается устаревшим
+        quoted = [now - timedelta(minutes=5), now - timedelta(minutes=30), now - timedelta(hours=3), None]
+        await db_session.execute(insert(CurrencyRate), [
+            {**record.model_dump(), "quoted_at": quoted_at} for record, quoted_at in zip(snapshot_records, quoted)
+        ])
+
+        total, result = await CurrencyRateDAO.find_best_purchase_rates(db_session, usd=True, count=2, max_age=60)
+        best = await CurrencyRateDAO.find_best_sale_rate("usd", db_session, max_age=10)
+
+        assert total == 2
+        assert [bank["bank_en"] for bank in result["usd"]] == ["bank0", "bank1"]
+        assert result["usd"][0]["quoted_at"] == quoted[0]
+        assert best == BestRateResponse(rate=78.4, banks=["Банк 0"])
+
+
+class TestHTTPCache:
+
+    async def test_no_cache_headers_without_snapshot(self, async_client, override_user, currency_rate_data):
+        with patch("app.api.router.CurrencyRateDAO.find_all_rows", new_callable=AsyncMock) as mock_find:
+            mock_find.return_value = [currency_rate_data]
+            response = await async_client.get("/api/all_currency/")
+
+            assert response.status_code == 200
+            assert "etag" not in response.headers
+
+    async def test_etag_and_max_age(self, async_client, override_user, published_snapshot, currency_rate_data):
+        rate_snapshot.next_sync_at = published_snapshot.created_at + timedelta(minutes=10)
+        with patch("app.api.router.CurrencyRateDAO.find_all_rows", new_callable=AsyncMock) as mock_find:
+            mock_find.return_value = [currency_rate_data]
+            response = await async_client.get("/api/all_currency/")
+
+            assert response.status_code == 200
+            assert response.headers["etag"] == published_snapshot.etag
+            assert 0 < int(response.headers["cache-control"].split("max-age=")[1]) <= 600
+
+    async def test_not_modified_skips_endpoint(self, async_client, published_snapshot, access_cookie):
+        with patch("app.api.router.CurrencyRateDAO.find_all_rows", new_callable=AsyncMock) as mock_find:
+            response = await async_client.get(
+                "/api/all_currency/",
+                headers={"If-None-Match": published_snapshot.etag, "Cookie": access_cookie},
+            )
+
+            assert response.status_code == 304
+            assert response.content == b""
+            mock_find.assert_not_called()
+
+    async def test_max_age_reaches_dao(self, async_client, published_snapshot, access_cookie, mock_user, snapshot_records):
+        with patch("app.api.router.CurrencyRateDAO.find_best_purchase_rates", new_callable=AsyncMock) as mock_find, \
+                patch("app.auth.dependencies.UsersDAO.find_one_or_none_by_id", new_callable=AsyncMock) as mock_user_find:
+            mock_user_find.return_value = mock_user
+            mock_find.return_value = (4, {"usd": [snapshot_records[0].model_dump()]})
+            response = await async_client.get(
+                "/api/best_purchase_rates/?usd=true&count=1&max_age=60",
+                headers={"If-None-Match": published_snapshot.etag, "Cookie": access_cookie},
+            )
+
+        assert response.status_code == 200
+        assert "etag" not in response.headers
+        assert response.headers["cache-control"] == "no-cache"
+        assert mock_find.call_args.kwargs["max_age"] == 60
+
+    async def test_max_age_elsewhere_not_touched(self, async_client, override_user, published_snapshot):
+        response = await async_client.get("/auth/me/?max_age=5")
+
+        assert response.status_code == 200
+        assert "cache-control" not in response.headers
+
+    async def test_only_snapshot_endpoints_cached(self, async_client, override_user, published_snapshot, best_rate_response):
+        in_range = await async_client.get("/api/rates_in_range/usd?operation=buy")
+        with patch("app.api.router.CurrencyRateDAO.find_best_purchase_rate", new_callable=AsyncMock) as mock_find:
+            mock_find.return_value = best_rate_response
+            best = await async_client.get("/api/best_purchase_rate/usd")
+
+        assert in_range.headers["etag"] == published_snapshot.etag
+        assert "etag" not in best.headers and "cache-control" not in best.headers
+
+    async def test_stats_etag_changes_with_publish(
+            self, async_client, override_user, published_snapshot, snapshot_records, access_cookie
+    ):
+        first = await async_client.get("/api/stats/usd")
+        # те же курсы, но новая публикация: версия и изменения в ответе другие
+        rate_snapshot.publish(snapshot_records)
+        second = await async_client.get(
+            "/api/stats/usd", headers={"If-None-Match": first.headers["etag"], "Cookie": access_cookie}
+        )
+
+        assert second.status_code == 200
+        assert second.headers["etag"] != first.headers["etag"]
+        assert second.json()["version"] == first.json()["version"] + 1
+
+    async def test_admin_endpoint_checks_role(self, async_client, published_snapshot, access_cookie, mock_user):
+        # валидный токен и актуальный ETag не дают 304 в обход проверки роли
+        with patch("app.auth.dependencies.UsersDAO.find_one_or_none_by_id", new_callable=AsyncMock) as mock_find:
+            mock_find.return_value = mock_user
+            response = await async_client.get(
+                "/api/all_currency_admin/",
+                headers={"If-None-Match": published_snapshot.etag, "Cookie": access_cookie},
+            )
+
+        assert response.status_code == 403
+        assert "etag" not in response.headers
+
+    async def test_not_modified_requires_token(self, async_client, override_user, published_snapshot, currency_rate_data):
+        with patch("app.api.router.CurrencyRateDAO.find_all_rows", new_callable=AsyncMock) as mock_find:
+            mock_find.return_value = [currency_rate_data]
+            response = await async_client.get("/api/all_currency/", headers={"If-None-Match": published_snapshot.etag})
+
+            assert response.status_code == 200
+
+    async def test_etag_changes_with_data(self, published_snapshot, snapshot_records):
+        same = rate_snapshot.publish(reversed(snapshot_records))
+        changed = rate_snapshot.publish(
+            record.model_copy(update={"eur_sell": record.eur_sell + 0.1}) for record in snapshot_records
+        )
+
+        assert same.etag == published_snapshot.etag
+        assert changed.etag != published_snapshot.etag
+
+
+class TestSharedSnapshotFile:
+
+    @pytest.fixture
+    def shared(self, tmp_path):
+        return SharedSnapshotFile(str(tmp_path / "rates.snapshot"))
+
+    def test_roundtrip(self, shared, published_snapshot):
+        version = shared.write(published_snapshot)
+        loaded = shared.load()
+
+        assert version == loaded.version == 1
+        assert tuple(loaded.records) == published_snapshot.records
+        assert loaded.etag == published_snapshot.etag
+        assert loaded.all_currency_body.variants == published_snapshot.all_currency_body.variants
+        assert loaded.stats == published_snapshot.stats
+        for field, values in published_snapshot.sorted_values.items():
+            assert list(loaded.sorted_values[field]) == values
+            assert tuple(loaded.sorted_records[field]) == published_snapshot.sorted_records[field]
+        assert dict(loaded.by_bank_en) == published_snapshot.by_bank_en
+        assert loaded.bank_names() == published_snapshot.bank_names()
+
+    def test_load_does_not_unpack_records(self, shared, published_snapshot):
+        shared.write(published_snapshot)
+
+        with patch.object(CurrencyRateSchema, "model_construct", side_effect=AssertionError):
+            loaded = shared.load()
+            rate_snapshot.publish_snapshot(loaded, loaded.version)
+            assert "bank1" in loaded.by_bank_en and "bank9" not in loaded.by_bank_en
+            assert loaded.count_in_range("usd", "buy", 74.5, 75.0) == 2
+            assert loaded.count_near_best("usd", "sell", 0.6) == 2
+            assert loaded.count_within_best("eur", "buy", 1) == published_snapshot.count_within_best("eur", "buy", 1)
+
+    def test_queries_served_from_mapping(self, shared, published_snapshot, snapshot_records):
+        quoted_at = datetime.now(timezone.utc) - timedelta(minutes=5)
+        records = [record.model_copy(update={"quoted_at": quoted_at}) for record in snapshot_records[1:]]
+        snapshot = RateSnapshot([snapshot_records[0], *records])
+        shared.write(snapshot)
+        loaded = shared.load()
+
+        assert loaded.by_bank_en["bank2"] == snapshot.by_bank_en["bank2"]
+        assert loaded.rates_in_range("usd", "buy", 74.5, 75.0) == snapshot.rates_in_range("usd", "buy", 74.5, 75.0)
+        assert loaded.near_best("usd", "sell", 0.5) == snapshot.near_best("usd", "sell", 0.5)
+        # bank0 без времени котировки: лучший среди свежих - bank1
+        assert loaded.near_best("usd", "buy", 0.5, max_age=10) == snapshot.near_best("usd", "buy", 0.5, max_age=10)
+        assert [record.bank_en for record in loaded.near_best("usd", "buy", 0.5, max_age=10)] == ["bank2", "bank1"]
+
+    def test_load_does_not_recompute(self, shared, published_snapshot):
+        shared.write(published_snapshot)
+
+        # порядок записей и статистика берутся из файла
+        with patch("app.api.snapshot.sorted", side_effect=AssertionError, create=True), \
+                patch.object(RateSnapshot, "_market_stats", side_effect=AssertionError):
+            loaded = shared.load()
+
+        assert loaded.stats == published_snapshot.stats
+
+    def test_bodies_served_from_mapping(self, shared, published_snapshot, snapshot_records):
+        shared.write(published_snapshot)
+        loaded = shared.load()
+        identity = published_snapshot.all_currency_body.variants["identity"]
+
+        # новая версия подменяет файл, а загруженный снимок продолжает читать свое отображение
+        shared.write(RateSnapshot(snapshot_records[:1]))
+
+        assert isinstance(loaded.all_currency_body.variants["identity"], memoryview)
+        assert loaded.all_currency_body.variants["identity"] == identity
+
+    def test_roundtrip_quoted_at(self, shared, snapshot_records):
+        quoted_at = datetime(2026, 2, 26, 16, 4, tzinfo=timezone.utc)
+        records = [snapshot_records[0].model_copy(update={"quoted_at": quoted_at}), *snapshot_records[1:]]
+        shared.write(rate_snapshot.publish(records))
+        rate_snapshot.clear()
+
+        loaded = shared.load()
+
+        assert [record.quoted_at for record in loaded.records] == [quoted_at, None, None, None]
+
+    def test_load_skips_known_version(self, shared, published_snapshot):
+        shared.write(published_snapshot)
+
+        assert shared.load(known_version=1) is None
+        assert shared.write(published_snapshot) == 2
+        assert shared.load(known_version=1).version == 2
+
+    def test_missing_file(self, shared):
+        assert shared.load() is None
+
+    async def test_worker_picks_up_new_version(self, shared, snapshot_records):
+        await rate_snapshot.publish_in_thread(snapshot_records, shared=shared)
+        written = rate_snapshot.current
+        rate_snapshot.clear()
+        try:
+            assert (await rate_snapshot.refresh_from(shared)).etag == written.etag
+            assert rate_snapshot.current.version == written.version
+            assert await rate_snapshot.refresh_from(shared) is None
+        finally:
+            rate_snapshot.clear()
+
+
+class TestReadiness:
+
+    async def test_empty(self, async_client):
+        response = await async_client.get("/ready")
+
+        assert response.status_code == 503
+        assert response.json()["status"] == "empty"
+
+    async def test_loaded_snapshot_is_stale(self, async_client, snapshot_records):
+        await rate_snapshot.publish_in_thread(snapshot_records, synced=False)
+        try:
+            response = await async_client.get("/ready")
+        finally:
+            rate_snapshot.clear()
+
+        assert response.status_code == 200
+        assert response.json()["status"] == "stale"
+        assert response.json()["banks"] == len(snapshot_records)
+
+    async def test_synced_snapshot_is_fresh(self, async_client, snapshot_records):
+        await rate_snapshot.publish_in_thread(snapshot_records)
+        try:
+            response = await async_client.get("/ready")
+        finally:
+            rate_snapshot.clear()
+
+        assert response.json()["status"] == "fresh"
+        assert response.json()["synced_at"] is not None
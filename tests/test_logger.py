@@ -0,0 +1,61 @@
+import io
+import logging
+import queue
+import pytest
+from app.config import settings
+from app.logger import NonBlockingQueueHandler, SamplingFilter, configure_logging, stop_logging
+
+
+# фикстуры для тестов логирования
+@pytest.fixture
+def output():
+    """Логирование в буфер; после теста восстанавливается настройка приложения."""
+    stream = io.StringIO()
+    yield stream
+    configure_logging(settings.LOG_LEVEL, settings.LOG_LEVELS, settings.LOG_SAMPLE_EVERY, settings.LOG_QUEUE_SIZE)
+    for name in ("app.dao", "app.parser"):
+        logging.getLogger(name).setLevel(logging.NOTSET)
+
+
+def make_record(msg: str, level: int = logging.DEBUG, sampled: bool = True) -> logging.LogRecord:
+    record = logging.LogRecord("app.dao.base", level, __file__, 1, msg, (1,), None)
+    if sampled:
+        record.sampled = True
+    return record
+
+
+class TestLogging:
+
+    def test_module_levels_and_lazy_formatting(self, output):
+        configure_logging("INFO", {"app.dao": "DEBUG", "app.parser": "WARNING"}, stream=output)
+
+        class Expensive:
+            def __str__(self):
+                raise AssertionError("сообщение отключенного уровня не форматируется")
+
+        logging.getLogger("app.dao.base").debug("Поиск %s", "User")
+        logging.getLogger("app.parser.parser").info("Банк %s", Expensive())
+        logging.getLogger("app.api.snapshot").info("Снимок %s", 1)
+        logging.getLogger("app.api.snapshot").debug("Индекс %s", Expensive())
+        stop_logging()
+
+        lines = output.getvalue().splitlines()
+        assert [line.split(" ", 3)[-1] for line in lines] == ["app.dao.base: Поиск User", "app.api.snapshot: Снимок 1"]
+
+    def test_sampling(self):
+        sampling = SamplingFilter(sample_every=5)
+
+        passed = [sampling.filter(make_record("Поиск %s")) for _ in range(10)]
+
+        assert passed == [True, False, False, False, False] * 2
+        assert sampling.filter(make_record("Ошибка %s", level=logging.ERROR))
+        assert sampling.filter(make_record("Синхронизация %s", sampled=False))
+
+    def test_full_queue_drops_records(self):
+        handler = NonBlockingQueueHandler(queue.Queue(1))
+
+        for _ in range(3):
+            handler.handle(make_record("Поиск %s", sampled=False))
+
+        assert handler.queue.qsize() == 1
+        assert handler.dropped == 2
@@ -0,0 +1,356 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.api.dao import CurrencyRateDAO
+from app.api.schemas import RawCurrencyRate, SyncResult, validate_raw_rates
+from app.api.shared_snapshot import SharedSnapshotFile
+from app.api.snapshot import RateSnapshot, rate_snapshot
+from app.parser.__main__ import main, sync_once
+from app.parser.adaptive import AdaptiveSyncPlanner
+from app.parser.events import FileSyncChannel
+from app.parser.leader import FileLeaderLock, LeaderElection
+from app.parser.parser import parse_currency_table, parse_update_time
+from app.parser.pipeline import run_sync_pipeline
+from app.parser import scheduler
+from app.parser.scheduler import add_or_update_data_to_db, load_last_snapshot
+
+
+# Фикстуры для тестов синхронизации курсов
+@pytest.fixture
+def lock_path(tmp_path):
+    """Путь к файлу блокировки лидера."""
+    return str(tmp_path / "scheduler.lock")
+
+
+def page_html(banks):
+    """HTML страницы myfin с курсами банков banks (bank_en, usd_buy)."""
+    rows = "".join(
+        f'<tr><td class="bank_name"><a href="/bank/{bank_en}/currency">Банк {bank_en}</a></td>'
+        f'<td class="USD">{usd_buy}</td><td class="USD">80,5</td>'
+        f'<td class="EUR">88,1</td><td class="EUR">92,5</td><td><time>26.02.2026 19:04</time></td></tr>'
+        for bank_en, usd_buy in banks
+    )
+    return f'<table class="content_table"><tbody>{rows}</tbody></table>'
+
+
+def make_election(lock_path):
+    return LeaderElection(
+        FileLeaderLock(lock_path),
+        on_elected=AsyncMock(),
+        on_demoted=AsyncMock(),
+        interval=0.01,
+    )
+
+
+class TestLeaderElection:
+
+    async def test_single_leader(self, lock_path):
+        first, second = make_election(lock_path), make_election(lock_path)
+
+        assert await first.step() is True
+        assert await second.step() is False
+        assert await first.step() is True
+        first.on_elected.assert_awaited_once()
+        second.on_elected.assert_not_awaited()
+        await first.stop()
+
+    async def test_failover_after_release(self, lock_path):
+        first, second = make_election(lock_path), make_election(lock_path)
+        await first.step()
+        await second.step()
+
+        await first.stop()
+
+        assert await second.step() is True
+        first.on_demoted.assert_awaited_once()
+        second.on_elected.assert_awaited_once()
+        await second.stop()
+
+    async def test_lease_lost_when_lock_file_replaced(self, lock_path):
+        election = make_election(lock_path)
+        await election.step()
+
+        os.remove(lock_path)
+
+        assert await election.step() is False
+        election.on_demoted.assert_awaited_once()
+        await election.stop()
+
+
+class TestSyncWorker:
+
+    @pytest.fixture(autouse=True)
+    def leader_lock_path(self, tmp_path):
+        path = str(tmp_path / "scheduler.lock")
+        with patch("app.parser.__main__.create_leader_lock", lambda engine: FileLeaderLock(path)):
+            yield path
+
+    def test_sync_once(self):
+        snapshot = MagicMock(records=[], version=1)
+        with patch("app.parser.__main__.add_or_update_data_to_db", new_callable=AsyncMock) as mock_sync:
+            mock_sync.return_value = snapshot, SyncResult(added=3)
+            assert main(["sync", "--once"]) == 0
+            mock_sync.assert_awaited_once()
+
+    def test_sync_once_logs_result(self, caplog):
+        snapshot = MagicMock(records=[1, 2], version=7)
+        with patch("app.parser.__main__.add_or_update_data_to_db", new_callable=AsyncMock) as mock_sync:
+            mock_sync.return_value = snapshot, SyncResult(added=2)
+            assert main(["sync", "--once"]) == 0
+
+        assert logging.getLogger("app.parser.worker").isEnabledFor(logging.INFO)
+        assert [record.getMessage() for record in caplog.records if record.name == "app.parser.worker"] == [
+            "Синхронизация курсов завершена: банков 2, версия 7, изменилось 100%"
+        ]
+
+    def test_sync_once_failure(self):
+        with patch("app.parser.__main__.add_or_update_data_to_db", new_callable=AsyncMock) as mock_sync:
+            mock_sync.side_effect = RuntimeError("myfin недоступен")
+            assert main(["sync", "--once"]) == 1
+
+    async def test_sync_once_skipped_while_leader_runs(self, leader_lock_path):
+        leader = FileLeaderLock(leader_lock_path)
+        assert await leader.acquire()
+        try:
+            with patch("app.parser.__main__.add_or_update_data_to_db", new_callable=AsyncMock) as mock_sync:
+                assert await sync_once() == 2
+                mock_sync.assert_not_awaited()
+        finally:
+            await leader.release()
+
+    async def test_sync_once_releases_lock(self, leader_lock_path):
+        with patch("app.parser.__main__.add_or_update_data_to_db", new_callable=AsyncMock) as mock_sync:
+            mock_sync.side_effect = RuntimeError("myfin недоступен")
+            assert await sync_once() == 1
+
+        leader = FileLeaderLock(leader_lock_path)
+        assert await leader.acquire()
+        await leader.release()
+
+
+class TestFileSyncChannel:
+
+    async def test_new_version_is_event(self, tmp_path):
+        shared = SharedSnapshotFile(str(tmp_path / "rates.snapshot"))
+        channel = FileSyncChannel(shared, poll_seconds=0.01)
+        events = channel.listen()
+        next_event = asyncio.ensure_future(anext(events))
+
+        await asyncio.sleep(0.03)
+        assert not next_event.done()
+
+        shared.write(RateSnapshot([]))
+        assert await asyncio.wait_for(next_event, 1) == {"version": 1}
+        await events.aclose()
+
+
+class TestWarmStartup:
+
+    async def test_loads_shared_file_without_db(self, tmp_path):
+        shared = SharedSnapshotFile(str(tmp_path / "rates.snapshot"))
+        shared.write(RateSnapshot([]))
+        with patch("app.parser.scheduler.shared_snapshot_file", shared), \
+                patch("app.parser.scheduler.load_snapshot_from_db", new_callable=AsyncMock) as mock_load:
+            try:
+                snapshot = await load_last_snapshot()
+                assert rate_snapshot.current is snapshot
+                assert rate_snapshot.shared_version == 1
+                mock_load.assert_not_awaited()
+            finally:
+                rate_snapshot.clear()
+
+    async def test_falls_back_to_db(self, tmp_path):
+        shared = SharedSnapshotFile(str(tmp_path / "rates.snapshot"))
+        with patch("app.parser.scheduler.shared_snapshot_file", shared), \
+                patch("app.parser.scheduler.load_snapshot_from_db", new_callable=AsyncMock) as mock_load:
+            mock_load.return_value = RateSnapshot([])
+            await load_last_snapshot()
+
+            mock_load.assert_awaited_once_with(synced=False)
+
+    async def test_db_unavailable_does_not_fail_startup(self):
+        with patch("app.parser.scheduler.shared_snapshot_file", None), \
+                patch("app.parser.scheduler.load_snapshot_from_db", new_callable=AsyncMock) as mock_load:
+            mock_load.side_effect = ConnectionError("база недоступна")
+            assert await load_last_snapshot() is None
+
+
+class TestBestRatesViewRefresh:
+
+    async def sync(self, result: SyncResult):
+        with patch("app.parser.scheduler.sync_rates_to_db", new_callable=AsyncMock, return_value=(result, [])), \
+                patch("app.parser.scheduler.shared_snapshot_file", None), \
+                patch("app.parser.scheduler.sync_channel", None):
+            await add_or_update_data_to_db()
+
+    async def test_failed_refresh_retried_without_changes(self, monkeypatch):
+        monkeypatch.setattr(scheduler, "best_rates_view_stale", False)
+        try:
+            with patch("app.parser.scheduler.refresh_best_rates_view", new_callable=AsyncMock) as mock_refresh:
+                mock_refresh.side_effect = [RuntimeError("deadlock detected"), None]
+                await self.sync(SyncResult(updated=1))
+                assert scheduler.best_rates_view_stale
+
+                # курсы не изменились, но прошлый пересчет не удался
+                await self.sync(SyncResult(unchanged=1))
+                assert mock_refresh.await_count == 2
+                assert not scheduler.best_rates_view_stale
+
+                await self.sync(SyncResult(unchanged=1))
+                assert mock_refresh.await_count == 2
+        finally:
+            rate_snapshot.clear()
+
+
+class TestAdaptiveSyncPlanner:
+
+    @pytest.fixture
+    def now(self):
+        return datetime(2026, 3, 2, 12, 0, tzinfo=timezone.utc)
+
+    def make_planner(self, hot_pages=False):
+        return AdaptiveSyncPlanner(
+            (1, 2, 3, 4),
+            initial_interval=timedelta(minutes=10),
+            min_interval=timedelta(minutes=2),
+            max_interval=timedelta(minutes=30),
+            target_ratio=0.2,
+            hot_pages=hot_pages,
+        )
+
+    def test_frequent_changes_shorten_interval(self, now):
+        planner = self.make_planner()
+        for i in range(5):
+            planner.record({page: (20, 25) for page in (1, 2, 3, 4)}, now + timedelta(minutes=i))
+
+        assert planner.groups[0].interval == timedelta(minutes=2)
+        assert planner.next_run_at() == now + timedelta(minutes=6)
+
+    def test_quiet_period_grows_to_max(self, now):
+        planner = self.make_planner()
+        for i in range(5):
+            planner.record({page: (0, 25) for page in (1, 2, 3, 4)}, now + timedelta(minutes=i))
+
+        assert planner.groups[0].interval == timedelta(minutes=30)
+        assert planner.metrics()["requests_per_hour"] == 8.0
+
+    def test_hot_pages_polled_more_often(self, now):
+        planner = self.make_planner(hot_pages=True)
+        assert planner.due_pages(now) == (1, 2, 3, 4)
+        planner.record({1: (25, 25), 2: (0, 25), 3: (0, 25), 4: (0, 25)}, now)
+
+        assert planner.due_pages(now + timedelta(minutes=5)) == (1,)
+        # полная синхронизация не реже раза в max_interval
+        assert planner.due_pages(now + timedelta(minutes=30)) == (1, 2, 3, 4)
+
+    def test_failure_retries_after_min_interval(self, now):
+        planner = self.make_planner()
+        planner.record_failure((1, 2, 3, 4), now)
+
+        assert planner.next_run_at() == now + timedelta(minutes=2)
+        assert planner.groups[0].interval == timedelta(minutes=10)
+
+
+class TestSyncPipeline:
+
+    @pytest.fixture
+    def pages_html(self):
+        return {
+            "https://ru.myfin.by/currency": page_html([("sber", "74,3"), ("vtb", "75,0")]),
+            "https://ru.myfin.by/currency?page=2": page_html([("alfa", "74,5")]),
+            "https://ru.myfin.by/currency?page=3": page_html([("tbank", "76,2")]),
+            "https://ru.myfin.by/currency?page=4": page_html([]),
+        }
+
+    async def test_full_sync_reconciles(self, db_session, pages_html):
+        with patch("app.parser.pipeline.fetch_html", new_callable=AsyncMock) as mock_fetch:
+            mock_fetch.side_effect = lambda url, session: pages_html[url]
+            await run_sync_pipeline(db_session, batch_size=1)
+            mock_fetch.side_effect = lambda url, session: pages_html[url].replace("vtb", "gpb")
+            result = await run_sync_pipeline(db_session, batch_size=1)
+
+        assert (result.added, result.unchanged, result.deleted) == (1, 3, 1)
+        assert result.page_banks[1] == {"sber", "gpb"} and result.page_banks[4] == set()
+        assert {row.bank_en for row in await CurrencyRateDAO.find_all(session=db_session)} == {"sber", "gpb", "alfa", "tbank"}
+
+    async def test_partial_sync_keeps_other_pages(self, db_session, pages_html):
+        with patch("app.parser.pipeline.fetch_html", new_callable=AsyncMock) as mock_fetch:
+            mock_fetch.side_effect = lambda url, session: pages_html[url]
+            await run_sync_pipeline(db_session)
+            result = await run_sync_pipeline(db_session, pages=(2,))
+
+        assert result.deleted == 0
+        assert len(await CurrencyRateDAO.find_all(session=db_session)) == 4
+
+    async def test_transaction_starts_after_fetch(self, db_session, pages_html):
+        fetched = []
+
+        async def fetch(url, session):
+            fetched.append(url)
+            return pages_html[url]
+
+        async def start(*args, **kwargs):
+            # транзакция открывается только после загрузки всех страниц
+            assert len(fetched) == len(pages_html)
+            return await start_sync(*args, **kwargs)
+
+        start_sync = CurrencyRateDAO.start_currency_sync
+        with patch("app.parser.pipeline.fetch_html", side_effect=fetch), \
+                patch.object(CurrencyRateDAO, "start_currency_sync", side_effect=start) as mock_start:
+            result = await run_sync_pipeline(db_session, batch_size=1)
+
+        mock_start.assert_awaited_once()
+        assert result.added == 4
+        assert result.page_banks[1] == {"sber", "vtb"}
+
+    async def test_fetch_error_leaves_db_untouched(self, db_session):
+        with patch("app.parser.pipeline.fetch_html", new_callable=AsyncMock) as mock_fetch, \
+                patch.object(CurrencyRateDAO, "start_currency_sync", new_callable=AsyncMock) as mock_start:
+            mock_fetch.side_effect = ConnectionError("myfin недоступен")
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(run_sync_pipeline(db_session), 2)
+
+        mock_start.assert_not_awaited()
+
+    async def test_stage_error_cancels_pipeline(self, db_session):
+        with patch("app.parser.pipeline.fetch_html", new_callable=AsyncMock) as mock_fetch:
+            mock_fetch.side_effect = ConnectionError("myfin недоступен")
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(run_sync_pipeline(db_session), 2)
+
+
+class TestRawCurrencyRate:
+
+    def test_parser_returns_tuples(self):
+        records = parse_currency_table(page_html([("sber", "74,3")]))
+
+        assert records == [RawCurrencyRate(
+            link="https://ru.myfin.by/bank/sber/currency", bank_en="sber", bank_name="Банк sber",
+            usd_buy=74.3, usd_sell=80.5, eur_buy=88.1, eur_sell=92.5, update_time="26.02.2026 19:04",
+            quoted_at=datetime(2026, 2, 26, 16, 4, tzinfo=timezone.utc),
+        )]
+
+    def test_batch_validation_skips_invalid(self):
+        valid = parse_currency_table(page_html([("sber", "74,3"), ("vtb", "75,0")]))
+        invalid = valid[1]._replace(usd_buy="нет курса")
+        coerced = valid[0]._replace(usd_sell="80.5")
+
+        assert validate_raw_rates([coerced, invalid]) == [valid[0]]
+
+
+class TestParseUpdateTime:
+
+    def test_moscow_time_to_utc(self):
+        assert parse_update_time("26.02.2026 19:04") == datetime(2026, 2, 26, 16, 4, tzinfo=timezone.utc)
+
+    def test_time_only_is_today(self):
+        now = datetime(2026, 2, 26, 12, 0, tzinfo=timezone.utc)  # 15:00 по Москве
+
+        assert parse_update_time("14:30", now=now) == datetime(2026, 2, 26, 11, 30, tzinfo=timezone.utc)
+        assert parse_update_time("23:50", now=now) == datetime(2026, 2, 25, 20, 50, tzinfo=timezone.utc)
+
+    def test_unknown_format(self):
+        assert parse_update_time("вчера") is None